@@ -444,4 +444,17 @@ class InquirySourceSecondaryAdmin(admin.ModelAdmin):
         (None, {
             'fields': ('name', 'inquiry_source_primary_id', 'company_id', 'is_active')
         }),
-    )
\ No newline at end of file
+    )
+
+@admin.register(SyncState)
+class SyncStateAdmin(admin.ModelAdmin):
+    list_display = ('endpoint', 'status', 'pagination', 'pages_done', 'records_written', 'next_skip', 'last_update', 'started_at', 'updated_at')
+    list_filter = ('status', 'pagination')
+    readonly_fields = ('run_id', 'started_at', 'updated_at')
+
+
+@admin.register(PageFingerprint)
+class PageFingerprintAdmin(admin.ModelAdmin):
+    list_display = ('endpoint', 'skip', 'entries', 'digest', 'updated_at')
+    list_filter = ('endpoint',)
+    ordering = ('endpoint', 'skip')
@@ -1,14 +1,17 @@
-from typing import List, Dict, Any, Tuple, Optional, Set
-from django.db import transaction
+from typing import List, Dict, Any, Tuple, Optional, Set, AsyncIterator, Callable
+from django.db import close_old_connections, transaction
 from asgiref.sync import sync_to_async
 from uuid import UUID
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from dateutil.parser import parse as parse_date
 import logging
 from enum import Enum
 from dataclasses import dataclass
 from functools import lru_cache
 
+from data_import.copy_loader import CopyLoader, copy_supported
+from data_import.upsert import Upserter
+
 class FieldType(Enum):
     UUID = 'uuid'
     DATETIME = 'datetime'
@@ -18,6 +21,64 @@ class FieldType(Enum):
     DECIMAL = 'decimal'
     STRING = 'string'
 
+# Lengths of OData Edm.DateTime values that datetime.fromisoformat reads directly:
+# seconds, milliseconds and microseconds precision
+ISO_DATETIME_LENGTHS = frozenset((19, 23, 26))
+# WCF Data Services emits up to 7 fractional digits (100ns ticks)
+ISO_DATETIME_TICKS_LENGTH = 27
+
+def convert_uuid(value: str) -> Optional[UUID]:
+    if not value:
+        return None
+    try:
+        return UUID(value)
+    except ValueError:
+        return None
+
+def convert_datetime(value: str) -> Optional[datetime]:
+    """Parse an OData timestamp as an aware UTC datetime, using dateutil only for unusual shapes."""
+    if not value:
+        return None
+    parsed = None
+    if value[10:11] == 'T':
+        if len(value) in ISO_DATETIME_LENGTHS:
+            iso_value = value
+        elif len(value) == ISO_DATETIME_TICKS_LENGTH and value[19] == '.':
+            iso_value = value[:26]
+        else:
+            iso_value = None
+        if iso_value:
+            try:
+                parsed = datetime.fromisoformat(iso_value)
+            except ValueError:
+                parsed = None
+    if parsed is None:
+        parsed = parse_date(value)
+    # MarketSharp timestamps are UTC; make them aware so Django doesn't warn on save
+    return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None else parsed
+
+def convert_boolean(value: str) -> bool:
+    return value.lower() == 'true' if value else False
+
+def convert_int(value: str) -> Optional[int]:
+    return int(value) if value else None
+
+def convert_float(value: str) -> Optional[float]:
+    return float(value) if value else None
+
+def convert_string(value: str) -> str:
+    return value or ''
+
+CONVERTERS = {
+    FieldType.UUID: convert_uuid,
+    FieldType.DATETIME: convert_datetime,
+    FieldType.BOOLEAN: convert_boolean,
+    FieldType.INTEGER: convert_int,
+    FieldType.FLOAT: convert_float,
+    FieldType.DECIMAL: convert_float,
+    FieldType.STRING: convert_string,
+}
+
 @dataclass
 class ProcessingResult:
     total_processed: int = 0
@@ -29,6 +90,20 @@ class ProcessingResult:
         if self.errors is None:
             self.errors = []
 
+@dataclass
+class WriteStats:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+    def add(self, other: 'WriteStats'):
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+
+    def __str__(self) -> str:
+        return f"inserted {self.inserted}, updated {self.updated}, unchanged {self.unchanged}"
+
 @dataclass
 class FieldMapping:
     xml_field: str
@@ -41,13 +116,141 @@ class FieldMapping:
     def __post_init__(self):
         if isinstance(self.field_type, str):
             self.field_type = FieldType(self.field_type)
+        # Bound once, when the processor class body builds its mappings
+        self.converter = CONVERTERS[self.field_type]
         if self.required and self.default is not None:
             raise ValueError(f"Field {self.model_field} cannot be both required and have a default value")
 
+DATA_NAMESPACE = '{http://schemas.microsoft.com/ado/2007/08/dataservices}'
+LAST_UPDATE_COLUMN = 'last_update'
+NULL_ATTRIBUTE = '{http://schemas.microsoft.com/ado/2007/08/dataservices/metadata}null'
+
+# OData v2 verbose JSON writes Edm.DateTime as "\/Date(<ms since epoch>[+-offset])\/"
+JSON_DATE_PREFIX = '/Date('
+EPOCH = datetime(1970, 1, 1)
+
+def json_datetime_text(value: str) -> str:
+    """Rewrite a JSON /Date(ms)/ value as the ISO text Atom feeds carry; other text is kept.
+
+    A malformed /Date(...)/ is kept too, so the field's converter rejects it
+    and only that field is dropped, the same as a bad timestamp in Atom.
+    """
+    if not value.startswith(JSON_DATE_PREFIX):
+        return value
+    ticks = value[len(JSON_DATE_PREFIX):value.find(')')]
+    # The offset, if any, is informational: the milliseconds are already UTC
+    for sign in '+-':
+        cut = ticks.find(sign, 1)
+        if cut != -1:
+            ticks = ticks[:cut]
+    try:
+        return (EPOCH + timedelta(milliseconds=int(ticks))).isoformat()
+    except (ValueError, OverflowError):
+        return value
+
+def json_text(value: Any) -> Optional[str]:
+    """Render a JSON scalar the way the Atom feed would have written it."""
+    if value is None or isinstance(value, (dict, list)):
+        # Deferred navigation links and complex values are never mapped
+        return None
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    return value if isinstance(value, str) else str(value)
+
+class FieldExtractor:
+    """Field mappings compiled into a Clark-notation tag dispatch table.
+
+    extract() walks the children of an m:properties element exactly once and
+    resolves m:null in the same pass, instead of one find() per mapping.
+    """
+
+    def __init__(self, field_mappings: Dict[str, FieldMapping]):
+        self.field_mappings = field_mappings
+        self.items = tuple(field_mappings.items())
+        # Row tuples produced from these mappings hold one value per column, in this order
+        self.columns = tuple(mapping.model_field for mapping in field_mappings.values())
+        self.pk_index = next(
+            (index for index, mapping in enumerate(field_mappings.values()) if mapping.is_primary_key),
+            None
+        )
+        # Rows that carry last_update are compared on it before any other column
+        self.last_update_index = (
+            self.columns.index(LAST_UPDATE_COLUMN) if LAST_UPDATE_COLUMN in self.columns else None
+        )
+        tags: Dict[str, List[str]] = {}
+        for key, mapping in field_mappings.items():
+            tags.setdefault(f'{DATA_NAMESPACE}{mapping.xml_field}', []).append(key)
+        self.tags = {tag: tuple(keys) for tag, keys in tags.items()}
+
+    def extract(self, properties) -> Dict[str, Optional[str]]:
+        """Return the raw text of every mapped field present, keyed by mapping key."""
+        values = {}
+        tags = self.tags
+        for child in properties:
+            keys = tags.get(child.tag)
+            if keys is None:
+                continue
+            text = None if child.get(NULL_ATTRIBUTE) == 'true' else child.text
+            for key in keys:
+                values[key] = text
+        return values
+
+class JsonFieldExtractor(FieldExtractor):
+    """The same compiled mappings applied to OData JSON entities instead of m:properties.
+
+    Values are turned back into the text Atom would have carried, so the
+    FieldMapping converters, defaults and required checks are shared as-is.
+    """
+
+    def __init__(self, field_mappings: Dict[str, FieldMapping]):
+        super().__init__(field_mappings)
+        self.properties = tuple(
+            (mapping.xml_field, key, mapping.field_type == FieldType.DATETIME)
+            for key, mapping in field_mappings.items()
+        )
+
+    def extract(self, entity: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        values = {}
+        for name, key, is_datetime in self.properties:
+            if name not in entity:
+                continue
+            text = json_text(entity[name])
+            if is_datetime and text:
+                text = json_datetime_text(text)
+            values[key] = text
+        return values
+
+# Feed formats a page can be requested in: Atom XML, or OData verbose JSON
+RESPONSE_FORMATS = ('atom', 'json')
+
+# Ways a page can be written: a single-statement bulk_create upsert, the older
+# existing-id lookup followed by bulk_create/bulk_update, or COPY into a staging
+# table merged with INSERT ... ON CONFLICT (PostgreSQL only)
+WRITE_BACKENDS = ('upsert', 'orm', 'copy')
+
 class BaseProcessor:
+    model = None
+    field_mappings: Dict[str, FieldMapping] = {}
+    extractor = FieldExtractor(field_mappings)
+    json_extractor = JsonFieldExtractor(field_mappings)
+    write_backend = 'upsert'
+    response_format = 'atom'
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Compile the subclass's mappings once, at class definition time
+        cls.extractor = FieldExtractor(cls.field_mappings)
+        cls.json_extractor = JsonFieldExtractor(cls.field_mappings)
+
     def __init__(self, logger: logging.Logger, data_processor):
         self.logger = logger
         self.data_processor = data_processor
+        self._copy_loaders: Dict[Tuple[Any, Tuple[str, ...]], CopyLoader] = {}
+        self._upserters: Dict[Tuple[Any, Tuple[str, ...]], Upserter] = {}
+        self._warned_copy_fallback = False
+        self.write_stats = WriteStats()
 
     @staticmethod
     def is_valid_uuid(val: str) -> bool:
@@ -59,156 +262,337 @@ class BaseProcessor:
         except (ValueError, AttributeError):
             return False
 
-    def parse_value(self, value: str, field_type: FieldType, field_name: str) -> Any:
-        """Parse field value with enhanced type handling and validation."""
-        if value is None:
-            return None
-            
-        try:
-            if field_type == FieldType.UUID:
-                return UUID(value) if self.is_valid_uuid(value) else None
-            elif field_type == FieldType.DATETIME:
-                return parse_date(value) if value else None
-            elif field_type == FieldType.BOOLEAN:
-                return value.lower() == 'true' if value else False
-            elif field_type == FieldType.INTEGER:
-                return int(value) if value else None
-            elif field_type == FieldType.FLOAT:
-                return float(value) if value else None
-            elif field_type == FieldType.DECIMAL:
-                return float(value) if value else None
-            elif field_type == FieldType.STRING:
-                return value or ''
-            return value
-        except Exception as e:
-            self.logger.warning(f"Failed to parse {field_name} ({field_type.value}): {str(e)}")
-            return None
-
     @lru_cache(maxsize=100)
     def get_model_fields(self, model) -> Set[str]:
         """Cache model fields to improve performance."""
         return {field.name for field in model._meta.fields if not field.primary_key}
 
-    def extract_data(self, properties, field_mappings: Dict[str, FieldMapping]) -> Dict[str, Any]:
-        """Extract and validate data from XML properties."""
+    def extractor_for(self, field_mappings: Dict[str, FieldMapping], response_format: str = 'atom') -> FieldExtractor:
+        """Return the compiled extractor for field_mappings, reusing the class one when possible."""
+        if response_format == 'json':
+            if field_mappings is self.field_mappings:
+                return self.json_extractor
+            return JsonFieldExtractor(field_mappings)
+        if field_mappings is self.field_mappings:
+            return self.extractor
+        return FieldExtractor(field_mappings)
+
+    def extract_row(self, properties, extractor: FieldExtractor) -> Optional[Tuple[Any, ...]]:
+        """Extract and validate one entry as a tuple aligned with extractor.columns."""
         if properties is None:
             self.logger.error("No properties found in XML")
-            return {}
+            return None
 
-        data = {}
+        values = extractor.extract(properties)
+        row = []
         has_required_fields = True
 
-        for key, mapping in field_mappings.items():
-            value = self.data_processor.get_xml_text(properties, mapping.xml_field)
-            parsed_value = self.parse_value(value, mapping.field_type, key)
+        for key, mapping in extractor.items:
+            value = values.get(key)
+            if value is None:
+                parsed_value = None
+            else:
+                try:
+                    parsed_value = mapping.converter(value)
+                except Exception as e:
+                    self.logger.warning(f"Failed to parse {key} ({mapping.field_type.value}): {str(e)}")
+                    parsed_value = None
 
             if mapping.required and parsed_value is None:
                 self.logger.error(f"Missing required field: {key}")
                 has_required_fields = False
                 continue
 
-            data[mapping.model_field] = parsed_value if parsed_value is not None else mapping.default
+            row.append(parsed_value if parsed_value is not None else mapping.default)
+
+        return tuple(row) if has_required_fields else None
+
+    @classmethod
+    def supports_keyset(cls) -> bool:
+        """Whether the endpoint can be paged by (lastUpdate, id) instead of $skip."""
+        return cls.extractor.pk_index is not None and any(
+            mapping.xml_field == 'lastUpdate' for mapping in cls.field_mappings.values()
+        )
+
+    @classmethod
+    def pk_is_guid(cls) -> bool:
+        pk_mapping = cls.get_pk_mapping(cls.field_mappings)
+        return pk_mapping is not None and pk_mapping.field_type == FieldType.UUID
+
+    @staticmethod
+    def get_pk_mapping(field_mappings: Dict[str, FieldMapping]) -> Optional[FieldMapping]:
+        """Return the primary key mapping, if the model has one."""
+        return next(
+            (mapping for mapping in field_mappings.values() if mapping.is_primary_key),
+            None
+        )
+
+    def collect_records(
+        self,
+        properties_iter,
+        field_mappings: Dict[str, FieldMapping],
+        result: ProcessingResult,
+        response_format: str = 'atom'
+    ) -> List[Tuple[Any, ...]]:
+        """Extract row tuples from m:properties elements or JSON entities, counting failures in result."""
+        extractor = self.extractor_for(field_mappings, response_format)
+        pk_index = extractor.pk_index
+        rows = []
+
+        for properties in properties_iter:
+            result.total_processed += 1
+            row = self.extract_row(properties, extractor)
+
+            if not row or (pk_index is not None and not row[pk_index]):
+                result.failed += 1
+                continue
+            rows.append(row)
 
-        return data if has_required_fields else {}
+        return rows
 
-    async def process_entries(
+    async def write_records(
         self,
-        entries: List[Any],
+        rows: List[Tuple[Any, ...]],
         model,
         field_mappings: Dict[str, FieldMapping],
-        batch_size: int
+        batch_size: int,
+        backend: Optional[str] = None,
+        after_write: Optional[Callable[[], None]] = None,
+        before_write: Optional[Callable[[], None]] = None
     ) -> int:
-        """Process entries with support for models with or without primary keys."""
-        result = ProcessingResult(
-            total_processed=len(entries),
-            successful=0,
-            failed=0,
-            errors=[]
+        """Write row tuples in one transaction with the given or the processor's write backend.
+
+        after_write, if given, runs inside that transaction once the rows are
+        written, so whatever it saves commits or rolls back together with them.
+        before_write runs in the same transaction before the rows are written.
+        """
+        if not rows and after_write is None and before_write is None:
+            return 0
+
+        extractor = self.extractor_for(field_mappings)
+        # Not thread-sensitive, so pages of different endpoints can be written
+        # concurrently, each worker thread on its own connection
+        return await sync_to_async(self._write_rows_in_worker, thread_sensitive=False)(
+            rows, model, extractor, batch_size, self.resolve_backend(backend), after_write, before_write
         )
 
-        try:
-            # Find primary key mapping if it exists
-            pk_mapping = next(
-                (mapping for mapping in field_mappings.values() if mapping.is_primary_key),
-                None
-            )
-            
-            valid_records = []
-            record_ids = []
-
-            # Process entries in chunks for better memory management
-            for i in range(0, len(entries), batch_size):
-                chunk = entries[i:i + batch_size]
-                for entry in chunk:
-                    properties = entry.find('.//m:properties', namespaces=self.data_processor.nsmap)
-                    data = self.extract_data(properties, field_mappings)
-                    
-                    if data:
-                        if pk_mapping:
-                            pk_value = data.get(pk_mapping.model_field)
-                            if pk_value:
-                                valid_records.append((pk_value, data))
-                                record_ids.append(pk_value)
-                            else:
-                                result.failed += 1
-                        else:
-                            # For models without primary key, just store the data
-                            valid_records.append((None, data))
-                    else:
-                        result.failed += 1
-
-            if not valid_records:
-                return result.successful
-
-            # Handle records based on whether we have primary keys
-            if pk_mapping:
-                # Fetch existing records
-                existing_records = await sync_to_async(lambda: set(
-                    model.objects.filter(id__in=record_ids).values_list('id', flat=True)
-                ))()
-
-                # Prepare records for database operations
-                records_to_insert = []
-                records_to_update = []
-
-                for pk_value, data in valid_records:
-                    if pk_value in existing_records:
-                        records_to_update.append(model(**data))
-                    else:
-                        records_to_insert.append(model(**data))
+    def _write_rows_in_worker(self, *args) -> int:
+        # Worker threads outlive any one request; drop connections past CONN_MAX_AGE or broken
+        close_old_connections()
+        return self.write_rows(*args)
+
+    def write_rows(
+        self,
+        rows: List[Tuple[Any, ...]],
+        model,
+        extractor: FieldExtractor,
+        batch_size: int,
+        backend: str,
+        after_write: Optional[Callable[[], None]] = None,
+        before_write: Optional[Callable[[], None]] = None
+    ) -> int:
+        """Synchronous half of write_records, for callers already off the event loop."""
+        if after_write is not None or before_write is not None:
+            with transaction.atomic():
+                if before_write is not None:
+                    before_write()
+                written = self.write_rows(rows, model, extractor, batch_size, backend) if rows else 0
+                if after_write is not None:
+                    after_write()
+            return written
+
+        pk_index = extractor.pk_index
+        if pk_index is not None:
+            # A key may appear twice in a page; keep its last row, since an
+            # upsert cannot touch the same row twice in one statement
+            rows = list({row[pk_index]: row for row in rows}.values())
+
+        if backend == 'copy':
+            stats = self.copy_records(rows, model, extractor)
+        elif backend == 'upsert':
+            stats = self.upsert_records(rows, model, extractor, batch_size)
+        else:
+            stats = self.split_records(rows, model, extractor, batch_size)
+        self.write_stats.add(stats)
+        return len(rows)
+
+    def resolve_backend(self, backend: Optional[str] = None) -> str:
+        """Pick the write backend, falling back to an ORM upsert where COPY isn't available."""
+        backend = backend or self.write_backend
+        if backend == 'copy' and not copy_supported():
+            if not self._warned_copy_fallback:
+                self.logger.warning(f"COPY writes need PostgreSQL; upserting {self.model.__name__} through the ORM")
+                self._warned_copy_fallback = True
+            return 'upsert'
+        return backend
+
+    @lru_cache(maxsize=100)
+    def get_column_normalizers(self, model, columns: Tuple[str, ...]) -> Tuple[Tuple[int, Any], ...]:
+        """to_python for columns whose stored type differs from the converted value (floats into decimals)."""
+        return tuple(
+            (index, model._meta.get_field(column).to_python)
+            for index, column in enumerate(columns)
+            if model._meta.get_field(column).get_internal_type() == 'DecimalField'
+        )
+
+    def diff_rows(
+        self,
+        rows: List[Tuple[Any, ...]],
+        model,
+        extractor: FieldExtractor
+    ) -> Tuple[List[Tuple[Any, ...]], List[Tuple[Any, ...]], Tuple[str, ...], int]:
+        """Compare rows with the stored ones.
+
+        Returns the new rows, the changed rows, the columns that differ in any
+        of them and the number of unchanged rows. Where both sides have a
+        last_update only a newer row counts as changed, so a stale copy of a
+        row can't overwrite a fresher one; otherwise every column is compared.
+        """
+        columns = extractor.columns
+        pk_index = extractor.pk_index
+        last_update_index = extractor.last_update_index
+        normalizers = self.get_column_normalizers(model, columns)
+
+        stored = {
+            values[pk_index]: values
+            for values in model.objects.filter(
+                **{f'{columns[pk_index]}__in': [row[pk_index] for row in rows]}
+            ).values_list(*columns)
+        }
+
+        new_rows = []
+        changed = []
+        changed_indexes = set()
+        unchanged = 0
+        for row in rows:
+            old = stored.get(row[pk_index])
+            if old is None:
+                new_rows.append(row)
+                continue
+            if last_update_index is not None and row[last_update_index] is not None \
+                    and old[last_update_index] is not None and row[last_update_index] <= old[last_update_index]:
+                unchanged += 1
+                continue
+            values = list(row)
+            for index, to_python in normalizers:
+                values[index] = to_python(values[index])
+            differing = [index for index, (value, old_value) in enumerate(zip(values, old)) if value != old_value]
+            if differing:
+                changed.append(row)
+                changed_indexes.update(differing)
             else:
-                # For models without primary key, all records are new insertions
-                records_to_insert = [model(**data) for _, data in valid_records]
-                records_to_update = []
+                unchanged += 1
+        changed_columns = tuple(column for index, column in enumerate(columns) if index in changed_indexes)
+        return new_rows, changed, changed_columns, unchanged
 
-            # Perform database operations
-            await self.bulk_operations(model, records_to_insert, records_to_update, batch_size)
-            result.successful = len(valid_records)
+    def copy_records(self, rows: List[Tuple[Any, ...]], model, extractor: FieldExtractor) -> WriteStats:
+        """Stream rows into a staging table with COPY and merge them into the model's table."""
+        key = (model, extractor.columns)
+        loader = self._copy_loaders.get(key)
+        if loader is None:
+            loader = CopyLoader(model, extractor.columns, extractor.pk_index, extractor.last_update_index)
+            self._copy_loaders[key] = loader
+        inserted, updated = loader.write(rows)
+        stats = WriteStats(inserted, updated, len(rows) - inserted - updated)
+        self.logger.info(f"Copied {len(rows)} records into {model._meta.db_table}: {stats}")
+        return stats
 
-        except Exception as e:
-            self.logger.error(f"Error processing entries: {str(e)}", exc_info=True)
-            result.errors.append(str(e))
-            raise
+    def upsert_records(
+        self,
+        rows: List[Tuple[Any, ...]],
+        model,
+        extractor: FieldExtractor,
+        batch_size: int
+    ) -> WriteStats:
+        """Upsert rows with INSERT ... ON CONFLICT, letting the database skip the unchanged ones."""
+        columns = extractor.columns
+
+        with transaction.atomic():
+            if extractor.pk_index is None:
+                model.objects.bulk_create(
+                    [model(**dict(zip(columns, row))) for row in rows],
+                    batch_size=batch_size
+                )
+                return WriteStats(inserted=len(rows))
+
+            key = (model, columns)
+            upserter = self._upserters.get(key)
+            if upserter is None:
+                upserter = Upserter(model, columns, extractor.pk_index, extractor.last_update_index)
+                self._upserters[key] = upserter
+            inserted, updated = upserter.write(rows, batch_size)
 
-        return result.successful
+        stats = WriteStats(inserted, updated, len(rows) - inserted - updated)
+        self.logger.info(f"Upserted {len(rows)} records: {stats}")
+        return stats
+
+    def split_records(
+        self,
+        rows: List[Tuple[Any, ...]],
+        model,
+        extractor: FieldExtractor,
+        batch_size: int
+    ) -> WriteStats:
+        """bulk_create the new rows and bulk_update the changed columns of the changed ones."""
+        columns = extractor.columns
 
-    @sync_to_async
-    def bulk_operations(self, model, records_to_insert, records_to_update, batch_size):
-        """Perform bulk database operations with improved error handling."""
         with transaction.atomic():
-            if records_to_insert:
-                self.logger.info(f"Inserting {len(records_to_insert)} new records")
+            if extractor.pk_index is None:
+                # For models without primary key, all records are new insertions
                 model.objects.bulk_create(
-                    records_to_insert,
+                    [model(**dict(zip(columns, row))) for row in rows],
+                    batch_size=batch_size
+                )
+                return WriteStats(inserted=len(rows))
+
+            new_rows, changed, changed_columns, unchanged = self.diff_rows(rows, model, extractor)
+            if new_rows:
+                model.objects.bulk_create(
+                    [model(**dict(zip(columns, row))) for row in new_rows],
                     batch_size=batch_size,
                     ignore_conflicts=True
                 )
-
-            if records_to_update:
-                self.logger.info(f"Updating {len(records_to_update)} existing records")
-                fields_to_update = list(self.get_model_fields(model))
+            if changed:
+                # One statement for the page, over the columns that changed in any of its rows
                 model.objects.bulk_update(
-                    records_to_update,
-                    fields=fields_to_update,
+                    [model(**dict(zip(columns, row))) for row in changed],
+                    fields=list(changed_columns),
                     batch_size=batch_size
-                )
\ No newline at end of file
+                )
+
+        stats = WriteStats(len(new_rows), len(changed), unchanged)
+        self.logger.info(f"Wrote {len(rows)} records: {stats}")
+        return stats
+
+    def parse_page(self, xml_data: bytes, response_format: str = 'atom') -> Tuple[List[Tuple[Any, ...]], ProcessingResult]:
+        """Parse a buffered page into row tuples without touching the database."""
+        result = ProcessingResult()
+        if response_format == 'json':
+            entities = self.data_processor.parse_json(xml_data)
+            return self.collect_records(entities, self.field_mappings, result, response_format), result
+        entries = self.data_processor.parse_xml(xml_data)
+        properties_iter = (
+            entry.find('.//m:properties', namespaces=self.data_processor.nsmap)
+            for entry in entries
+        )
+        return self.collect_records(properties_iter, self.field_mappings, result), result
+
+    async def parse_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        parser=None
+    ) -> Tuple[List[Tuple[Any, ...]], ProcessingResult]:
+        """Parse a page incrementally from raw response chunks.
+
+        Each m:properties element is extracted as soon as it is complete and
+        cleared right after, so only one entry's tree is alive at a time.
+        """
+        result = ProcessingResult()
+        parser = parser or self.data_processor.stream_parser()
+        rows = []
+        async for chunk in chunks:
+            rows.extend(
+                self.collect_records(parser.feed(chunk), self.field_mappings, result)
+            )
+        rows.extend(self.collect_records(parser.close(), self.field_mappings, result))
+        return rows, result
@@ -0,0 +1,225 @@
+import hashlib
+import re
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Dict, Optional, Sequence, Set, Tuple
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from data_import.marketsharp_api import PageCursor
+from data_import.models import PageFingerprint, SyncState
+
+# Atom feeds stamp the feed and every entry with the time of the request
+ATOM_UPDATED = re.compile(rb'<updated>[^<]*</updated>')
+
+
+def page_fingerprint(data: bytes) -> str:
+    """SHA-256 of a raw page without its <updated> stamps, so the same rows hash the same on every run."""
+    return hashlib.sha256(ATOM_UPDATED.sub(b'', data)).hexdigest()
+
+
+class EndpointCheckpoint:
+    """Persists how far one endpoint's import has committed, for import_data --resume.
+
+    Pages are identified by their offset (skip) in the feed, also in keyset
+    mode where each page's offset is its index times the page size. Pages
+    may be written out of order, so the checkpoint keeps the frontier below
+    which every page is committed plus the committed offsets beyond it; in
+    keyset mode it keeps the cursor after the frontier instead, since the
+    pages after it can only be reached by following that cursor.
+
+    page_committed() is called inside the transaction that writes a page, so
+    the saved state can never disagree with the rows in the table. The
+    in-memory copy only moves on once that transaction commits. The same
+    update raises the endpoint's last_update watermark to the newest row in
+    the page, which is what the next run starts from instead of scanning the
+    table for MAX(last_update).
+    """
+
+    def __init__(
+        self,
+        state: SyncState,
+        page_size: int,
+        id_is_guid: bool = True,
+        last_update_index: Optional[int] = None,
+    ):
+        self.state = state
+        self.resumed = False
+        self.page_size = page_size
+        self.id_is_guid = id_is_guid
+        self.last_update_index = last_update_index
+        self.next_skip = state.next_skip
+        self.done_skips: Set[int] = set(state.done_skips) if state.pagination == 'skip' else set()
+        self.cursor = self._saved_cursor()
+        # Keyset only: cursor after each committed page the frontier hasn't reached yet
+        self._cursors_after: Dict[int, Any] = {}
+
+    def _saved_cursor(self) -> Optional[PageCursor]:
+        if self.state.cursor_last_update is None:
+            return None
+        return PageCursor(self.state.cursor_last_update, self.state.cursor_id, self.id_is_guid)
+
+    @staticmethod
+    def load(endpoint: str) -> Optional[SyncState]:
+        return SyncState.objects.filter(endpoint=endpoint).first()
+
+    @staticmethod
+    def resume_point(state: SyncState) -> Optional[datetime]:
+        """The lastUpdate a new run of the endpoint can safely start after.
+
+        A completed run committed everything up to its watermark. An
+        unfinished one may have committed later pages before earlier ones,
+        so the next run starts again from where that run started.
+        """
+        if state.status == SyncState.STATUS_COMPLETED:
+            return state.last_update or state.watermark
+        return state.watermark
+
+    @staticmethod
+    def set_last_update(endpoint: str, last_update: datetime):
+        """Set the watermark of the endpoint's completed run, for endpoints that take it from elsewhere than their rows."""
+        SyncState.objects.filter(endpoint=endpoint, status=SyncState.STATUS_COMPLETED).update(last_update=last_update)
+
+    @classmethod
+    def start(
+        cls,
+        endpoint: str,
+        pagination: str,
+        watermark: Optional[datetime],
+        page_size: int,
+        start_cursor: Optional[PageCursor] = None,
+        id_is_guid: bool = True,
+        last_update_index: Optional[int] = None,
+    ) -> 'EndpointCheckpoint':
+        """Record a new run of endpoint from the beginning of its feed, replacing any earlier state.
+
+        The last_update watermark carries over from the earlier state, or is
+        seeded from the run's own starting point the first time.
+        """
+        previous = SyncState.objects.filter(endpoint=endpoint).values_list('last_update', flat=True).first()
+        if watermark and watermark.tzinfo is None:
+            watermark = watermark.replace(tzinfo=dt_timezone.utc)
+        state = SyncState(
+            endpoint=endpoint,
+            run_id=uuid.uuid4(),
+            status=SyncState.STATUS_RUNNING,
+            pagination=pagination,
+            watermark=watermark or None,
+            cursor_last_update=start_cursor.last_update if start_cursor else None,
+            cursor_id=start_cursor.id if start_cursor else None,
+            last_update=previous or watermark or None,
+            started_at=timezone.now(),
+        )
+        state.save()
+        return cls(state, page_size, id_is_guid, last_update_index)
+
+    @classmethod
+    def resume(
+        cls,
+        state: SyncState,
+        page_size: int,
+        id_is_guid: bool = True,
+        last_update_index: Optional[int] = None,
+    ) -> 'EndpointCheckpoint':
+        state.status = SyncState.STATUS_RUNNING
+        state.save(update_fields=['status', 'updated_at'])
+        checkpoint = cls(state, page_size, id_is_guid, last_update_index)
+        checkpoint.resumed = True
+        return checkpoint
+
+    def page_committed(self, skip: int, cursor_after: Any = None, rows: Sequence[Tuple[Any, ...]] = ()):
+        """Save the checkpoint with the page at skip committed. Call inside the page's write transaction."""
+        done = self.done_skips | {skip}
+        cursors = dict(self._cursors_after)
+        if cursor_after is not None:
+            cursors[skip] = cursor_after
+        next_skip = self.next_skip
+        cursor = self.cursor
+        while next_skip in done:
+            done.discard(next_skip)
+            cursor = cursors.pop(next_skip, cursor)
+            next_skip += self.page_size
+
+        changes = dict(
+            next_skip=next_skip,
+            done_skips=sorted(done) if self.state.pagination == 'skip' else [],
+            cursor_last_update=cursor.last_update if cursor else None,
+            cursor_id=cursor.id if cursor else None,
+            pages_done=F('pages_done') + 1,
+            records_written=F('records_written') + len(rows),
+            updated_at=timezone.now(),
+        )
+        index = self.last_update_index
+        if index is not None:
+            newest = max((row[index] for row in rows if row[index] is not None), default=None)
+            if newest is not None:
+                # Coalesce first: GREATEST with a NULL is NULL on some backends
+                changes['last_update'] = Greatest(Coalesce(F('last_update'), newest), newest)
+        SyncState.objects.filter(endpoint=self.state.endpoint).update(**changes)
+
+        def advance():
+            self.next_skip = next_skip
+            self.done_skips = done
+            self.cursor = cursor
+            self._cursors_after = cursors
+
+        transaction.on_commit(advance)
+
+    def finish(self, completed: bool):
+        status = SyncState.STATUS_COMPLETED if completed else SyncState.STATUS_FAILED
+        SyncState.objects.filter(endpoint=self.state.endpoint).update(status=status, updated_at=timezone.now())
+        self.state.status = status
+
+
+class PageFingerprints:
+    """Fingerprints of the pages a full-refresh endpoint last committed, keyed by offset.
+
+    A fetched page whose fingerprint matches the one stored for its offset
+    holds the rows already in the table, so it needs neither parsing nor
+    writing. Other pages' fingerprints are saved with their rows, from
+    inside the page's write transaction.
+    """
+
+    def __init__(self, endpoint: str, known: Dict[int, Tuple[str, int]]):
+        self.endpoint = endpoint
+        self.known = known
+        self._pending: Dict[int, str] = {}
+        self._entries: Dict[int, int] = {}
+        self.pages = 0
+        self.skipped = 0
+
+    @classmethod
+    def load(cls, endpoint: str) -> 'PageFingerprints':
+        known = {
+            skip: (digest, entries)
+            for skip, digest, entries in PageFingerprint.objects.filter(endpoint=endpoint).values_list(
+                'skip', 'digest', 'entries'
+            )
+        }
+        return cls(endpoint, known)
+
+    def unchanged(self, skip: int, digest: str) -> Optional[int]:
+        """Entry count of the page at skip if its page_fingerprint matches the committed one, else None."""
+        self.pages += 1
+        known = self.known.get(skip)
+        if known is not None and known[0] == digest:
+            self.skipped += 1
+            return known[1]
+        self._pending[skip] = digest
+        return None
+
+    def parsed(self, skip: int, entries: int):
+        self._entries[skip] = entries
+
+    def page_committed(self, skip: int):
+        """Save the fingerprint of the changed page at skip. Call inside the page's write transaction."""
+        digest = self._pending.pop(skip, None)
+        if digest is None:
+            return
+        entries = self._entries.pop(skip, 0)
+        PageFingerprint.objects.update_or_create(
+            endpoint=self.endpoint, skip=skip, defaults={'digest': digest, 'entries': entries}
+        )
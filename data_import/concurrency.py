@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+DEFAULT_MIN_CONCURRENCY = 1
+DEFAULT_MAX_CONCURRENCY = 12
+ADJUST_INTERVAL = 10  # seconds of responses behind each decision
+MIN_SAMPLES = 5  # responses needed before a window is judged
+THROTTLE_RATE = 0.05  # share of 503s in a window that halves concurrency
+LATENCY_TOLERANCE = 2.0  # a feed's p95 above this multiple of its baseline halves concurrency
+BASELINE_WEIGHT = 0.5  # weight of each window's p95 in a feed's moving baseline
+DECREASE_FACTOR = 0.5
+THROTTLE_STATUSES = frozenset((429, 503))
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class AIMDController:
+    """Additive-increase/multiplicative-decrease limit on concurrent page fetches.
+
+    Used as an async context manager around each fetch, it admits at most
+    `limit` requests at a time. MarketSharpAPI reports every response through
+    record(); every ADJUST_INTERVAL seconds the window is judged:
+
+    * too many 503s, or a feed whose p95 page latency is well above its
+      own baseline, multiplies the limit by DECREASE_FACTOR;
+    * otherwise, if the limit was actually reached during the window, it
+      grows by one.
+
+    Latencies are only those of page fetches and are kept per feed, since a
+    $count or a small reference page says nothing about a 5000-row page. A
+    feed's baseline is a moving average of its window p95s rather than the
+    best ever seen, so one unusually fast window can't hold the limit down.
+
+    One controller is shared by every endpoint in the process, since they all
+    hit the same API, and each change is logged.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        initial: int,
+        minimum: int = DEFAULT_MIN_CONCURRENCY,
+        maximum: int = DEFAULT_MAX_CONCURRENCY,
+        interval: float = ADJUST_INTERVAL,
+    ):
+        self.logger = logger
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.interval = interval
+        self.in_use = 0
+        self.baselines: Dict[str, float] = {}
+        self.increases = 0
+        self.decreases = 0
+        self.lowest = self.highest = self.limit
+
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._window_start = time.monotonic()
+        self._responses = 0
+        self._throttled = 0
+        self._latencies: Dict[str, List[float]] = {}
+        self._saturated = False
+
+    async def __aenter__(self):
+        while self.in_use >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_use += 1
+        if self.in_use >= self.limit:
+            self._saturated = True
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.in_use -= 1
+        self._wake()
+
+    def _wake(self):
+        free = self.limit - self.in_use
+        for waiter in self._waiters:
+            if free <= 0:
+                break
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def record(self, status: int, seconds: float, feed: Optional[str] = None):
+        """Note one HTTP response; its latency counts only for a page of feed. May adjust the limit."""
+        self._responses += 1
+        if status in THROTTLE_STATUSES:
+            self._throttled += 1
+        elif status == 200 and feed is not None:
+            self._latencies.setdefault(feed, []).append(seconds)
+
+        if time.monotonic() - self._window_start >= self.interval and self._responses >= MIN_SAMPLES:
+            self._adjust()
+
+    def _slowest_feed(self):
+        """(feed, p95, baseline) of the feed furthest above its baseline this window, or None."""
+        slowest = None
+        for feed, latencies in self._latencies.items():
+            baseline = self.baselines.get(feed)
+            if baseline is None:
+                continue
+            p95 = percentile(latencies, 0.95)
+            if slowest is None or p95 / baseline > slowest[1] / slowest[2]:
+                slowest = (feed, p95, baseline)
+        return slowest
+
+    def _update_baselines(self):
+        for feed, latencies in self._latencies.items():
+            p95 = percentile(latencies, 0.95)
+            baseline = self.baselines.get(feed)
+            self.baselines[feed] = p95 if baseline is None else baseline + BASELINE_WEIGHT * (p95 - baseline)
+
+    def _adjust(self):
+        throttle_rate = self._throttled / self._responses
+        slowest = self._slowest_feed()
+
+        old_limit = self.limit
+        if throttle_rate > THROTTLE_RATE:
+            reason = '503 rate'
+            self.limit = max(self.minimum, int(self.limit * DECREASE_FACTOR))
+        elif slowest is not None and slowest[1] > LATENCY_TOLERANCE * slowest[2]:
+            reason = f'p95 latency of {slowest[0]}'
+            self.limit = max(self.minimum, int(self.limit * DECREASE_FACTOR))
+        elif self._saturated:
+            reason = 'limit reached without throttling'
+            self.limit = min(self.maximum, self.limit + 1)
+        else:
+            reason = None
+
+        if self.limit != old_limit:
+            if self.limit > old_limit:
+                self.increases += 1
+            else:
+                self.decreases += 1
+            self.lowest = min(self.lowest, self.limit)
+            self.highest = max(self.highest, self.limit)
+            p95_text = f"p95 {slowest[1]:.2f}s against {slowest[2]:.2f}s" if slowest is not None else 'p95 n/a'
+            self.logger.info(
+                f"Fetch concurrency {old_limit} -> {self.limit} ({reason}): "
+                f"{self._responses} responses, 503 rate {throttle_rate:.0%}, {p95_text}"
+            )
+            self._wake()
+
+        self._update_baselines()
+        self._window_start = time.monotonic()
+        self._responses = 0
+        self._throttled = 0
+        self._latencies = {}
+        self._saturated = self.in_use >= self.limit
+
+    def log_summary(self):
+        self.logger.info(
+            f"Fetch concurrency summary: final {self.limit}, range {self.lowest}-{self.highest}, "
+            f"{self.increases} increases, {self.decreases} decreases"
+        )
@@ -0,0 +1,108 @@
+import io
+from typing import Any, List, Optional, Sequence, Tuple
+
+from django.db import connection, transaction
+
+from data_import.upsert import merge_clause
+
+# COPY text format escapes; backslash goes first so the others aren't doubled
+COPY_ESCAPES = (('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r'))
+COPY_NULL = '\\N'
+
+
+def copy_supported() -> bool:
+    """COPY staging needs psycopg on PostgreSQL; every other backend uses the ORM path."""
+    return connection.vendor == 'postgresql'
+
+
+def copy_value(value: Any) -> str:
+    """Format one Python value as a field of COPY ... FROM STDIN text format."""
+    if value is None:
+        return COPY_NULL
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, str):
+        for char, escaped in COPY_ESCAPES:
+            if char in value:
+                value = value.replace(char, escaped)
+        return value
+    # UUIDs, numbers and aware datetimes all have str() forms Postgres reads back
+    return str(value)
+
+
+def copy_buffer(rows: Sequence[Tuple[Any, ...]]) -> io.StringIO:
+    """Serialize row tuples into an in-memory COPY text stream."""
+    buffer = io.StringIO()
+    write = buffer.write
+    for row in rows:
+        write('\t'.join([copy_value(value) for value in row]))
+        write('\n')
+    buffer.seek(0)
+    return buffer
+
+
+class CopyLoader:
+    """Writes pages into one table with COPY through a temporary staging table.
+
+    Each page is copied into a temp table holding only the mapped columns and
+    merged into the target with a single INSERT ... ON CONFLICT (pk) DO UPDATE,
+    so the database classifies inserts and updates itself. Rows must already be
+    unique by key. Tables without a mapped primary key are appended to
+    directly with COPY.
+
+    Existing rows are only rewritten when they changed; see merge_clause().
+    """
+
+    def __init__(
+        self,
+        model,
+        columns: Sequence[str],
+        pk_index: Optional[int],
+        last_update_index: Optional[int] = None
+    ):
+        self.model = model
+        self.pk_index = pk_index
+        quote = connection.ops.quote_name
+        meta = model._meta
+        self.table = quote(meta.db_table)
+        self.staging = quote(f'staging_{meta.db_table}')
+        db_columns = [meta.get_field(name).column for name in columns]
+        self.column_list = ', '.join(quote(column) for column in db_columns)
+        if pk_index is not None:
+            self.merge = merge_clause(db_columns, pk_index, last_update_index)
+
+    def write(self, rows: List[Tuple[Any, ...]]) -> Tuple[int, int]:
+        """COPY rows into the target table in one transaction; returns (inserted, updated)."""
+        if not rows:
+            return 0, 0
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            if self.pk_index is None:
+                cursor.copy_expert(
+                    f'COPY {self.table} ({self.column_list}) FROM STDIN',
+                    copy_buffer(rows)
+                )
+                return len(rows), 0
+
+            # An enclosing transaction may still hold the previous page's table
+            cursor.execute(f'DROP TABLE IF EXISTS {self.staging}')
+            cursor.execute(
+                f'CREATE TEMP TABLE {self.staging} ON COMMIT DROP AS '
+                f'SELECT {self.column_list} FROM {self.table} WITH NO DATA'
+            )
+            cursor.copy_expert(
+                f'COPY {self.staging} ({self.column_list}) FROM STDIN',
+                copy_buffer(rows)
+            )
+            cursor.execute(
+                f'WITH merged AS ('
+                f'INSERT INTO {self.table} AS target ({self.column_list}) '
+                f'SELECT {self.column_list} FROM {self.staging} '
+                f'{self.merge} '
+                f'RETURNING (target.xmax = 0) AS inserted'
+                f') SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged'
+            )
+            inserted, updated = cursor.fetchone()
+        return inserted, updated
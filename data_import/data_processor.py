@@ -1,7 +1,112 @@
+import json
 import re
 import lxml.etree as ET
-from data_import.marketsharp_api import MarketSharpAPI
+from data_import.marketsharp_api import MarketSharpAPI, PageCursor
 from functools import cached_property
+from typing import List, Optional
+
+ATOM_ENTRY_TAG = '{http://www.w3.org/2005/Atom}entry'
+PROPERTIES_TAG = '{http://schemas.microsoft.com/ado/2007/08/dataservices/metadata}properties'
+LAST_UPDATE_TAG = '{http://schemas.microsoft.com/ado/2007/08/dataservices}lastUpdate'
+ID_TAG = '{http://schemas.microsoft.com/ado/2007/08/dataservices}id'
+# Longest character reference we hold back between chunks, e.g. '&#x10FFFF;'
+MAX_PENDING_REFERENCE = 16
+
+# Matches, in raw UTF-8 bytes, everything the sanitizer removes. The leading byte
+# class lets the regex engine skip ahead quickly; each branch then confirms the
+# full invalid sequence.
+INVALID_XML_PATTERN = re.compile(rb'''
+    [\x00-\x08\x0B\x0C\x0E-\x1F\x7F\xC2\xED\xEF&]
+    (?:
+        (?<=[\x00-\x08\x0B\x0C\x0E-\x1F\x7F])        # C0 controls and DEL
+      | (?<=\xC2)[\x80-\x9F]                         # C1 controls U+0080-U+009F
+      | (?<=\xEF)(?:\xB7[\x90-\xAF]|\xBF[\xBE\xBF])  # noncharacters U+FDD0-U+FDEF, U+FFFE, U+FFFF
+      | (?<=\xED)[\xA0-\xBF][\x80-\xBF]              # encoded surrogates
+      | (?<=&)\#x[0-9A-Fa-f]+;                       # hex character references
+    )
+''', re.VERBOSE)
+
+# Cursor fields of the last entry, as WCF Data Services writes them with the d: prefix
+LAST_UPDATE_PATTERN = re.compile(rb'<d:lastUpdate(?:\s[^>]*)?>([^<]+)</d:lastUpdate>')
+ID_PATTERN = re.compile(rb'<d:id(?:\s[^>]*)?>([^<]+)</d:id>')
+# Any namespace prefix; '<' can't appear unescaped in text, so every match is an entry
+ENTRY_PATTERN = re.compile(rb'<(?:[\w.-]+:)?entry[\s/>]')
+
+class AtomStreamParser:
+    """Incremental Atom feed parser yielding one m:properties element at a time.
+
+    Chunks are sanitized and fed to an lxml pull parser as they arrive. Each
+    yielded element is cleared once the consumer moves on, and finished entries
+    are detached from the feed, so the tree never holds more than one entry.
+    The generators returned by feed() and close() must be consumed before the
+    next chunk is fed.
+    """
+
+    def __init__(self, data_processor, track_cursor: bool = False):
+        self._sanitize = data_processor.sanitize_xml
+        self._track_cursor = track_cursor
+        self._last_update = None
+        self._last_id = None
+        self._pending = b''
+        self._parser = ET.XMLPullParser(events=('end',), tag=(ATOM_ENTRY_TAG, PROPERTIES_TAG))
+
+    @staticmethod
+    def _split_tail(data: bytes) -> int:
+        """Return where to cut data so no reference or UTF-8 sequence is split across chunks."""
+        cut = len(data)
+
+        amp = data.rfind(b'&', max(0, len(data) - MAX_PENDING_REFERENCE))
+        if amp != -1 and b';' not in data[amp:]:
+            cut = amp
+
+        for back in range(1, min(3, len(data)) + 1):
+            byte = data[-back]
+            if byte < 0x80:
+                break
+            if byte >= 0xC0:
+                needed = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+                if needed > back:
+                    cut = min(cut, len(data) - back)
+                break
+
+        return cut
+
+    def feed(self, chunk: bytes):
+        data = self._pending + chunk
+        cut = self._split_tail(data)
+        self._pending = data[cut:]
+        if cut:
+            self._parser.feed(self._sanitize(data[:cut]))
+        return self._read_events()
+
+    def close(self):
+        if self._pending:
+            self._parser.feed(self._sanitize(self._pending))
+            self._pending = b''
+        self._parser.close()
+        return self._read_events()
+
+    def cursor(self, id_is_guid: bool = True) -> Optional[PageCursor]:
+        """Keyset cursor after the last entry parsed so far, if tracking was requested."""
+        if not self._last_update:
+            return None
+        return PageCursor(self._last_update, self._last_id, id_is_guid)
+
+    def _read_events(self):
+        for _, element in self._parser.read_events():
+            if element.tag == PROPERTIES_TAG:
+                if self._track_cursor:
+                    self._last_update = element.findtext(LAST_UPDATE_TAG)
+                    self._last_id = element.findtext(ID_TAG)
+                yield element
+                element.clear()
+            else:
+                # Entry finished: drop it and any earlier siblings from the feed
+                element.clear()
+                parent = element.getparent()
+                while element.getprevious() is not None:
+                    del parent[0]
+
 
 class DataProcessor:
     def __init__(self, logger):
@@ -16,33 +121,98 @@ class DataProcessor:
         }
 
     def sanitize_xml(self, xml_data):
-        """Sanitize XML data by removing invalid characters."""
-        if not isinstance(xml_data, str):
-            raise TypeError(f"Expected string for XML data but got {type(xml_data)}")
-
-        # Remove null bytes and specific invalid character references
-        xml_data = xml_data.replace('\x00', '')
-        xml_data = re.sub(r'&#x[0-9A-Fa-f]+;', '', xml_data)
-
-        # Regular expression to remove other invalid XML characters
-        invalid_xml_char_pattern = re.compile(
-            r'[\x01-\x08\x0B\x0C\x0E-\x1F\x7F-\x9F\uFDD0-\uFDEF\uFFFE\uFFFF]|'
-            r'[\uD800-\uDBFF](?![\uDC00-\uDFFF])|(?<![\uD800-\uDBFF])[\uDC00-\uDFFF]'
-        )
-        # Substitute invalid characters with an empty string
-        return invalid_xml_char_pattern.sub('', xml_data)
+        """Sanitize raw XML bytes by removing invalid characters in a single pass.
+
+        Clean payloads, which are almost all of them, are returned as-is without a copy.
+        """
+        if isinstance(xml_data, str):
+            xml_data = xml_data.encode('utf-8')
+        elif not isinstance(xml_data, (bytes, bytearray)):
+            raise TypeError(f"Expected bytes for XML data but got {type(xml_data)}")
+
+        # One search is an exact test; it only stops on a byte that can start a match
+        if INVALID_XML_PATTERN.search(xml_data) is None:
+            return xml_data
+        return INVALID_XML_PATTERN.sub(b'', xml_data)
 
     def parse_xml(self, xml_data):
         """Parse XML and return root entries."""
         # Sanitize XML before parsing to ensure no invalid characters remain
         sanitized_xml_data = self.sanitize_xml(xml_data)
         try:
-            root = ET.fromstring(sanitized_xml_data.encode('utf-8'))
+            root = ET.fromstring(sanitized_xml_data)
             return root.findall('.//atom:entry', namespaces=self.nsmap)
         except ET.XMLSyntaxError as e:
             self.logger.error(f"XML parsing error: {str(e)}", exc_info=True)
             raise
 
+    def parse_json(self, json_data):
+        """Parse an OData verbose JSON page and return its entity objects."""
+        try:
+            document = json.loads(json_data)
+            body = document['d']
+            # OData v2 wraps the array as {"d": {"results": [...]}}, v1 returns {"d": [...]}
+            return body['results'] if isinstance(body, dict) else body
+        except (ValueError, KeyError, TypeError) as e:
+            self.logger.error(f"JSON parsing error: {str(e)}", exc_info=True)
+            raise ValueError(f"Unexpected OData JSON page: {e}") from e
+
+    def page_ids(self, data: bytes, response_format: str = 'atom') -> List[str]:
+        """Ids of a page's entries in feed order, for pages fetched with $select=id."""
+        if response_format == 'json':
+            return [str(entity['id']) for entity in self.parse_json(data)]
+        ids = ID_PATTERN.findall(data)
+        if ids and len(ids) == data.count(b'<m:properties'):
+            return [value.decode('utf-8') for value in ids]
+
+        # Empty page or unexpected prefixes: fall back to a full parse
+        page_ids = []
+        for entry in self.parse_xml(data):
+            properties = entry.find('.//m:properties', namespaces=self.nsmap)
+            record_id = properties.findtext(ID_TAG) if properties is not None else None
+            if record_id:
+                page_ids.append(record_id)
+        return page_ids
+
+    def entry_count(self, data: bytes, response_format: str = 'atom') -> int:
+        """Number of entries on a raw page, counted without parsing it."""
+        if response_format == 'json':
+            # Verbose JSON gives every entity a __metadata object; parse only if it was left out
+            count = data.count(b'"__metadata"')
+            return count if count or not data else len(self.parse_json(data))
+        return len(ENTRY_PATTERN.findall(data))
+
+    def stream_parser(self, track_cursor: bool = False) -> AtomStreamParser:
+        """Return a new incremental parser for one page."""
+        return AtomStreamParser(self, track_cursor)
+
+    def last_entry_cursor(self, xml_data: bytes, id_is_guid: bool = True) -> Optional[PageCursor]:
+        """Return the keyset cursor after the last entry of a page, or None for an empty page.
+
+        Only the tail of the page is scanned, so the fetch stage can request the
+        next page without waiting for this one to be parsed.
+        """
+        start = xml_data.rfind(b'<m:properties')
+        if start != -1:
+            tail = xml_data[start:]
+            last_update = LAST_UPDATE_PATTERN.search(tail)
+            if last_update:
+                record_id = ID_PATTERN.search(tail)
+                return PageCursor(
+                    last_update.group(1).decode('utf-8'),
+                    record_id.group(1).decode('utf-8') if record_id else None,
+                    id_is_guid
+                )
+
+        # Unexpected prefixes: fall back to a full parse
+        entries = self.parse_xml(xml_data)
+        if not entries:
+            return None
+        properties = entries[-1].find('.//m:properties', namespaces=self.nsmap)
+        if properties is None or not properties.findtext(LAST_UPDATE_TAG):
+            return None
+        return PageCursor(properties.findtext(LAST_UPDATE_TAG), properties.findtext(ID_TAG), id_is_guid)
+
     def get_xml_text(self, parent, tag_name):
         """Helper function to extract text from XML elements."""
         element = parent.find(f'd:{tag_name}', namespaces=self.nsmap)
@@ -0,0 +1,333 @@
+import json
+import logging
+import os
+import re
+import resource
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime as DateTime, timedelta
+from multiprocessing import get_context
+from typing import Any, Dict, List
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from data_import.base_processor import ProcessingResult
+from data_import.copy_loader import copy_supported
+from data_import.data_processor import DataProcessor
+from data_import.marketsharp_api import STREAM_CHUNK_SIZE
+from data_import.processors.contact_processor import ContactProcessor
+from data_import.registry import ProcessorRegistry
+
+logger = logging.getLogger(__name__)
+
+FEED_HEADER = (
+    '<?xml version="1.0" encoding="utf-8" standalone="yes"?>'
+    '<feed xml:base="https://api4.marketsharpm.com/WcfDataService.svc/" '
+    'xmlns:d="http://schemas.microsoft.com/ado/2007/08/dataservices" '
+    'xmlns:m="http://schemas.microsoft.com/ado/2007/08/dataservices/metadata" '
+    'xmlns="http://www.w3.org/2005/Atom">'
+    '<title type="text">Contacts</title>'
+    '<id>https://api4.marketsharpm.com/WcfDataService.svc/Contacts</id>'
+)
+FEED_FOOTER = '</feed>'
+
+EDM_TYPES = {
+    'uuid': 'Edm.Guid',
+    'datetime': 'Edm.DateTime',
+    'boolean': 'Edm.Boolean',
+    'int': 'Edm.Int32',
+    'float': 'Edm.Double',
+    'decimal': 'Edm.Decimal',
+    'string': 'Edm.String',
+}
+
+
+def sample_value(field_type: str, row: int) -> str:
+    """Return a plausible OData text value for a field type."""
+    if field_type == 'uuid':
+        return str(uuid.uuid4())
+    if field_type == 'datetime':
+        return (DateTime(2024, 1, 1) + timedelta(seconds=row * 37)).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+    if field_type == 'boolean':
+        return 'true' if row % 2 else 'false'
+    if field_type in ('int', 'float', 'decimal'):
+        return str(row)
+    return f'value {row} &amp; more'
+
+
+def build_page(field_mappings: Dict[str, Any], entries: int, null_every: int = 7) -> bytes:
+    """Build a synthetic Atom page shaped like a MarketSharp OData response.
+
+    Optional fields are m:null on every null_every-th cell; 0 fills them all,
+    which database benchmarks need since the mappings don't know which model
+    columns are NOT NULL.
+    """
+    parts = [FEED_HEADER]
+    for row in range(entries):
+        parts.append('<entry><content type="application/xml"><m:properties>')
+        for index, mapping in enumerate(field_mappings.values()):
+            edm_type = EDM_TYPES[mapping.field_type.value]
+            if null_every and not mapping.required and (row + index) % null_every == 0:
+                parts.append(f'<d:{mapping.xml_field} m:type="{edm_type}" m:null="true" />')
+            else:
+                value = sample_value(mapping.field_type.value, row)
+                parts.append(f'<d:{mapping.xml_field} m:type="{edm_type}">{value}</d:{mapping.xml_field}>')
+        parts.append('</m:properties></content></entry>')
+    parts.append(FEED_FOOTER)
+    return ''.join(parts).encode('utf-8')
+
+
+def build_json_page(page: bytes) -> bytes:
+    """Re-encode a synthetic Atom page as the OData v2 verbose JSON MarketSharp would send instead."""
+    data_processor = DataProcessor(logger)
+    results = []
+    for entry in data_processor.parse_xml(page):
+        entity = {}
+        for element in entry.find('.//m:properties', namespaces=data_processor.nsmap):
+            name = element.tag.rpartition('}')[2]
+            edm_type = element.get('{http://schemas.microsoft.com/ado/2007/08/dataservices/metadata}type')
+            text = element.text
+            if text is None:
+                entity[name] = None
+            elif edm_type == 'Edm.DateTime':
+                millis = int((DateTime.fromisoformat(text) - DateTime(1970, 1, 1)).total_seconds() * 1000)
+                entity[name] = f'/Date({millis})/'
+            elif edm_type == 'Edm.Boolean':
+                entity[name] = text == 'true'
+            elif edm_type in ('Edm.Int32', 'Edm.Double'):
+                entity[name] = json.loads(text)
+            else:
+                entity[name] = text
+        results.append(entity)
+    return json.dumps({'d': {'results': results}}).encode('utf-8')
+
+
+def make_dirty(page: bytes, every: int = 50) -> bytes:
+    """Sprinkle control characters, C1 characters and hex references into a page."""
+    lines = page.split(b'</m:properties>')
+    for index in range(0, len(lines), every):
+        lines[index] += b'\x00\x01\xc2\x85&#x1F;\xef\xbf\xbe'
+    return b'</m:properties>'.join(lines)
+
+
+def legacy_sanitize_xml(xml_data: str) -> str:
+    """The three-pass str sanitizer DataProcessor used before the byte-level one."""
+    xml_data = xml_data.replace('\x00', '')
+    xml_data = re.sub(r'&#x[0-9A-Fa-f]+;', '', xml_data)
+    invalid_xml_char_pattern = re.compile(
+        r'[\x01-\x08\x0B\x0C\x0E-\x1F\x7F-\x9F\uFDD0-\uFDEF\uFFFE\uFFFF]|'
+        r'[\uD800-\uDBFF](?![\uDC00-\uDFFF])|(?<![\uD800-\uDBFF])[\uDC00-\uDFFF]'
+    )
+    return invalid_xml_char_pattern.sub('', xml_data)
+
+
+def throughput(func, payload, repeat: int) -> float:
+    """Best-of-repeat throughput of func(payload) in MB/s."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(payload)
+        best = min(best, time.perf_counter() - start)
+    return len(payload) / 1024 / 1024 / best
+
+
+class QueryCounter:
+    """Database execute wrapper that counts statements without keeping their SQL."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_parse_mode(mode: str, page_path: str) -> Dict[str, Any]:
+    """Parse one page file in a fresh process and report time and peak RSS growth.
+
+    The buffered mode reads the whole body like response.read(); the stream
+    mode reads it in response-sized chunks like iter_data().
+    """
+    processor = ContactProcessor(logger, DataProcessor(logger))
+    result = ProcessingResult()
+    baseline = max_rss_mb()
+    start = time.perf_counter()
+
+    if mode == 'buffered':
+        with open(page_path, 'rb') as page_file:
+            xml_data = page_file.read()
+        properties_iter = (
+            entry.find('.//m:properties', namespaces=processor.data_processor.nsmap)
+            for entry in processor.data_processor.parse_xml(xml_data)
+        )
+        count = sum(1 for _ in processor.collect_records(properties_iter, processor.field_mappings, result))
+    else:
+        parser = processor.data_processor.stream_parser()
+        count = 0
+        with open(page_path, 'rb') as page_file:
+            while chunk := page_file.read(STREAM_CHUNK_SIZE):
+                count += sum(1 for _ in processor.collect_records(
+                    parser.feed(chunk), processor.field_mappings, result
+                ))
+        count += sum(1 for _ in processor.collect_records(parser.close(), processor.field_mappings, result))
+
+    return {
+        'mode': mode,
+        'entries': count,
+        'page_mb': os.path.getsize(page_path) / 1024 / 1024,
+        'seconds': time.perf_counter() - start,
+        'peak_mb': max_rss_mb() - baseline,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the ingest hot paths on synthetic MarketSharp pages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'suite',
+            choices=['parse', 'sanitize', 'upsert', 'formats'],
+            help='Which benchmark to run.'
+        )
+        parser.add_argument(
+            '--entries',
+            type=int,
+            default=5000,
+            help='Number of entries per synthetic page (default: 5000)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Timed repetitions per measurement; the best one is reported (default: 5)'
+        )
+        parser.add_argument(
+            '--pages',
+            type=int,
+            default=20,
+            help='Pages written per pass by the upsert suite (default: 20)'
+        )
+
+    def handle(self, *args: Any, **options: Dict[str, Any]):
+        if options['suite'] == 'parse':
+            self.benchmark_parse(options['entries'])
+        elif options['suite'] == 'sanitize':
+            self.benchmark_sanitize(options['entries'], options['repeat'])
+        elif options['suite'] == 'upsert':
+            self.benchmark_upsert(options['entries'], options['pages'])
+        elif options['suite'] == 'formats':
+            self.benchmark_formats(options['entries'], options['repeat'])
+
+    def benchmark_parse(self, entries: int):
+        """Compare the buffered parse_xml path with the streaming parser on a Contact page."""
+        rows: List[Dict[str, Any]] = []
+        with tempfile.NamedTemporaryFile(suffix='.xml') as page_file:
+            page_file.write(build_page(ContactProcessor.field_mappings, entries))
+            page_file.flush()
+            for mode in ('buffered', 'stream'):
+                # Each mode runs in its own process so peak RSS is not shared between them
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context('fork')) as executor:
+                    rows.append(executor.submit(run_parse_mode, mode, page_file.name).result())
+
+        self.stdout.write(f"{'mode':<10}{'entries':>9}{'page MB':>10}{'seconds':>10}{'entries/s':>12}{'peak MB':>10}")
+        for row in rows:
+            self.stdout.write(
+                f"{row['mode']:<10}{row['entries']:>9}{row['page_mb']:>10.1f}{row['seconds']:>10.2f}"
+                f"{row['entries'] / row['seconds']:>12.0f}{row['peak_mb']:>10.1f}"
+            )
+
+    def benchmark_sanitize(self, entries: int, repeat: int):
+        """Compare legacy and byte-level sanitizer throughput on clean and dirty pages."""
+        data_processor = DataProcessor(logger)
+        clean = build_page(ContactProcessor.field_mappings, entries)
+        pages = {'clean': clean, 'dirty': make_dirty(clean)}
+
+        self.stdout.write(f"{'page':<8}{'MB':>8}{'legacy MB/s':>14}{'bytes MB/s':>13}{'speedup':>10}")
+        for name, page in pages.items():
+            text = page.decode('utf-8')
+            if legacy_sanitize_xml(text).encode('utf-8') != data_processor.sanitize_xml(page):
+                self.stderr.write(f"Sanitizers disagree on the {name} page")
+            legacy = throughput(legacy_sanitize_xml, text, repeat)
+            current = throughput(data_processor.sanitize_xml, page, repeat)
+            self.stdout.write(
+                f"{name:<8}{len(page) / 1024 / 1024:>8.1f}{legacy:>14.0f}{current:>13.0f}{current / legacy:>9.1f}x"
+            )
+
+    def benchmark_upsert(self, entries: int, pages: int):
+        """Compare the write backends on a Contact page set: as inserts, as updates, and unchanged.
+
+        The update pass rewrites every row with a newer lastUpdate and one
+        changed column; the unchanged pass writes the updated rows again.
+        Every backend runs inside a transaction that is rolled back, so the
+        synthetic rows never reach the table.
+        """
+        processor = ContactProcessor(logger, DataProcessor(logger))
+        extractor = processor.extractor
+        page_rows = []
+        for _ in range(pages):
+            rows, _ = processor.parse_page(build_page(ContactProcessor.field_mappings, entries, null_every=0))
+            page_rows.append(rows)
+        total = sum(len(rows) for rows in page_rows)
+
+        last_update = extractor.last_update_index
+        changed = extractor.columns.index('first_name')
+
+        def touched(row):
+            values = list(row)
+            values[last_update] += timedelta(seconds=1)
+            values[changed] = f'{values[changed]} (edited)'
+            return tuple(values)
+
+        updated_rows = [[touched(row) for row in rows] for rows in page_rows]
+        passes = (('insert', page_rows), ('update', updated_rows), ('same', updated_rows))
+
+        backends = ['orm', 'upsert'] + (['copy'] if copy_supported() else [])
+        self.stdout.write(f"{'backend':<10}{'pass':<8}{'rows':>9}{'seconds':>10}{'rows/s':>10}{'queries':>9}")
+        for backend in backends:
+            with transaction.atomic():
+                for name, pass_rows in passes:
+                    queries = QueryCounter()
+                    with connection.execute_wrapper(queries):
+                        start = time.perf_counter()
+                        for rows in pass_rows:
+                            processor.write_rows(rows, ContactProcessor.model, extractor, entries, backend)
+                        seconds = time.perf_counter() - start
+                    self.stdout.write(
+                        f"{backend:<10}{name:<8}{total:>9}{seconds:>10.2f}"
+                        f"{total / seconds:>10.0f}{queries.count:>9}"
+                    )
+                transaction.set_rollback(True)
+
+    def benchmark_formats(self, entries: int, repeat: int):
+        """Compare page size and parse time of Atom and JSON pages for every registered endpoint."""
+        registry = ProcessorRegistry.get_instance()
+        self.stdout.write(
+            f"{'endpoint':<28}{'atom KB':>9}{'json KB':>9}{'atom ms':>9}{'json ms':>9}{'speedup':>9}"
+        )
+        for endpoint, processor_class in sorted(registry.processors.items()):
+            processor = processor_class(logger, DataProcessor(logger))
+            atom = build_page(processor_class.field_mappings, entries)
+            pages = {'atom': atom, 'json': build_json_page(atom)}
+            if processor.parse_page(atom)[0] != processor.parse_page(pages['json'], 'json')[0]:
+                self.stderr.write(f"Atom and JSON rows differ for {endpoint}")
+
+            seconds = {}
+            for response_format, page in pages.items():
+                best = float('inf')
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    processor.parse_page(page, response_format)
+                    best = min(best, time.perf_counter() - start)
+                seconds[response_format] = best
+            self.stdout.write(
+                f"{endpoint:<28}{len(pages['atom']) / 1024:>9.0f}{len(pages['json']) / 1024:>9.0f}"
+                f"{seconds['atom'] * 1000:>9.1f}{seconds['json'] * 1000:>9.1f}"
+                f"{seconds['atom'] / seconds['json']:>8.1f}x"
+            )
@@ -1,25 +1,57 @@
 import logging
 import os
-import aiohttp
 import asyncio
 from asgiref.sync import sync_to_async
-from django.core.management.base import BaseCommand
-from data_import.marketsharp_api import MarketSharpAPI
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from data_import.marketsharp_api import MarketSharpAPI, PageCursor, RECORDS_PER_PAGE, format_odata_datetime
 from data_import.data_processor import DataProcessor
-from data_import.registry import ProcessorRegistry
+from data_import.base_processor import FieldType, ProcessingResult, RESPONSE_FORMATS, WRITE_BACKENDS
+from data_import.registry import ParentLink, ProcessorRegistry
+from data_import.pipeline import (
+    ImportPipeline, ParseExecutor, DEFAULT_QUEUE_SIZE, DEFAULT_PARSE_WORKERS, PARSE_EXECUTORS
+)
+from data_import.scheduler import EndpointScheduler, DEFAULT_MAX_ENDPOINTS, DEFAULT_DB_WRITERS
+from data_import.concurrency import AIMDController, DEFAULT_MAX_CONCURRENCY
+from data_import.rate_limiter import TokenBucket, DEFAULT_RATE, DEFAULT_BURST
+from data_import.checkpoint import EndpointCheckpoint, PageFingerprints, page_fingerprint
+from data_import.page_cache import PageCache
+from data_import.reconcile import ID_PAGE_SIZE, MAX_MISSING_FRACTION, RECONCILE_ACTIONS, Reconciliation
+from data_import.retry import CircuitBreaker, RetryPolicy, DEFAULT_MAX_ATTEMPTS, DEFAULT_REQUEST_TIMEOUT
+from dataclasses import dataclass
 from datetime import datetime as DateTime
-from typing import Optional, Dict, Any, List
-import random
+from typing import Optional, Dict, Any, List, Tuple
 
 logger = logging.getLogger(__name__)
 BATCH_SIZE = 5000
-INITIAL_CONCURRENT_FETCHES = 3  # Reduced from 5
-MIN_CONCURRENT_FETCHES = 1
-MAX_RETRY_DELAY = 30
-INITIAL_RETRY_DELAY = 10
+INITIAL_CONCURRENT_FETCHES = 3  # Starting point; the AIMD controller adjusts it
+PARENT_IDS_PER_REQUEST = 20  # Keeps an id $filter well inside the API's query string limit
+PAGINATION_MODES = ('skip', 'cursor')
+
+@dataclass
+class ImportOptions:
+    max_concurrent: int = DEFAULT_MAX_CONCURRENCY
+    stream: bool = False
+    queue_size: int = DEFAULT_QUEUE_SIZE
+    pagination: str = 'skip'
+    write_backend: Optional[str] = None
+    max_endpoints: int = DEFAULT_MAX_ENDPOINTS
+    db_writers: int = DEFAULT_DB_WRITERS
+    rate: float = DEFAULT_RATE
+    burst: int = DEFAULT_BURST
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    request_timeout: float = DEFAULT_REQUEST_TIMEOUT
+    select: bool = True
+    response_format: Optional[str] = None
+    page_cache: Optional[str] = None
+    replay: bool = False
+    resume: bool = False
+    fingerprints: bool = True
+    reconcile: bool = False
+    reconcile_action: str = 'deactivate'
 
 class Command(BaseCommand):
-    help = 'Imports data from MarketSharp API and processes it sequentially for each endpoint.'
+    help = 'Imports data from MarketSharp API, running several endpoints concurrently.'
 
     def __init__(self, logger: Optional[logging.Logger] = None):
         super().__init__()
@@ -27,7 +59,15 @@ class Command(BaseCommand):
         if not logger:
             logging.basicConfig(level=logging.DEBUG)
         self.registry = ProcessorRegistry.get_instance()
-        self.current_concurrent_fetches = INITIAL_CONCURRENT_FETCHES
+        self.parse_executor: Optional[ParseExecutor] = None
+        # Budgets shared by every endpoint in the run, set up by async_handle
+        self.fetch_slots: Optional[AIMDController] = None
+        self.write_slots: Optional[asyncio.Semaphore] = None
+        self.rate_limiter: Optional[TokenBucket] = None
+        self.retry_policy = RetryPolicy()
+        self.circuit_breaker: Optional[CircuitBreaker] = None
+        self.ms_api: Optional[MarketSharpAPI] = None
+        self.page_cache: Optional[PageCache] = None
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -39,8 +79,136 @@ class Command(BaseCommand):
         parser.add_argument(
             '--max-concurrent',
             type=int,
-            default=INITIAL_CONCURRENT_FETCHES,
-            help=f'Maximum number of concurrent page fetches (default: {INITIAL_CONCURRENT_FETCHES})'
+            default=DEFAULT_MAX_CONCURRENCY,
+            help=f'Upper bound for concurrent page fetches across all endpoints. Fetching starts at '
+                 f'{INITIAL_CONCURRENT_FETCHES} and adapts to 503s and page latency '
+                 f'(default: {DEFAULT_MAX_CONCURRENCY})'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=DEFAULT_RATE,
+            help=f'Maximum MarketSharp requests per second across all endpoints (default: {DEFAULT_RATE})'
+        )
+        parser.add_argument(
+            '--burst',
+            type=int,
+            default=DEFAULT_BURST,
+            help=f'Requests that may be sent back to back before --rate applies (default: {DEFAULT_BURST})'
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=DEFAULT_MAX_ATTEMPTS,
+            help=f'Attempts per request before a retryable failure is given up on (default: {DEFAULT_MAX_ATTEMPTS})'
+        )
+        parser.add_argument(
+            '--request-timeout',
+            type=float,
+            default=DEFAULT_REQUEST_TIMEOUT,
+            help=f'Seconds allowed for one request, body included (default: {DEFAULT_REQUEST_TIMEOUT})'
+        )
+        parser.add_argument(
+            '--max-endpoints',
+            type=int,
+            default=DEFAULT_MAX_ENDPOINTS,
+            help=f'Maximum number of endpoints imported at the same time (default: {DEFAULT_MAX_ENDPOINTS})'
+        )
+        parser.add_argument(
+            '--db-writers',
+            type=int,
+            default=DEFAULT_DB_WRITERS,
+            help=f'Maximum number of pages written to the database at the same time across all '
+                 f'endpoints (default: {DEFAULT_DB_WRITERS}; always 1 on SQLite)'
+        )
+        parser.add_argument(
+            '--stream',
+            action='store_true',
+            help='Parse pages incrementally while they download instead of buffering each page.'
+        )
+        parser.add_argument(
+            '--queue-size',
+            type=int,
+            default=DEFAULT_QUEUE_SIZE,
+            help=f'Pages buffered between pipeline stages (default: {DEFAULT_QUEUE_SIZE})'
+        )
+        parser.add_argument(
+            '--parse-executor',
+            choices=PARSE_EXECUTORS,
+            default='thread',
+            help='Run the parse stage in a thread pool or a process pool (default: thread). '
+                 'Ignored with --stream, which parses while downloading.'
+        )
+        parser.add_argument(
+            '--parse-workers',
+            type=int,
+            default=DEFAULT_PARSE_WORKERS,
+            help=f'Number of parse threads or processes (default: {DEFAULT_PARSE_WORKERS})'
+        )
+        parser.add_argument(
+            '--pagination',
+            choices=PAGINATION_MODES,
+            default='skip',
+            help='Page with $skip offsets, or with a (lastUpdate, id) cursor on endpoints that have '
+                 'lastUpdate (default: skip)'
+        )
+        parser.add_argument(
+            '--no-select',
+            action='store_true',
+            help='Download every property instead of only those the endpoint\'s field mappings use.'
+        )
+        parser.add_argument(
+            '--response-format',
+            choices=RESPONSE_FORMATS,
+            help='Override the feed format requested: Atom XML or OData JSON. JSON pages are always '
+                 'buffered and paged with $skip. Defaults to each endpoint\'s own format.'
+        )
+        parser.add_argument(
+            '--page-cache',
+            metavar='DIR',
+            help='Also store every fetched page, compressed, in this directory (pages are then buffered, '
+                 'not streamed).'
+        )
+        parser.add_argument(
+            '--replay',
+            action='store_true',
+            help='Import the pages stored in --page-cache instead of calling MarketSharp.'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue each endpoint\'s unfinished run from its last committed page, with the same '
+                 'filter, instead of starting a new run from the newest stored lastUpdate. Endpoints paged '
+                 'by $skip resume at an offset, which only lines up if no rows were inserted, updated or '
+                 'deleted upstream ahead of it since the run started; otherwise rows can be missed until '
+                 'a run without --resume.'
+        )
+        parser.add_argument(
+            '--no-fingerprints',
+            action='store_true',
+            help='Parse and write every page of endpoints without lastUpdate, even pages unchanged since '
+                 'they were last written.'
+        )
+        parser.add_argument(
+            '--reconcile',
+            action='store_true',
+            help='Instead of importing, sweep every id of each endpoint from MarketSharp and apply '
+                 '--reconcile-action to stored rows that no longer exist there. Run it on its own, not '
+                 'alongside an import.'
+        )
+        parser.add_argument(
+            '--reconcile-action',
+            choices=RECONCILE_ACTIONS,
+            default='deactivate',
+            help='What --reconcile does with rows deleted in MarketSharp: set is_active to false, or '
+                 'delete them (default: deactivate)'
+        )
+        parser.add_argument(
+            '--write-backend',
+            choices=WRITE_BACKENDS,
+            help='Override how pages are written: an INSERT ... ON CONFLICT upsert that skips unchanged '
+                 'rows, the older existing-id lookup with bulk_create/bulk_update, or COPY into a staging table merged '
+                 'with ON CONFLICT (PostgreSQL only). Defaults to each endpoint\'s own backend.'
         )
 
     async def get_latest_update(self, endpoint: str) -> DateTime:
@@ -53,10 +221,16 @@ class Command(BaseCommand):
         }
         
         if endpoint not in static_endpoints:
-            model_class = self.registry.models[endpoint]
-            latest_update = await sync_to_async(
-                model_class.objects.order_by('-last_update').values_list('last_update', flat=True).first
-            )()
+            state = await sync_to_async(EndpointCheckpoint.load)(endpoint)
+            if state is not None:
+                latest_update = EndpointCheckpoint.resume_point(state)
+            else:
+                # No watermark recorded yet: scan the table once, the checkpoint keeps it from here on
+                self._logger.info(f"No watermark recorded for {endpoint}; reading MAX(last_update) from the table")
+                model_class = self.registry.models[endpoint]
+                latest_update = await sync_to_async(
+                    model_class.objects.order_by('-last_update').values_list('last_update', flat=True).first
+                )()
             latest_update = latest_update if latest_update else DateTime(1970, 1, 1)
         else:
             latest_update = ""
@@ -65,171 +239,583 @@ class Command(BaseCommand):
     def handle(self, *args: Any, **options: Dict[str, Any]):
         logging.basicConfig(level=logging.INFO)
         endpoint = options.get('endpoint')
-        max_concurrent = options.get('max_concurrent', INITIAL_CONCURRENT_FETCHES)
-        asyncio.run(self.async_handle(endpoint, max_concurrent))
+        import_options = ImportOptions(
+            max_concurrent=options.get('max_concurrent', DEFAULT_MAX_CONCURRENCY),
+            stream=options.get('stream', False),
+            queue_size=options.get('queue_size', DEFAULT_QUEUE_SIZE),
+            pagination=options.get('pagination', 'skip'),
+            write_backend=options.get('write_backend'),
+            max_endpoints=options.get('max_endpoints', DEFAULT_MAX_ENDPOINTS),
+            db_writers=options.get('db_writers', DEFAULT_DB_WRITERS),
+            rate=options.get('rate', DEFAULT_RATE),
+            burst=options.get('burst', DEFAULT_BURST),
+            max_attempts=options.get('max_attempts', DEFAULT_MAX_ATTEMPTS),
+            request_timeout=options.get('request_timeout', DEFAULT_REQUEST_TIMEOUT),
+            select=not options.get('no_select', False),
+            response_format=options.get('response_format'),
+            page_cache=options.get('page_cache'),
+            replay=options.get('replay', False),
+            resume=options.get('resume', False),
+            fingerprints=not options.get('no_fingerprints', False),
+            reconcile=options.get('reconcile', False),
+            reconcile_action=options.get('reconcile_action', 'deactivate'),
+        )
+        if import_options.replay and not import_options.page_cache:
+            raise CommandError('--replay needs --page-cache')
+        if import_options.replay and import_options.reconcile:
+            raise CommandError('--reconcile compares against MarketSharp itself and cannot be used with --replay')
+        self.parse_executor = ParseExecutor(
+            options.get('parse_executor', 'thread'),
+            options.get('parse_workers', DEFAULT_PARSE_WORKERS)
+        )
+        try:
+            asyncio.run(self.async_handle(endpoint, import_options))
+        finally:
+            self.parse_executor.shutdown()
 
-    async def async_handle(self, endpoint: Optional[str] = None, max_concurrent: int = INITIAL_CONCURRENT_FETCHES):
-        if endpoint:
-            await self.process_endpoint(endpoint, max_concurrent)
-        else:
-            for ep in self.registry.endpoints.keys():
-                self._logger.info(f"Starting processing for endpoint: {ep}")
-                await self.process_endpoint(ep, max_concurrent)
-                self._logger.info(f"Completed processing for endpoint: {ep}")
+    def estimate_rows(self, endpoint: str) -> int:
+        """Rows already stored for an endpoint, used to start the longest imports first."""
+        model_class = self.registry.models[endpoint]
+        if connection.vendor == 'postgresql':
+            # Planner statistics avoid a full count(*) on the large tables
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [model_class._meta.db_table]
+                )
+                row = cursor.fetchone()
+            return max(row[0], 0) if row else 0
+        return model_class.objects.count()
 
-    async def process_endpoint(self, endpoint: str, max_concurrent: int):
-        start_time = DateTime.now()
-        
+    async def async_handle(self, endpoint: Optional[str] = None, options: Optional[ImportOptions] = None):
+        options = options or ImportOptions()
+        endpoints = [endpoint] if endpoint else list(self.registry.endpoints.keys())
+
+        db_writers = 1 if connection.vendor == 'sqlite' else options.db_writers
+        self.fetch_slots = AIMDController(
+            self._logger,
+            initial=INITIAL_CONCURRENT_FETCHES,
+            maximum=options.max_concurrent
+        )
+        self.write_slots = asyncio.Semaphore(max(1, db_writers))
+        self.rate_limiter = TokenBucket(options.rate, options.burst)
+        self.retry_policy = RetryPolicy(max_attempts=options.max_attempts, request_timeout=options.request_timeout)
+        self.circuit_breaker = CircuitBreaker(self._logger)
+
+        self.page_cache = PageCache(options.page_cache, self._logger) if options.page_cache else None
         credentials = {
             'secret_key': os.getenv('MARKETSHARP_SECRET_KEY'),
             'api_key': os.getenv('MARKETSHARP_API_KEY'),
             'company_id': os.getenv('MARKETSHARP_COMPANY_ID')
         }
-        
-        if not all(credentials.values()):
+        if not options.replay and not all(credentials.values()):
             self._logger.error("Missing required API credentials")
             return
 
-        url = self.registry.endpoints[endpoint]
-        latest_update = await self.get_latest_update(endpoint)
+        sizes = {}
+        for ep in endpoints:
+            sizes[ep] = await sync_to_async(self.estimate_rows)(ep)
 
-        self._logger.info(f"Started fetching {endpoint} from MarketSharp API (after {latest_update})")
-        
-        ms_api = MarketSharpAPI(credentials['company_id'], 
-                               credentials['api_key'], 
-                               credentials['secret_key'], 
-                               self._logger)
+        async def run_endpoint(ep):
+            if options.reconcile:
+                await self.reconcile_endpoint(ep, options)
+            else:
+                await self.process_endpoint(ep, options)
+
+        scheduler = EndpointScheduler(
+            self._logger,
+            run_endpoint,
+            self.registry.dependencies,
+            sizes,
+            options.max_endpoints,
+        )
+        if options.replay:
+            await scheduler.run(endpoints)
+            self.page_cache.log_summary()
+            return
+
+        # Page fetches are capped by max_concurrent; each running endpoint may also have a $count in flight
+        self.ms_api = MarketSharpAPI(credentials['company_id'],
+                                     credentials['api_key'],
+                                     credentials['secret_key'],
+                                     self._logger,
+                                     observer=self.fetch_slots.record,
+                                     rate_limiter=self.rate_limiter,
+                                     retry_policy=self.retry_policy,
+                                     circuit_breaker=self.circuit_breaker,
+                                     pool_size=options.max_concurrent + options.max_endpoints,
+                                     # Id-only sweep pages are not importable; keep them out of the cache
+                                     page_cache=None if options.reconcile else self.page_cache)
+        async with self.ms_api:
+            await scheduler.run(endpoints)
+        self.fetch_slots.log_summary()
+        if self.page_cache is not None:
+            self.page_cache.log_summary()
+
+    async def process_endpoint(self, endpoint: str, options: ImportOptions):
+        start_time = DateTime.now()
+        url = self.registry.endpoints[endpoint]
         data_processor = DataProcessor(self._logger)
         processor_class = self.registry.processors[endpoint]
         processor = processor_class(self._logger, data_processor)
 
-        async with aiohttp.ClientSession() as session:
+        if options.replay:
             try:
+                total_processed = await self.replay_cached_pages(processor, endpoint, url, options)
+                duration = DateTime.now() - start_time
+                self._logger.info(
+                    f"Finished replaying {endpoint}. "
+                    f"Total records: {total_processed} ({processor.write_stats}). Duration: {duration}."
+                )
+            except Exception as e:
+                self._logger.error(f"Error replaying {endpoint}: {str(e)}", exc_info=True)
+            return
+
+        latest_update = await self.get_latest_update(endpoint)
+        self._logger.info(f"Started fetching {endpoint} from MarketSharp API (after {latest_update})")
+
+        parent = self.registry.parents.get(endpoint)
+        try:
+            if parent is not None:
+                total_processed = await self.refresh_child_endpoint(
+                    self.ms_api, processor, endpoint, url, parent, options
+                )
+            else:
                 total_processed = await self.fetch_and_process_paginated_data(
-                    session=session,
-                    ms_api=ms_api,
+                    ms_api=self.ms_api,
                     processor=processor,
                     endpoint=endpoint,
                     url=url,
                     latest_update=latest_update,
-                    max_concurrent=max_concurrent
+                    options=options
                 )
-                duration = DateTime.now() - start_time
-                self._logger.info(
-                    f"Finished processing {endpoint}. "
-                    f"Total records: {total_processed}. Duration: {duration}."
+            duration = DateTime.now() - start_time
+            downloaded = self.ms_api.bytes_received.get(url, 0)
+            self._logger.info(
+                f"Finished processing {endpoint}. "
+                f"Total records: {total_processed} ({processor.write_stats}). "
+                f"Downloaded {downloaded / 1024 / 1024:.1f} MB of "
+                f"{options.response_format or processor.response_format}{'' if options.select else ' without $select'}. "
+                f"Duration: {duration}."
+            )
+        except Exception as e:
+            self._logger.error(f"Error processing {endpoint}: {str(e)}", exc_info=True)
+
+    async def reconcile_endpoint(self, endpoint: str, options: ImportOptions):
+        """Find rows of endpoint deleted in MarketSharp and deactivate or delete them.
+
+        Ids are swept with $select=id in pages of ID_PAGE_SIZE, keyset-paged
+        on id so rows deleted during the sweep can't shift later pages and
+        hide live rows. Nothing is changed unless the sweep completes.
+        """
+        start_time = DateTime.now()
+        url = self.registry.endpoints[endpoint]
+        processor = self.registry.processors[endpoint](self._logger, DataProcessor(self._logger))
+        model_class = self.registry.models[endpoint]
+        if processor.extractor.pk_index is None:
+            self._logger.info(f"{endpoint} has no primary key to reconcile; skipping")
+            return
+        if options.reconcile_action == 'deactivate' and 'is_active' not in processor.get_model_fields(model_class):
+            self._logger.warning(f"{endpoint} has no is_active field to clear; use --reconcile-action delete")
+            return
+
+        response_format = options.response_format or processor.response_format
+        is_guid = processor.pk_is_guid()
+        pk_field = processor.get_pk_mapping(processor.field_mappings).xml_field
+        reconciliation = Reconciliation(endpoint, model_class, is_guid, self._logger)
+        last_id = None
+        try:
+            while True:
+                id_filter = None
+                if last_id is not None:
+                    id_filter = f"{pk_field} gt guid'{last_id}'" if is_guid else f"{pk_field} gt {last_id}"
+                page = await self.ms_api.get_data(
+                    url, select=pk_field, response_format=response_format,
+                    where=(id_filter, pk_field), top=ID_PAGE_SIZE
                 )
-            except Exception as e:
-                self._logger.error(f"Error processing {endpoint}: {str(e)}", exc_info=True)
+                ids = await asyncio.to_thread(processor.data_processor.page_ids, page, response_format)
+                if not ids:
+                    break
+                await asyncio.to_thread(reconciliation.add_page, ids)
+                last_id = ids[-1]
+        except Exception as e:
+            self._logger.error(
+                f"Error sweeping {endpoint} ids after {len(reconciliation.upstream)}: {str(e)}; nothing changed",
+                exc_info=True
+            )
+            return
 
-    async def fetch_with_retry(self, session, ms_api, url, latest_update, skip, max_retries=5):
-        """Fetch a single page with exponential backoff retry."""
-        retry_delay = INITIAL_RETRY_DELAY
-        attempt = 1
+        missing = await sync_to_async(reconciliation.find_missing, thread_sensitive=False)()
+        self._logger.info(
+            f"{endpoint}: {len(reconciliation.upstream)} ids in MarketSharp "
+            f"({reconciliation.upstream.nbytes / 1024 / 1024:.1f} MB), {reconciliation.local_rows} stored, "
+            f"{len(missing)} deleted upstream"
+        )
+        if reconciliation.too_many_missing(missing):
+            self._logger.error(
+                f"{endpoint}: {len(missing)} of {reconciliation.local_rows} stored rows missing upstream is more "
+                f"than {MAX_MISSING_FRACTION:.0%}; leaving them unchanged"
+            )
+            return
+        changed = await sync_to_async(reconciliation.apply, thread_sensitive=False)(missing, options.reconcile_action)
+        action = 'deleted' if options.reconcile_action == 'delete' else 'deactivated'
+        self._logger.info(
+            f"Finished reconciling {endpoint}: {changed} rows {action}. Duration: {DateTime.now() - start_time}."
+        )
 
-        while attempt <= max_retries:
-            try:
-                self._logger.debug(f"Fetching page: {url}, skip {skip}, attempt {attempt}")
-                data = await ms_api.get_data(session, url, latest_update, skip=skip)
-                return data
-            except aiohttp.ClientResponseError as e:
-                if e.status == 503:
-                    if attempt < max_retries:
-                        # Add jitter to prevent thundering herd
-                        jitter = random.uniform(0.5, 1.5)
-                        delay = min(retry_delay * jitter, MAX_RETRY_DELAY)
-                        self._logger.warning(
-                            f"503 Service Unavailable. Retrying after {delay:.1f} seconds... "
-                            f"(attempt {attempt}/{max_retries})"
-                        )
-                        await asyncio.sleep(delay)
-                        retry_delay *= 2  # Exponential backoff
-                        attempt += 1
-                        continue
-                raise
-            except Exception as e:
-                self._logger.error(f"Error fetching page (skip={skip}): {str(e)}")
-                raise
-
-    async def fetch_batch(self, session, ms_api, url, latest_update, skip_values: List[int]):
-        """Fetch a batch of pages with rate limiting."""
-        tasks = [
-            self.fetch_with_retry(session, ms_api, url, latest_update, skip)
-            for skip in skip_values
-        ]
-        
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Count failures
-        failures = sum(1 for r in results if isinstance(r, Exception))
-        
-        # Adjust concurrent fetches based on failures
-        if failures > len(results) / 2:
-            self.current_concurrent_fetches = max(
-                MIN_CONCURRENT_FETCHES,
-                self.current_concurrent_fetches - 1
+    def start_cursor(self, processor, latest_update) -> Optional[PageCursor]:
+        """Keyset starting point for an endpoint, or None if it has to be paged by $skip."""
+        if not processor.supports_keyset():
+            return None
+        watermark = format_odata_datetime(latest_update or DateTime(1970, 1, 1))
+        return PageCursor(watermark, None, processor.pk_is_guid())
+
+    async def fetch_and_process_paginated_data(self, ms_api, processor, 
+                                             endpoint, url, latest_update, options: ImportOptions):
+        """Fetch, parse and write pages through a staged pipeline."""
+        data_processor = processor.data_processor
+        id_is_guid = processor.pk_is_guid()
+        response_format = options.response_format or processor.response_format
+        json_format = response_format == 'json'
+        keyset = options.pagination == 'cursor' and not json_format
+        stream = options.stream and not json_format and self.page_cache is None
+        if json_format and (options.pagination == 'cursor' or options.stream):
+            # JSON dates carry milliseconds only, too coarse for a cursor, and there is no incremental JSON parser
+            self._logger.info(f"{endpoint} is fetched as JSON; buffering pages and paging with $skip")
+        elif options.stream and not stream:
+            self._logger.info(f"{endpoint} pages are cached whole, so they are buffered instead of streamed")
+        start_cursor = self.start_cursor(processor, latest_update) if keyset else None
+        if keyset and start_cursor is None:
+            self._logger.info(f"{endpoint} has no lastUpdate; paging with $skip instead of a cursor")
+        select = ms_api.select_for(processor.field_mappings) if options.select else None
+        # Endpoints without lastUpdate are read in full every run; most of their pages come back unchanged
+        fingerprints = None
+        if not latest_update and start_cursor is None and not stream and options.fingerprints:
+            fingerprints = await sync_to_async(PageFingerprints.load)(endpoint)
+
+        checkpoint = await sync_to_async(self.open_checkpoint)(
+            endpoint, processor, 'cursor' if start_cursor is not None else 'skip',
+            latest_update, start_cursor, options.resume
+        )
+        if checkpoint.resumed:
+            # Same filter as the interrupted run, so its offsets and cursor still line up
+            latest_update = checkpoint.state.watermark
+            start_cursor = checkpoint.cursor if start_cursor is not None else None
+
+        async def fetch_page(skip):
+            page = await ms_api.get_data(url, latest_update, skip=skip, select=select,
+                                         response_format=response_format)
+            return (skip, page) if fingerprints is not None and page else page
+
+        async def stream_page(skip):
+            return await processor.parse_stream(ms_api.iter_data(url, latest_update, skip=skip, select=select))
+
+        async def fetch_cursor_page(cursor):
+            page = await ms_api.get_data(url, cursor=cursor, select=select)
+            return page, data_processor.last_entry_cursor(page, id_is_guid) if page else None
+
+        async def stream_cursor_page(cursor):
+            parser = data_processor.stream_parser(track_cursor=True)
+            page = await processor.parse_stream(ms_api.iter_data(url, cursor=cursor, select=select), parser)
+            return page, parser.cursor(id_is_guid)
+
+        async def parse(page):
+            if self.parse_executor is None:
+                return processor.parse_page(page, response_format)
+            return await self.parse_executor.parse(type(processor), page, response_format)
+
+        async def parse_page(page):
+            if fingerprints is None:
+                return await parse(page)
+            skip, page = page
+            # Hashing a page takes as long as a small parse; keep it off the event loop
+            entries = fingerprints.unchanged(skip, await asyncio.to_thread(page_fingerprint, page))
+            if entries is not None:
+                # Nothing to write, but the entry count still tells whether this was the last page
+                return [], ProcessingResult(total_processed=entries)
+            rows, result = await parse(page)
+            fingerprints.parsed(skip, result.total_processed)
+            return rows, result
+
+        async def write_page(records, skip, cursor):
+            def after_write():
+                checkpoint.page_committed(skip, cursor, records)
+                if fingerprints is not None:
+                    fingerprints.page_committed(skip)
+
+            return await processor.write_records(
+                records, processor.model, processor.field_mappings, BATCH_SIZE, options.write_backend,
+                after_write=after_write
             )
+
+        try:
+            total = await ms_api.get_count(url, latest_update, start_cursor)
+            self._logger.info(f"{endpoint}: {total} entries to fetch")
+        except Exception as e:
+            # Without a total the pipeline still stops at the first short page
+            total = None
+            self._logger.warning(f"Could not count {endpoint} entries up front: {str(e)}")
+
+        if start_cursor is not None:
+            fetch = stream_cursor_page if stream else fetch_cursor_page
+        else:
+            fetch = stream_page if stream else fetch_page
+
+        pipeline = ImportPipeline(
+            self._logger,
+            endpoint,
+            fetch_page=fetch,
+            parse_page=None if stream else parse_page,
+            write_page=write_page,
+            page_size=BATCH_SIZE,
+            fetchers=options.max_concurrent,
+            parsers=self.parse_executor.workers if self.parse_executor else 1,
+            queue_size=options.queue_size,
+            keyset=start_cursor is not None,
+            start_cursor=start_cursor,
+            fetch_slots=self.fetch_slots,
+            write_slots=self.write_slots,
+            total=total,
+            start_skip=checkpoint.next_skip,
+            done_skips=checkpoint.done_skips,
+        )
+        written = await pipeline.run()
+        await sync_to_async(checkpoint.finish)(pipeline.failures == 0)
+        if fingerprints is not None and fingerprints.skipped:
             self._logger.info(
-                f"Too many failures, reducing concurrent fetches to {self.current_concurrent_fetches}"
+                f"{endpoint}: {fingerprints.skipped} of {fingerprints.pages} pages unchanged since they were "
+                f"last written; not parsed or written again"
             )
-        
-        return results
-
-    async def fetch_and_process_paginated_data(self, session, ms_api, processor, 
-                                             endpoint, url, latest_update, max_concurrent):
-        """Fetch and process paginated data with dynamic concurrency adjustment."""
-        skip = 0
-        total_records_processed = 0
-        self.current_concurrent_fetches = max_concurrent
-        
-        while True:
-            # Calculate skip values for this batch
-            skip_values = [
-                skip + i * BATCH_SIZE 
-                for i in range(self.current_concurrent_fetches)
-            ]
-            
-            # Fetch batch of pages
-            batch_results = await self.fetch_batch(
-                session, ms_api, url, latest_update, skip_values
+        return written
+
+    def parent_refresh_window(self, endpoint: str, parent: ParentLink) -> Tuple[Optional[DateTime], Optional[DateTime]]:
+        """Parent lastUpdate range (since, until] whose children a child endpoint has not seen yet.
+
+        since is where the child's last complete refresh left off, or None if
+        it has none. until is how far the parent is known to be imported, so
+        parents still being written are picked up by the next run.
+        """
+        state = EndpointCheckpoint.load(endpoint)
+        since = EndpointCheckpoint.resume_point(state) if state is not None else None
+        parent_state = EndpointCheckpoint.load(parent.endpoint)
+        if parent_state is not None:
+            until = EndpointCheckpoint.resume_point(parent_state)
+        else:
+            until = self.registry.models[parent.endpoint].objects.order_by(
+                '-last_update'
+            ).values_list('last_update', flat=True).first()
+        return since, until
+
+    def changed_parent_ids(self, parent: ParentLink, since, until, limit: int) -> List[Any]:
+        """Ids of parents updated in (since, until], at most limit + 1 of them."""
+        model_class = self.registry.models[parent.endpoint]
+        return list(
+            model_class.objects.filter(last_update__gt=since, last_update__lte=until)
+            .order_by('id').values_list('id', flat=True)[:limit + 1]
+        )
+
+    async def refresh_child_endpoint(self, ms_api, processor, endpoint, url, parent: ParentLink,
+                                     options: ImportOptions) -> int:
+        """Import a child endpoint, which has no lastUpdate, through its parents.
+
+        Only the children of parents whose lastUpdate moved since the child's
+        last complete refresh are fetched, as long as that takes fewer
+        requests than downloading the whole feed; otherwise, and the first
+        time, the whole feed is imported. The parent watermark reached is
+        saved as the child's own once the run completes.
+        """
+        since, until = await sync_to_async(self.parent_refresh_window)(endpoint, parent)
+        parent_ids = None
+        if since is not None and until is not None:
+            stored = await sync_to_async(self.estimate_rows)(endpoint)
+            limit = max(1, -(-stored // BATCH_SIZE)) * PARENT_IDS_PER_REQUEST
+            parent_ids = await sync_to_async(self.changed_parent_ids)(parent, since, until, limit)
+            if len(parent_ids) > limit:
+                self._logger.info(
+                    f"More than {limit} {parent.endpoint} changed since {since}; refreshing all {endpoint}"
+                )
+                parent_ids = None
+
+        if parent_ids is None:
+            written = await self.fetch_and_process_paginated_data(ms_api, processor, endpoint, url, "", options)
+        elif parent_ids:
+            self._logger.info(
+                f"{endpoint}: refreshing children of {len(parent_ids)} {parent.endpoint} "
+                f"updated after {since}"
             )
-            
-            # Process results sequentially
-            has_data = False
-            for result in batch_results:
-                if isinstance(result, Exception):
-                    continue
-                    
-                if not result:
-                    continue
-                    
-                has_data = True
-                try:
-                    num_records = await processor.process_objects(result, BATCH_SIZE)
-                    records_count = (
-                        num_records.total_processed 
-                        if hasattr(num_records, 'total_processed')
-                        else num_records
-                    )
-                    
-                    if not isinstance(records_count, int):
-                        raise TypeError(
-                            f"Unexpected return type from process_objects: {type(records_count)}"
-                        )
-                        
-                    total_records_processed += records_count
-                    self._logger.info(
-                        f"Processed {records_count} {endpoint}. "
-                        f"Total processed: {total_records_processed}"
+            written = await self.fetch_changed_children(
+                ms_api, processor, endpoint, url, parent, parent_ids, since, options
+            )
+        else:
+            self._logger.info(f"{endpoint}: no {parent.endpoint} updated after {since}")
+            written = 0
+
+        if until is not None:
+            await sync_to_async(EndpointCheckpoint.set_last_update)(endpoint, until)
+        return written
+
+    async def fetch_changed_children(self, ms_api, processor, endpoint, url, parent: ParentLink,
+                                     parent_ids: List[Any], since, options: ImportOptions) -> int:
+        """Fetch and write the children of parent_ids, PARENT_IDS_PER_REQUEST parents per request.
+
+        Each batch of parents is one pipeline page, at its index times the page
+        size, so concurrency, progress and checkpoints work as for a feed.
+        Children of models without a primary key can't be upserted; the rows
+        of a batch's parents are deleted and rewritten in one transaction.
+        """
+        response_format = options.response_format or processor.response_format
+        select = ms_api.select_for(processor.field_mappings) if options.select else None
+        parent_mapping = processor.field_mappings[parent.field]
+        pk_mapping = processor.get_pk_mapping(processor.field_mappings)
+        # $skip needs a stable order in the rare case a batch's children fill a page
+        order_by = parent_mapping.xml_field + (f',{pk_mapping.xml_field}' if pk_mapping else '')
+        batches = [
+            parent_ids[start:start + PARENT_IDS_PER_REQUEST]
+            for start in range(0, len(parent_ids), PARENT_IDS_PER_REQUEST)
+        ]
+
+        def where(skip):
+            id_filter = ms_api.id_filter(
+                parent_mapping.xml_field, batches[skip // BATCH_SIZE],
+                parent_mapping.field_type == FieldType.UUID
+            )
+            return id_filter, order_by
+
+        async def fetch_page(skip):
+            """All of a batch's pages: the first, and any its children overflow into."""
+            if skip // BATCH_SIZE >= len(batches):
+                return None
+            offset, pages = 0, []
+            while True:
+                page = await ms_api.get_data(url, skip=offset, select=select,
+                                             response_format=response_format, where=where(skip))
+                pages.append(page)
+                if processor.data_processor.entry_count(page, response_format) < RECORDS_PER_PAGE:
+                    return skip, pages
+                offset += RECORDS_PER_PAGE
+
+        async def parse(page):
+            if self.parse_executor is None:
+                return processor.parse_page(page, response_format)
+            return await self.parse_executor.parse(type(processor), page, response_format)
+
+        async def parse_page(fetched):
+            skip, pages = fetched
+            rows, result = await parse(pages[0])
+            for page in pages[1:]:
+                more_rows, more = await parse(page)
+                rows.extend(more_rows)
+                result.total_processed += more.total_processed
+                result.successful += more.successful
+                result.failed += more.failed
+                result.errors.extend(more.errors)
+            return rows, result
+
+        replace = processor.extractor.pk_index is None
+        parent_column = parent_mapping.model_field
+
+        async def write_page(records, skip, cursor):
+            ids = batches[skip // BATCH_SIZE]
+            return await processor.write_records(
+                records, processor.model, processor.field_mappings, BATCH_SIZE, options.write_backend,
+                after_write=lambda: checkpoint.page_committed(skip, None, records),
+                before_write=(
+                    lambda: processor.model.objects.filter(**{f'{parent_column}__in': ids}).delete()
+                ) if replace else None
+            )
+
+        checkpoint = await sync_to_async(EndpointCheckpoint.start)(
+            endpoint, 'parents', since, BATCH_SIZE, None, processor.pk_is_guid()
+        )
+        pipeline = ImportPipeline(
+            self._logger,
+            endpoint,
+            fetch_page=fetch_page,
+            parse_page=parse_page,
+            write_page=write_page,
+            page_size=BATCH_SIZE,
+            fetchers=options.max_concurrent,
+            parsers=self.parse_executor.workers if self.parse_executor else 1,
+            queue_size=options.queue_size,
+            fetch_slots=self.fetch_slots,
+            write_slots=self.write_slots,
+            stop_on_short_page=False,
+        )
+        written = await pipeline.run()
+        await sync_to_async(checkpoint.finish)(pipeline.failures == 0)
+        return written
+
+    def open_checkpoint(self, endpoint, processor, pagination, latest_update, start_cursor,
+                        resume: bool) -> EndpointCheckpoint:
+        """Pick up the endpoint's unfinished run when resuming, otherwise record a new one."""
+        state = EndpointCheckpoint.load(endpoint)
+        unfinished = state is not None and state.status != state.STATUS_COMPLETED and state.pages_done
+        if unfinished and resume:
+            if state.pagination == pagination:
+                self._logger.info(
+                    f"Resuming {endpoint} run {state.run_id} after {state.pages_done} committed pages "
+                    f"(next offset {state.next_skip}, after {state.watermark})"
+                )
+                if pagination == 'skip':
+                    self._logger.warning(
+                        f"{endpoint} is paged by $skip: rows inserted, updated or deleted upstream since run "
+                        f"{state.run_id} started shift its pages, so resuming at offset {state.next_skip} can "
+                        f"miss rows; run without --resume for a gap-free read"
                     )
+                return EndpointCheckpoint.resume(
+                    state, BATCH_SIZE, processor.pk_is_guid(), processor.extractor.last_update_index
+                )
+            self._logger.warning(
+                f"Unfinished {endpoint} run {state.run_id} paged by {state.pagination}, not {pagination}; "
+                f"starting over"
+            )
+        elif unfinished:
+            self._logger.warning(
+                f"Previous {endpoint} run {state.run_id} stopped after {state.pages_done} pages; "
+                f"starting over (use --resume to continue it)"
+            )
+        return EndpointCheckpoint.start(
+            endpoint, pagination, latest_update, BATCH_SIZE, start_cursor, processor.pk_is_guid(),
+            processor.extractor.last_update_index
+        )
+
+    async def replay_cached_pages(self, processor, endpoint, url, options: ImportOptions) -> int:
+        """Parse and write the pages cached for an endpoint, in the order they were fetched.
+
+        One fetcher and one parser keep pages in cache order, so when runs
+        overlap the most recently fetched version of a row is written last.
+        """
+        pages = self.page_cache.pages(url)
+        self._logger.info(f"Replaying {len(pages)} cached {endpoint} pages")
 
-                    if records_count < BATCH_SIZE:
-                        return total_records_processed
-                        
-                except Exception as e:
-                    self._logger.error(f"Error processing batch: {str(e)}", exc_info=True)
-            
-            if not has_data:
-                return total_records_processed
-                
-            skip += BATCH_SIZE * self.current_concurrent_fetches
\ No newline at end of file
+        async def fetch_page(skip):
+            index = skip // BATCH_SIZE
+            if index >= len(pages):
+                return None
+            page = pages[index]
+            return page.response_format, await asyncio.to_thread(self.page_cache.read, page)
+
+        async def parse_page(cached):
+            response_format, data = cached
+            if self.parse_executor is None:
+                return processor.parse_page(data, response_format)
+            return await self.parse_executor.parse(type(processor), data, response_format)
+
+        async def write_page(records, skip, cursor):
+            return await processor.write_records(
+                records, processor.model, processor.field_mappings, BATCH_SIZE, options.write_backend
+            )
+
+        pipeline = ImportPipeline(
+            self._logger,
+            endpoint,
+            fetch_page=fetch_page,
+            parse_page=parse_page,
+            write_page=write_page,
+            page_size=BATCH_SIZE,
+            fetchers=1,
+            parsers=1,
+            write_slots=self.write_slots,
+            stop_on_short_page=False,
+        )
+        return await pipeline.run()
@@ -2,28 +2,171 @@ import aiohttp
 import asyncio
 import hmac
 import hashlib
+from contextlib import asynccontextmanager
 from base64 import b64decode, b64encode
-from time import time
+from dataclasses import dataclass
+from datetime import timezone
+from time import monotonic, time
+from typing import Callable, Dict, Optional
 import logging
+from collections import defaultdict
+
+from data_import.page_cache import PageCache
+from data_import.rate_limiter import TokenBucket, retry_after_seconds
+from data_import.retry import (
+    CircuitBreaker, FatalError, RetryableError, RetryPolicy, RETRYABLE_EXCEPTIONS
+)
 
-MAX_RETRIES = 5
-RETRY_DELAY = 10  # seconds to wait before retrying after a 503 error
 RECORDS_PER_PAGE = 5000
+STREAM_CHUNK_SIZE = 64 * 1024
+DEFAULT_POOL_SIZE = 16  # open connections to the API, normally sized from the concurrency settings
+DNS_CACHE_TTL = 300  # seconds a resolved API address is reused
+KEEPALIVE_TIMEOUT = 30  # seconds an idle pooled connection is kept open
+ACCEPT_ENCODING = 'gzip, deflate'
+# Media types asked for per response format; WCF Data Services answers JSON with OData v2 verbose JSON
+ACCEPT_TYPES = {
+    'atom': 'application/atom+xml',
+    'json': 'application/json',
+}
 
 logger = logging.getLogger(__name__)
 
+def format_odata_datetime(value) -> str:
+    """Format a datetime as an OData timestamp in UTC, keeping microseconds."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime('%Y-%m-%dT%H:%M:%S.%f')
+
+@dataclass(frozen=True)
+class PageCursor:
+    """Keyset position: the lastUpdate and id of the last row already fetched.
+
+    last_update is kept as the raw OData text so the full precision the API
+    returned (up to 7 fractional digits) is sent back unchanged.
+    """
+    last_update: str
+    id: Optional[str] = None
+    id_is_guid: bool = True
+
+    def filter_clause(self) -> str:
+        timestamp = f"datetime'{self.last_update}'"
+        if self.id is None:
+            return f"lastUpdate gt {timestamp}"
+        id_literal = f"guid'{self.id}'" if self.id_is_guid else self.id
+        return f"(lastUpdate gt {timestamp}) or (lastUpdate eq {timestamp} and id gt {id_literal})"
+
+class RequestSigner:
+    """Builds the MarketSharp Authorization header for a company and key pair.
+
+    The header is company:api_key:timestamp:signature, where the signature is
+    an HMAC-SHA256 of company, key and timestamp under the base64 secret. The
+    secret is decoded and keyed into an HMAC once; each signature copies that
+    HMAC instead of rebuilding it. Timestamps have one-second resolution, so
+    the header is reused for every request within the same second.
+    """
+
+    def __init__(self, company_id, api_key, secret_key):
+        self._prefix = f'{company_id}:{api_key}'
+        self._message_prefix = f'{company_id}{api_key}'.encode('utf-8')
+        self._keyed = hmac.new(b64decode(secret_key), digestmod=hashlib.sha256)
+        self._cached_ts: Optional[int] = None
+        self._cached_headers: Dict[str, str] = {}
+
+    def __repr__(self):
+        # Never show key material, even in tracebacks
+        return f'{type(self).__name__}({self._prefix.split(":", 1)[0]})'
+
+    def sign(self, ts: int) -> str:
+        h = self._keyed.copy()
+        h.update(self._message_prefix + str(ts).encode('ascii'))
+        return b64encode(h.digest()).decode('ascii')
+
+    def headers(self, ts: Optional[int] = None) -> Dict[str, str]:
+        ts = int(time()) if ts is None else ts
+        if ts != self._cached_ts:
+            self._cached_headers = {'Authorization': f'{self._prefix}:{ts}:{self.sign(ts)}'}
+            self._cached_ts = ts
+        return self._cached_headers
+
+@dataclass
+class ConnectionStats:
+    """Connection pool counters collected through aiohttp tracing."""
+    requests: int = 0
+    created: int = 0
+    reused: int = 0
+    dns_hits: int = 0
+    dns_misses: int = 0
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            self.requests += 1
+
+        async def on_connection_create_end(session, context, params):
+            self.created += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            self.reused += 1
+
+        async def on_dns_cache_hit(session, context, params):
+            self.dns_hits += 1
+
+        async def on_dns_cache_miss(session, context, params):
+            self.dns_misses += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace
+
+    def __str__(self):
+        connections = self.created + self.reused
+        reuse = self.reused / connections if connections else 0
+        return (
+            f"{self.requests} requests over {self.created} new connections, "
+            f"{self.reused} reused ({reuse:.0%}); DNS cache {self.dns_hits} hits, {self.dns_misses} misses"
+        )
+
 class MarketSharpAPI:
+    """MarketSharp OData client.
+
+    Used as an async context manager, it opens one pooled aiohttp session
+    that every request made through it shares, so keep-alive connections and
+    resolved addresses carry over between pages and endpoints. Create one
+    client per import run.
+    """
     nsmap = {
         'm': 'http://schemas.microsoft.com/ado/2007/08/dataservices/metadata',
         'd': 'http://schemas.microsoft.com/ado/2007/08/dataservices',
         'atom': 'http://www.w3.org/2005/Atom',
     }
 
-    def __init__(self, company_id, api_key, secret_key, logger=None):
+    def __init__(self, company_id, api_key, secret_key, logger=None,
+                 observer: Optional[Callable[[int, float, Optional[str]], None]] = None,
+                 rate_limiter: Optional[TokenBucket] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 page_cache: Optional[PageCache] = None):
         self._coi = company_id
-        self._api_key = api_key
-        self._secret_key = secret_key
+        self._signer = RequestSigner(company_id, api_key, secret_key)
         self._logger = logger or logging.getLogger(__name__)
+        # Told the status and latency of every response and the feed of page fetches, e.g. AIMDController.record
+        self._observer = observer
+        # Usually one bucket for the whole run, so every endpoint shares the request rate
+        self._rate_limiter = rate_limiter
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._circuit_breaker = circuit_breaker
+        self._pool_size = max(1, pool_size)
+        # Every page read through get_data is also recorded here, for import_data --replay
+        self._page_cache = page_cache
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.connection_stats = ConnectionStats()
+        # Decoded response bytes per feed URL, pages only
+        self.bytes_received: Dict[str, int] = defaultdict(int)
         if not logger:
             logging.basicConfig(level=logging.DEBUG)
 
@@ -31,62 +174,234 @@ class MarketSharpAPI:
         # Ensure the logger is properly configured
         logging.basicConfig(level=logging.INFO)
 
-    def _get_headers(self):
-        ts = int(time())
-        msg = f'{self._coi}{self._api_key}{ts}'.encode('utf-8')
-        secret_key_decoded = b64decode(self._secret_key)
+    async def __aenter__(self):
+        # Everything goes to one host, so the per-host limit is the pool size
+        connector = aiohttp.TCPConnector(
+            limit=self._pool_size,
+            limit_per_host=self._pool_size,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self._retry_policy.timeout,
+            headers={'Accept-Encoding': ACCEPT_ENCODING},
+            trace_configs=[self.connection_stats.trace_config()],
+        )
+        return self
 
-        logger.info(f"Timestamp: {ts}, Message: {msg}, Decoded Secret Key (first 4): {secret_key_decoded[:4]}...")  # Issue here
+    async def __aexit__(self, *exc_info):
+        session, self._session = self._session, None
+        if session is not None:
+            await session.close()
+            self._logger.info(f"MarketSharp connection pool summary: {self.connection_stats}")
 
-        h = self._make_hash(secret_key_decoded, msg)
-        auth = f'{self._coi}:{self._api_key}:{ts}:{h}'
-        return {'Authorization': auth}
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            raise RuntimeError("MarketSharpAPI must be entered with 'async with' before making requests")
+        return self._session
 
-    def _make_hash(self, secret_key, msg):
-        h = hmac.new(secret_key, msg, hashlib.sha256).digest()
-        return b64encode(h).decode('utf-8')
+    def _get_headers(self, response_format=None):
+        headers = self._signer.headers()
+        if response_format is None:
+            return headers
+        return {**headers, 'Accept': ACCEPT_TYPES[response_format]}
 
-    async def get_data(self, session, url, last_update=None, skip=0):
-        headers = self._get_headers()
+    def _build_filter(self, last_update=None, cursor=None, where=None):
+        """The $filter and $orderby shared by a feed's pages and its count, or (None, None).
+
+        where is an explicit (filter, orderby) pair that replaces the lastUpdate
+        filter; its filter may be None to only order the feed.
+        """
+        if where is not None:
+            return where
+        if cursor is not None:
+            # Keyset paging: no $skip, the filter itself moves past the previous page
+            return cursor.filter_clause(), 'lastUpdate,id'
         if last_update:
             # Format last_update to OData compatible string
-            last_update_str = f"datetime'{last_update.strftime('%Y-%m-%dT%H:%M:%S')}'"
-            filter_query = f"lastUpdate gt {last_update_str}"
-        else:
-            filter_query = ''
-        paginated_url = f"{url}?$top={RECORDS_PER_PAGE}&$skip={skip}"
+            last_update_str = f"datetime'{format_odata_datetime(last_update)}'"
+            return f"lastUpdate gt {last_update_str}", 'lastUpdate asc'
+        return None, None
+
+    @staticmethod
+    def select_for(field_mappings) -> str:
+        """$select list naming each property a processor's field_mappings read, in mapping order."""
+        return ','.join(dict.fromkeys(mapping.xml_field for mapping in field_mappings.values()))
+
+    @staticmethod
+    def id_filter(field, ids, is_guid=True) -> str:
+        """$filter matching entries whose field equals any of ids; OData v2 has no 'in' operator."""
+        if is_guid:
+            return ' or '.join(f"{field} eq guid'{value}'" for value in ids)
+        return ' or '.join(f"{field} eq {value}" for value in ids)
+
+    def _build_page_url(self, url, last_update=None, skip=0, cursor=None, select=None, where=None,
+                        top=RECORDS_PER_PAGE):
+        filter_query, order_by = self._build_filter(last_update, cursor, where)
+        paginated_url = f"{url}?$top={top}"
+        if cursor is None:
+            paginated_url += f"&$skip={skip}"
+        if filter_query:
+            paginated_url += f"&$filter={filter_query}"
+        if order_by:
+            paginated_url += f"&$orderby={order_by}"
+        if select:
+            # Unmapped properties (long notes, directions) are never sent
+            paginated_url += f"&$select={select}"
+        return paginated_url
+
+    def _build_count_url(self, url, last_update=None, cursor=None):
+        filter_query, _ = self._build_filter(last_update, cursor)
+        count_url = f"{url}/$count"
         if filter_query:
-            paginated_url += f"&$filter={filter_query}&$orderby=lastUpdate asc"
-        attempts = 0
-        while attempts < MAX_RETRIES:
+            count_url += f"?$filter={filter_query}"
+        return count_url
+
+    @asynccontextmanager
+    async def _attempt(self, request_url, response_format=None, feed=None):
+        """Send one request and yield its 200 response, raising a classified MarketSharpError otherwise.
+
+        Transport errors while the caller reads the body are classified too,
+        so a dropped connection mid-page is retryable like a 503. feed is the
+        feed URL when the request fetches one of its pages; only those
+        latencies are reported to the observer, per feed.
+        """
+        policy = self._retry_policy
+        if self._circuit_breaker is not None:
+            self._circuit_breaker.before_request()
+        await self._throttle()
+        self._logger.debug(f"GET {request_url}")
+        started = monotonic()
+        try:
+            response = await self.session.get(request_url, headers=self._get_headers(response_format))
+        except RETRYABLE_EXCEPTIONS as e:
+            self._record_failure()
+            raise RetryableError(f"Network error fetching {request_url}: {e!r}") from e
+        except aiohttp.ClientError as e:
+            raise FatalError(f"Request to {request_url} failed: {e!r}") from e
+
+        if response.status == 200:
             try:
-                self._logger.info(f"Attempt {attempts + 1} of {MAX_RETRIES}")
-                print("url=", paginated_url)
-                async with session.get(paginated_url, headers=headers) as response:
-                    if response.status == 200:
-                        return await response.text()  # Resetting attempts isn't necessary since we're returning
-                    elif response.status == 503:
-                        self._logger.warning(f"503 Service Unavailable. Retrying after {RETRY_DELAY} seconds...")
-                        await asyncio.sleep(RETRY_DELAY)
-                    elif response.status in (400, 404):
-                        self._logger.warning(f"{response.status}: The server encountered an error. Retrying after {RETRY_DELAY} seconds...")
-                        await asyncio.sleep(RETRY_DELAY)
-                    else:
-                        self._logger.error(f"Error {response.status}: {await response.text()}")
-                        raise Exception(f"Server error {response.status}: {await response.text()}")
-            except aiohttp.ClientError as e:
-                self._logger.error(f"Network error: {e}")
-                raise Exception(f"Network error while fetching MarketSharp data: {e}")
-            attempts += 1
-
-        raise Exception(f"Failed to fetch data from MarketSharp after {MAX_RETRIES} attempts.")
-    
-    async def get_related_data(self, session, url, record_id, relation):
-        related_url = f"{url}('{record_id}')/{relation}"
-        headers = self._get_headers()
-        async with session.get(related_url, headers=headers) as response:
-            if response.status == 200:
-                return await response.text()
+                yield response
+            except RETRYABLE_EXCEPTIONS as e:
+                self._record_failure()
+                raise RetryableError(f"Network error reading {request_url}: {e!r}") from e
             else:
-                self._logger.error(f"Error {response.status}: {await response.text()}")
-                raise Exception(f"Error fetching {relation} data for ID {record_id}")
+                self._record_success()
+            finally:
+                response.release()
+                # Latency covers the whole body, however the caller consumed it
+                self._observe(response.status, monotonic() - started, feed)
+            return
+
+        try:
+            body = await response.text()
+        except RETRYABLE_EXCEPTIONS:
+            body = ''
+        finally:
+            response.release()
+        self._observe(response.status, monotonic() - started, feed)
+
+        message = f"MarketSharp returned {response.status} for {request_url}"
+        if body.strip():
+            message += f": {body.strip()[:500]}"
+        if not policy.is_retryable_status(response.status):
+            # The API answered, so it is up even though this request is wrong
+            self._record_success()
+            raise FatalError(message, response.status)
+        self._record_failure()
+        retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+        if retry_after is not None and self._rate_limiter is not None:
+            # Everyone shares the API's limit, so everyone waits
+            self._rate_limiter.pause(retry_after)
+        raise RetryableError(message, response.status, retry_after)
+
+    async def _wait_before_retry(self, attempt: int, error: RetryableError):
+        """Sleep before the next attempt, or re-raise once the policy's attempts are used up."""
+        policy = self._retry_policy
+        if attempt >= policy.max_attempts:
+            self._logger.error(f"Giving up after {attempt} attempts: {error}")
+            raise error
+        delay = policy.backoff(attempt, error.retry_after)
+        self._logger.warning(
+            f"{error}; retrying in {delay:.1f}s (attempt {attempt + 1} of {policy.max_attempts})"
+        )
+        await asyncio.sleep(delay)
+
+    async def _request(self, request_url, consume, response_format=None, feed=None):
+        """Return await consume(response) for a 200 response, retrying retryable failures."""
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                async with self._attempt(request_url, response_format, feed) as response:
+                    return await consume(response)
+            except RetryableError as e:
+                await self._wait_before_retry(attempt, e)
+
+    def _record_success(self):
+        if self._circuit_breaker is not None:
+            self._circuit_breaker.record_success()
+
+    def _record_failure(self):
+        if self._circuit_breaker is not None:
+            self._circuit_breaker.record_failure()
+
+    async def _throttle(self):
+        if self._rate_limiter is not None:
+            await self._rate_limiter.acquire()
+
+    def _observe(self, status, seconds, feed=None):
+        if self._observer is not None:
+            self._observer(status, seconds, feed)
+
+    async def get_data(self, url, last_update=None, skip=0, cursor=None, select=None,
+                       response_format='atom', where=None, top=RECORDS_PER_PAGE) -> bytes:
+        paginated_url = self._build_page_url(url, last_update, skip, cursor, select, where, top)
+        # Raw bytes: the sanitizer and lxml both work on the undecoded payload
+        data = await self._request(paginated_url, lambda response: response.read(), response_format, feed=url)
+        self.bytes_received[url] += len(data)
+        if self._page_cache is not None:
+            # Keyed by everything after the feed URL: filter, cursor or offset, $select
+            key = paginated_url[len(url):]
+            await asyncio.to_thread(self._page_cache.put, url, key, response_format, data)
+        return data
+
+    async def iter_data(self, url, last_update=None, skip=0, chunk_size=STREAM_CHUNK_SIZE, cursor=None,
+                        select=None):
+        """Yield the raw bytes of a page as they arrive instead of buffering the whole body.
+
+        A failure is retried only until the first chunk has been handed out;
+        after that the caller has partial data and the error is raised.
+        """
+        paginated_url = self._build_page_url(url, last_update, skip, cursor, select)
+        attempt = 0
+        while True:
+            attempt += 1
+            started = False
+            try:
+                async with self._attempt(paginated_url, feed=url) as response:
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        started = True
+                        self.bytes_received[url] += len(chunk)
+                        yield chunk
+                return
+            except RetryableError as e:
+                if started:
+                    raise
+                await self._wait_before_retry(attempt, e)
+
+    async def get_count(self, url, last_update=None, cursor=None) -> int:
+        """Number of entries the feed will return, from the OData /$count resource."""
+        count_url = self._build_count_url(url, last_update, cursor)
+        text = await self._request(count_url, lambda response: response.text())
+        try:
+            return int(text.strip())
+        except ValueError:
+            raise FatalError(f"Unexpected $count response for {count_url}: {text[:100]!r}")
+
+    async def get_related_data(self, url, record_id, relation):
+        related_url = f"{url}('{record_id}')/{relation}"
+        return await self._request(related_url, lambda response: response.text())
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("data_import", "0002_contactphone"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncState",
+            fields=[
+                (
+                    "endpoint",
+                    models.CharField(max_length=100, primary_key=True, serialize=False),
+                ),
+                ("run_id", models.UUIDField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("running", "Running"),
+                            ("failed", "Failed"),
+                            ("completed", "Completed"),
+                        ],
+                        default="running",
+                        max_length=20,
+                    ),
+                ),
+                ("pagination", models.CharField(max_length=10)),
+                ("watermark", models.DateTimeField(blank=True, null=True)),
+                ("next_skip", models.IntegerField(default=0)),
+                ("done_skips", models.JSONField(blank=True, default=list)),
+                (
+                    "cursor_last_update",
+                    models.CharField(blank=True, max_length=40, null=True),
+                ),
+                ("cursor_id", models.CharField(blank=True, max_length=64, null=True)),
+                ("pages_done", models.IntegerField(default=0)),
+                ("records_written", models.IntegerField(default=0)),
+                ("started_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Sync State",
+                "verbose_name_plural": "Sync States",
+            },
+        ),
+    ]
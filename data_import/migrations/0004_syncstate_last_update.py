@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("data_import", "0003_syncstate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="syncstate",
+            name="last_update",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
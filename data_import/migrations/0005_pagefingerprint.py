@@ -0,0 +1,36 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("data_import", "0004_syncstate_last_update"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PageFingerprint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("endpoint", models.CharField(max_length=100)),
+                ("skip", models.IntegerField()),
+                ("digest", models.CharField(max_length=64)),
+                ("entries", models.IntegerField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Page Fingerprint",
+                "verbose_name_plural": "Page Fingerprints",
+                "unique_together": {("endpoint", "skip")},
+            },
+        ),
+    ]
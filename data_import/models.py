@@ -610,3 +610,59 @@ class Prospect(models.Model):
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
+
+
+class SyncState(models.Model):
+    """Import progress of one endpoint, saved in the same transaction as each page it covers."""
+    STATUS_RUNNING = 'running'
+    STATUS_FAILED = 'failed'
+    STATUS_COMPLETED = 'completed'
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_COMPLETED, 'Completed'),
+    ]
+
+    endpoint = models.CharField(max_length=100, primary_key=True)
+    run_id = models.UUIDField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    pagination = models.CharField(max_length=10)
+    # The lastUpdate filter the run started from; a resumed run must reuse it for its offsets to line up
+    watermark = models.DateTimeField(blank=True, null=True)
+    # Every page before this offset is committed; done_skips lists committed pages after it
+    next_skip = models.IntegerField(default=0)
+    done_skips = models.JSONField(default=list, blank=True)
+    # Keyset position after the last contiguously committed page
+    cursor_last_update = models.CharField(max_length=40, blank=True, null=True)
+    cursor_id = models.CharField(max_length=64, blank=True, null=True)
+    pages_done = models.IntegerField(default=0)
+    records_written = models.IntegerField(default=0)
+    # Newest lastUpdate committed for the endpoint by any run, kept across runs
+    last_update = models.DateTimeField(blank=True, null=True)
+    started_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Sync State"
+        verbose_name_plural = "Sync States"
+
+    def __str__(self):
+        return f"{self.endpoint}: {self.status}, {self.pages_done} pages"
+
+
+class PageFingerprint(models.Model):
+    """Digest of a full-refresh endpoint's page as last committed, so an unchanged page can be skipped."""
+    endpoint = models.CharField(max_length=100)
+    skip = models.IntegerField()
+    digest = models.CharField(max_length=64)
+    # Entries on the page; a skipped page still tells the pipeline whether it was the last one
+    entries = models.IntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Page Fingerprint"
+        verbose_name_plural = "Page Fingerprints"
+        unique_together = ('endpoint', 'skip')
+
+    def __str__(self):
+        return f"{self.endpoint} page at {self.skip}: {self.digest[:12]}"
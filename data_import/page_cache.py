@@ -0,0 +1,128 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List
+
+DEFAULT_COMPRESS_LEVEL = 6
+INDEX_SUFFIX = '.jsonl'
+
+
+def feed_name(url: str) -> str:
+    """Entity set a feed URL points at, e.g. 'Activities'; cache entries are grouped by it."""
+    return url.rstrip('/').rsplit('/', 1)[-1]
+
+
+@dataclass(frozen=True)
+class CachedPage:
+    key: str
+    response_format: str
+    digest: str
+
+
+class PageCache:
+    """Raw MarketSharp pages stored on local disk, gzip-compressed and content-addressed.
+
+    Page bodies live under objects/ named by the SHA-256 of their bytes, so a
+    page fetched twice is stored once. Each feed has an append-only index,
+    index/<feed>.jsonl, mapping the request that produced a page (its filter,
+    cursor or offset, $select and format) to the body's digest. A later
+    fetch of the same request replaces the earlier mapping but keeps its
+    position, so replay visits pages in the order they were first fetched.
+
+    Writes go to a temporary file that is renamed into place, so an
+    interrupted run never leaves a truncated page behind.
+    """
+
+    def __init__(self, directory, logger: logging.Logger, compress_level: int = DEFAULT_COMPRESS_LEVEL):
+        self.directory = Path(directory)
+        self.logger = logger
+        self.compress_level = compress_level
+        self.objects_dir = self.directory / 'objects'
+        self.index_dir = self.directory / 'index'
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self._index_lock = threading.Lock()
+
+        self.pages_written = 0
+        self.pages_deduplicated = 0
+        self.pages_read = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / f'{digest}.gz'
+
+    def _index_path(self, feed: str) -> Path:
+        return self.index_dir / f'{feed}{INDEX_SUFFIX}'
+
+    def _write_atomic(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def put(self, url: str, key: str, response_format: str, data: bytes) -> str:
+        """Store one page fetched from the feed at url under its request key; returns the digest.
+
+        Blocking (hashing, compression, disk); call it from a worker thread.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if path.exists():
+            self.pages_deduplicated += 1
+        else:
+            compressed = gzip.compress(data, compresslevel=self.compress_level)
+            self._write_atomic(path, compressed)
+            self.raw_bytes += len(data)
+            self.stored_bytes += len(compressed)
+            self.pages_written += 1
+
+        line = json.dumps({'key': key, 'format': response_format, 'digest': digest})
+        with self._index_lock, open(self._index_path(feed_name(url)), 'a', encoding='utf-8') as index:
+            index.write(line + '\n')
+        return digest
+
+    def pages(self, url: str) -> List[CachedPage]:
+        """Every cached page of the feed at url, latest body per request, in first-fetch order."""
+        path = self._index_path(feed_name(url))
+        if not path.exists():
+            return []
+        entries: Dict[str, CachedPage] = {}
+        with open(path, encoding='utf-8') as index:
+            for line in index:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line from a killed run; everything before it is intact
+                    continue
+                entries[record['key']] = CachedPage(record['key'], record['format'], record['digest'])
+        return list(entries.values())
+
+    def read(self, page: CachedPage) -> bytes:
+        """Decompressed body of a cached page. Blocking; call it from a worker thread."""
+        with open(self._object_path(page.digest), 'rb') as page_file:
+            data = gzip.decompress(page_file.read())
+        self.pages_read += 1
+        return data
+
+    def log_summary(self):
+        if self.pages_written or self.pages_deduplicated:
+            ratio = self.stored_bytes / self.raw_bytes if self.raw_bytes else 0
+            self.logger.info(
+                f"Page cache {self.directory}: {self.pages_written} pages stored, "
+                f"{self.pages_deduplicated} already cached; "
+                f"{self.raw_bytes / 1024 / 1024:.1f} MB of new pages compressed to {ratio:.0%}"
+            )
+        if self.pages_read:
+            self.logger.info(f"Page cache {self.directory}: {self.pages_read} pages replayed")
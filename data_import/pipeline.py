@@ -0,0 +1,386 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from multiprocessing import get_context
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from data_import.base_processor import ProcessingResult
+from data_import.data_processor import DataProcessor
+
+DEFAULT_QUEUE_SIZE = 4
+PARSE_EXECUTORS = ('thread', 'process')
+DEFAULT_PARSE_WORKERS = min(4, os.cpu_count() or 1)
+SAMPLE_INTERVAL = 1  # seconds between queue depth samples
+MONITOR_INTERVAL = 30  # seconds between queue depth log lines
+
+# Marks the end of a queue for the stage reading it
+DONE = object()
+
+Rows = List[Tuple[Any, ...]]
+ParsedPage = Tuple[Rows, ProcessingResult]
+
+
+# One processor per worker thread (and so per process), created on first use
+_worker_state = threading.local()
+
+
+def _init_parse_worker():
+    # Spawned workers start without Django, and processor modules import models
+    import django
+    django.setup()
+
+
+def parse_page_rows(processor_class: type, xml_data: bytes, response_format: str = 'atom') -> ParsedPage:
+    """Executor entry point: parse one raw page into row tuples using processor_class's mappings."""
+    processors = getattr(_worker_state, 'processors', None)
+    if processors is None:
+        processors = _worker_state.processors = {}
+    processor = processors.get(processor_class)
+    if processor is None:
+        logger = logging.getLogger(__name__)
+        processor = processor_class(logger, DataProcessor(logger))
+        processors[processor_class] = processor
+    return processor.parse_page(xml_data, response_format)
+
+
+class ParseExecutor:
+    """Thread or process pool that runs the parse stage off the event loop.
+
+    Pages go in as raw bytes and come back as compact row tuples, which keeps
+    pickling cheap for the process pool. Threads overlap with lxml's GIL-free
+    parsing; processes use every core for extraction as well.
+    """
+
+    def __init__(self, kind: str = 'thread', workers: int = DEFAULT_PARSE_WORKERS):
+        if kind not in PARSE_EXECUTORS:
+            raise ValueError(f"Unknown parse executor {kind!r}, expected one of {PARSE_EXECUTORS}")
+        self.kind = kind
+        self.workers = max(1, workers)
+        if kind == 'process':
+            self.executor = ProcessPoolExecutor(
+                self.workers,
+                mp_context=get_context('spawn'),
+                initializer=_init_parse_worker
+            )
+        else:
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='parse')
+
+    async def parse(self, processor_class: type, xml_data: bytes, response_format: str = 'atom') -> ParsedPage:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, parse_page_rows, processor_class, xml_data, response_format
+        )
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+@dataclass
+class StageStats:
+    busy_seconds: float = 0.0
+    items: int = 0
+    failures: int = 0
+
+
+@dataclass
+class QueueStats:
+    samples: int = 0
+    total_depth: int = 0
+    max_depth: int = 0
+
+    def sample(self, depth: int):
+        self.samples += 1
+        self.total_depth += depth
+        self.max_depth = max(self.max_depth, depth)
+
+    @property
+    def average_depth(self) -> float:
+        return self.total_depth / self.samples if self.samples else 0.0
+
+
+class ImportPipeline:
+    """Fetch, parse and write stages for one endpoint, connected by bounded queues."""
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        name: str,
+        fetch_page: Callable[[int], Awaitable[Any]],
+        parse_page: Optional[Callable[[Any], Awaitable[ParsedPage]]],
+        write_page: Callable[[Rows, int, Any], Awaitable[int]],
+        page_size: int,
+        fetchers: int,
+        parsers: int = 1,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        monitor_interval: float = MONITOR_INTERVAL,
+        keyset: bool = False,
+        start_cursor: Any = None,
+        fetch_slots: Optional[asyncio.Semaphore] = None,
+        write_slots: Optional[asyncio.Semaphore] = None,
+        total: Optional[int] = None,
+        stop_on_short_page: bool = True,
+        start_skip: int = 0,
+        done_skips: Iterable[int] = (),
+    ):
+        self.logger = logger
+        self.name = name
+        self.fetch_page = fetch_page
+        # None when fetch_page returns parsed pages itself (streaming mode)
+        self.parse_page = parse_page
+        self.write_page = write_page
+        self.page_size = page_size
+        self.fetchers = max(1, fetchers)
+        self.parsers = max(1, parsers)
+        self.queue_size = queue_size
+        self.monitor_interval = monitor_interval
+        # A single fetcher calls fetch_page(cursor) -> (page, next_cursor) until next_cursor is None
+        self.keyset = keyset
+        self.cursor = start_cursor
+        self.fetch_slots = fetch_slots or nullcontext()
+        self.write_slots = write_slots or nullcontext()
+        # With a known total, offsets stop at it and progress is logged with every page
+        self.total = total
+        # Replayed pages may come from several runs, so a short one need not be the last
+        self.stop_on_short_page = stop_on_short_page
+
+        self.parse_queue: Optional[asyncio.Queue] = None
+        self.write_queue: Optional[asyncio.Queue] = None
+        self.fetch_stats = StageStats()
+        self.parse_stats = StageStats()
+        self.write_stats = StageStats()
+        self.parse_queue_stats = QueueStats()
+        self.write_queue_stats = QueueStats()
+        self.in_flight = 0
+        self.total_written = 0
+        self.started: Optional[float] = None
+
+        # A resumed run starts at the first uncommitted offset and skips those committed beyond it
+        self._next_skip = start_skip
+        self._done_skips = set(done_skips)
+        # Pages committed by an earlier run count toward progress against the feed's total
+        self.entries_done = 0 if keyset else start_skip + len(self._done_skips) * page_size
+        self._cursor_after: Dict[int, Any] = {}
+        self._end_skip: Optional[int] = None
+        self._consecutive_failures = 0
+        self._consecutive_parse_failures = 0
+
+    def queue_depths(self) -> Dict[str, int]:
+        """Current number of in-flight fetches and pages waiting in each queue."""
+        return {
+            'fetching': self.in_flight,
+            'parse_queue': self.parse_queue.qsize() if self.parse_queue else 0,
+            'write_queue': self.write_queue.qsize() if self.write_queue else 0,
+        }
+
+    async def run(self) -> int:
+        """Run all stages to completion and return the number of records written."""
+        self.parse_queue = asyncio.Queue(self.queue_size)
+        self.write_queue = asyncio.Queue(self.queue_size)
+        self.started = time.monotonic()
+        if self.total is not None and not self.keyset:
+            self._mark_end(self.total)
+
+        if self.keyset:
+            fetch_tasks = [asyncio.create_task(self._keyset_fetch_worker())]
+        else:
+            fetch_tasks = [asyncio.create_task(self._fetch_worker()) for _ in range(self.fetchers)]
+        parse_tasks = (
+            [asyncio.create_task(self._parse_worker()) for _ in range(self.parsers)]
+            if self.parse_page else []
+        )
+        write_task = asyncio.create_task(self._write_worker())
+        monitor_task = asyncio.create_task(self._monitor())
+
+        try:
+            await asyncio.gather(*fetch_tasks)
+            for _ in parse_tasks:
+                await self.parse_queue.put(DONE)
+            await asyncio.gather(*parse_tasks)
+            await self.write_queue.put(DONE)
+            await write_task
+        finally:
+            monitor_task.cancel()
+            for task in (*fetch_tasks, *parse_tasks, write_task):
+                task.cancel()
+
+        self.log_summary()
+        return self.total_written
+
+    def progress(self) -> str:
+        """Entries done out of the total, with a linear ETA, or '' when the total is unknown."""
+        if not self.total:
+            return ''
+        done = self.entries_done
+        text = f" [{done}/{self.total} entries, {min(done / self.total, 1):.0%}"
+        if done:
+            elapsed = time.monotonic() - self.started
+            remaining = max(self.total - done, 0) * elapsed / done
+            text += f", ETA {timedelta(seconds=round(remaining))}"
+        return text + ']'
+
+    @property
+    def failures(self) -> int:
+        return self.fetch_stats.failures + self.parse_stats.failures + self.write_stats.failures
+
+    def _claim_skip(self) -> Optional[int]:
+        while self._next_skip in self._done_skips:
+            self._next_skip += self.page_size
+        if self._end_skip is not None and self._next_skip >= self._end_skip:
+            return None
+        skip = self._next_skip
+        self._next_skip += self.page_size
+        return skip
+
+    def _mark_end(self, end_skip: int):
+        if self._end_skip is None or end_skip < self._end_skip:
+            self._end_skip = end_skip
+
+    def _is_past_end(self, skip: int) -> bool:
+        return self._end_skip is not None and skip >= self._end_skip
+
+    def _note_entries(self, skip: int, entries: int) -> bool:
+        """Record where the feed ends and return whether the page has anything to write."""
+        # A short page is the last one; nothing after it needs fetching
+        if self.stop_on_short_page and entries < self.page_size:
+            self._mark_end(skip + self.page_size if entries else skip)
+        return entries > 0
+
+    async def _fetch_worker(self):
+        while (skip := self._claim_skip()) is not None:
+            async with self.fetch_slots:
+                # The end may have been found while this offset waited for a slot
+                if self._is_past_end(skip):
+                    continue
+                self.in_flight += 1
+                start = time.monotonic()
+                try:
+                    page = await self.fetch_page(skip)
+                except Exception as e:
+                    self.fetch_stats.failures += 1
+                    self._consecutive_failures += 1
+                    self.logger.error(f"Error fetching {self.name} page (skip={skip}): {str(e)}")
+                    # Every fetcher failing in a row means the API is gone; stop dispatching
+                    if self._consecutive_failures >= self.fetchers:
+                        self._mark_end(skip)
+                    continue
+                finally:
+                    self.in_flight -= 1
+                    self.fetch_stats.busy_seconds += time.monotonic() - start
+            self._consecutive_failures = 0
+            self.fetch_stats.items += 1
+            await self._dispatch(skip, page)
+
+    async def _keyset_fetch_worker(self):
+        skip = self._next_skip
+        while not self._is_past_end(skip):
+            async with self.fetch_slots:
+                self.in_flight += 1
+                start = time.monotonic()
+                try:
+                    page, next_cursor = await self.fetch_page(self.cursor)
+                except Exception as e:
+                    # Pages after this one depend on its cursor, so the feed cannot continue
+                    self.fetch_stats.failures += 1
+                    self.logger.error(f"Error fetching {self.name} page after {self.cursor}: {str(e)}")
+                    return
+                finally:
+                    self.in_flight -= 1
+                    self.fetch_stats.busy_seconds += time.monotonic() - start
+            self.fetch_stats.items += 1
+
+            if next_cursor is None:
+                return
+            self._cursor_after[skip] = next_cursor
+            await self._dispatch(skip, page)
+            self.cursor = next_cursor
+            skip += self.page_size
+
+    async def _dispatch(self, skip: int, page: Any):
+        """Hand a fetched page to the parse stage, or straight to the writer if already parsed."""
+        if self.parse_page:
+            if not page:
+                self._mark_end(skip)
+                return
+            await self.parse_queue.put((skip, page))
+        else:
+            rows, result = page
+            if self._note_entries(skip, result.total_processed):
+                await self.write_queue.put((skip, rows, result))
+
+    async def _parse_worker(self):
+        while (item := await self.parse_queue.get()) is not DONE:
+            skip, page = item
+            if self._is_past_end(skip):
+                continue
+            start = time.monotonic()
+            try:
+                rows, result = await self.parse_page(page)
+            except Exception as e:
+                self.parse_stats.failures += 1
+                self._consecutive_parse_failures += 1
+                self.logger.error(f"Error parsing {self.name} page (skip={skip}): {str(e)}", exc_info=True)
+                # Unparseable pages never reveal where the feed ends; don't fetch forever
+                if self._consecutive_parse_failures >= max(self.fetchers, self.parsers):
+                    self._mark_end(skip)
+                continue
+            finally:
+                self.parse_stats.busy_seconds += time.monotonic() - start
+            self._consecutive_parse_failures = 0
+            self.parse_stats.items += 1
+            if self._note_entries(skip, result.total_processed):
+                await self.write_queue.put((skip, rows, result))
+
+    async def _write_worker(self):
+        while (item := await self.write_queue.get()) is not DONE:
+            skip, rows, result = item
+            async with self.write_slots:
+                start = time.monotonic()
+                try:
+                    written = await self.write_page(rows, skip, self._cursor_after.pop(skip, None))
+                except Exception as e:
+                    self.write_stats.failures += 1
+                    self.logger.error(f"Error processing batch: {str(e)}", exc_info=True)
+                    continue
+                finally:
+                    self.write_stats.busy_seconds += time.monotonic() - start
+            self.write_stats.items += 1
+            self.total_written += written
+            self.entries_done += result.total_processed
+            self.logger.info(
+                f"Processed {written} {self.name}. "
+                f"Total processed: {self.total_written}{self.progress()}"
+            )
+
+    async def _monitor(self):
+        elapsed = 0.0
+        while True:
+            await asyncio.sleep(SAMPLE_INTERVAL)
+            elapsed += SAMPLE_INTERVAL
+            depths = self.queue_depths()
+            self.parse_queue_stats.sample(depths['parse_queue'])
+            self.write_queue_stats.sample(depths['write_queue'])
+            if elapsed >= self.monitor_interval:
+                elapsed = 0.0
+                self.logger.info(
+                    f"{self.name} pipeline: fetching={depths['fetching']} "
+                    f"parse_queue={depths['parse_queue']}/{self.queue_size} "
+                    f"write_queue={depths['write_queue']}/{self.queue_size} "
+                    f"written={self.total_written}{self.progress()}"
+                )
+
+    def log_summary(self):
+        self.logger.info(
+            f"{self.name} pipeline summary: "
+            f"fetch {self.fetch_stats.items} pages in {self.fetch_stats.busy_seconds:.1f}s busy "
+            f"({self.fetch_stats.failures} failed), "
+            f"parse {self.parse_stats.items} pages in {self.parse_stats.busy_seconds:.1f}s busy, "
+            f"write {self.write_stats.items} pages in {self.write_stats.busy_seconds:.1f}s busy; "
+            f"parse_queue avg {self.parse_queue_stats.average_depth:.1f} max {self.parse_queue_stats.max_depth}, "
+            f"write_queue avg {self.write_queue_stats.average_depth:.1f} max {self.write_queue_stats.max_depth}"
+        )
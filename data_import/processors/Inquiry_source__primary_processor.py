@@ -11,14 +11,11 @@ def register_processor(registry: ProcessorRegistry):
     )
 
 class InquirySourcePrimaryProcessor(BaseProcessor):
+    model = InquirySourcePrimary
+
     field_mappings = {
         'id': FieldMapping('id', 'id', 'uuid', required=True, is_primary_key=True),
         'name': FieldMapping('name', 'name', 'string'),
         'is_active': FieldMapping('isActive', 'is_active', 'boolean', default=True),
         'company_id': FieldMapping('companyId', 'company_id', 'int'),
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        """Process InquirySourcePrimary objects using shared logic in BaseProcessor."""
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, InquirySourcePrimary, self.field_mappings, batch_size)
@@ -11,6 +11,8 @@ def register_processor(registry: ProcessorRegistry):
     )
 
 class ActivityProcessor(BaseProcessor):
+    model = Activity
+
     field_mappings = {
         'id': FieldMapping('id', 'id', 'uuid', required=True, is_primary_key=True),
         'contact_id': FieldMapping('contactId', 'contact_id', 'uuid'),
@@ -33,8 +35,3 @@ class ActivityProcessor(BaseProcessor):
         'activity_result_id': FieldMapping('activityResultId', 'activity_result_id', 'int'),
         'activity_reference_id': FieldMapping('activityReferenceId', 'activity_reference_id', 'int')
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        """Process activity objects using the shared logic in BaseProcessor."""
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, Activity, self.field_mappings, batch_size)
\ No newline at end of file
@@ -11,6 +11,8 @@ def register_processor(registry: ProcessorRegistry):
     )
 
 class ActivityReferenceProcessor(BaseProcessor):
+    model = ActivityReference
+
     field_mappings = {
         'id': FieldMapping('id', 'id', 'int', required=True, is_primary_key=True),
         'company_id': FieldMapping('companyId', 'company_id', 'int'),
@@ -23,8 +25,3 @@ class ActivityReferenceProcessor(BaseProcessor):
         'last_update_by': FieldMapping('lastUpdateBy', 'last_update_by', 'uuid'),
         'last_update_utc': FieldMapping('lastUpdateUtc', 'last_update_utc', 'datetime'),
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        """Process ActivityReference objects using shared logic in BaseProcessor."""
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, ActivityReference, self.field_mappings, batch_size)
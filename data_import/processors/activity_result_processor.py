@@ -11,6 +11,8 @@ def register_processor(registry: ProcessorRegistry):
     )
 
 class ActivityResultProcessor(BaseProcessor):
+    model = ActivityResult
+
     field_mappings = {
         'id': FieldMapping('id', 'id', 'int', required=True, is_primary_key=True),
         'company_id': FieldMapping('companyId', 'company_id', 'int'),
@@ -27,8 +29,3 @@ class ActivityResultProcessor(BaseProcessor):
         'count_as_appt_created': FieldMapping('countAsApptCreated', 'count_as_appt_created', 'boolean', default=False),
         'count_as_contacted': FieldMapping('countAsContacted', 'count_as_contacted', 'boolean', default=False),
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        """Process ActivityResult objects using shared logic in BaseProcessor."""
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, ActivityResult, self.field_mappings, batch_size)
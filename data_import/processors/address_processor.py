@@ -1,16 +1,20 @@
 from data_import.models import Address
 from data_import.base_processor import BaseProcessor, FieldMapping
-from data_import.registry import ProcessorRegistry
+from data_import.registry import ParentLink, ProcessorRegistry
 
 def register_processor(registry: ProcessorRegistry):
     registry.register(
         endpoint='addresses',
         api_url='https://api4.marketsharpm.com/WcfDataService.svc/Addresses',
         model=Address,
-        processor_class=AddressProcessor
+        processor_class=AddressProcessor,
+        depends_on=('contacts',),
+        parent=ParentLink('contacts', 'contact_id')
     )
 
 class AddressProcessor(BaseProcessor):
+    model = Address
+
     field_mappings = {
         'id': FieldMapping('id', 'id', 'uuid', required=True, is_primary_key=True),
         'contact_id': FieldMapping('contactId', 'contact_id', 'uuid'),
@@ -30,8 +34,3 @@ class AddressProcessor(BaseProcessor):
         'bar_code': FieldMapping('barCode', 'bar_code', 'string'),
         'is_active': FieldMapping('isActive', 'is_active', 'boolean', default=True),
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        """Process Address objects using shared logic in BaseProcessor."""
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, Address, self.field_mappings, batch_size)
@@ -11,6 +11,8 @@ def register_processor(registry: ProcessorRegistry):
     )
 
 class AppointmentProcessor(BaseProcessor):
+    model = Appointment
+
     field_mappings = {
         'id': FieldMapping('id', 'id', 'uuid', required=True, is_primary_key=True),
         'inquiry_id': FieldMapping('inquiryId', 'inquiry_id', 'uuid'),
@@ -31,8 +33,3 @@ class AppointmentProcessor(BaseProcessor):
         'last_update': FieldMapping('lastUpdate', 'last_update', 'datetime'),
         'created_date': FieldMapping('createdDate', 'created_date', 'datetime'),
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        """Process Appointment objects using shared logic in BaseProcessor."""
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, Appointment, self.field_mappings, batch_size)
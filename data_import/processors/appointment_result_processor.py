@@ -11,6 +11,8 @@ def register_processor(registry: ProcessorRegistry):
     )
 
 class AppointmentResultProcessor(BaseProcessor):
+    model = AppointmentResult
+
     field_mappings = {
         'id': FieldMapping('id', 'id', 'uuid', required=True, is_primary_key=True),
         'name': FieldMapping('name', 'name', 'string'),
@@ -18,8 +20,3 @@ class AppointmentResultProcessor(BaseProcessor):
         'sold': FieldMapping('sold', 'sold', 'boolean', default=False),
         'is_active': FieldMapping('isActive', 'is_active', 'boolean', default=True),
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        """Process AppointmentResult objects using shared logic in BaseProcessor."""
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, AppointmentResult, self.field_mappings, batch_size)
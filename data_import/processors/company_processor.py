@@ -11,6 +11,8 @@ def register_processor(registry: ProcessorRegistry):
     )
 
 class CompanyProcessor(BaseProcessor):
+    model = Company
+
     field_mappings = {
         'id': FieldMapping('id', 'id', 'int', required=True, is_primary_key=True),
         'number': FieldMapping('number', 'number', 'int'),
@@ -29,8 +31,3 @@ class CompanyProcessor(BaseProcessor):
         'fax': FieldMapping('fax', 'fax', 'string'),
         'time_zone': FieldMapping('timeZone', 'time_zone', 'string'),
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        """Process Company objects using shared logic in BaseProcessor."""
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, Company, self.field_mappings, batch_size)
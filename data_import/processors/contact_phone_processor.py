@@ -1,16 +1,20 @@
 from data_import.models import ContactPhone
 from data_import.base_processor import BaseProcessor, FieldMapping
-from data_import.registry import ProcessorRegistry
+from data_import.registry import ParentLink, ProcessorRegistry
 
 def register_processor(registry: ProcessorRegistry):
     registry.register(
         endpoint='contact_phones',
         api_url='https://api4.marketsharpm.com/WcfDataService.svc/ContactPhones',
         model=ContactPhone,
-        processor_class=ContactPhoneProcessor
+        processor_class=ContactPhoneProcessor,
+        depends_on=('contacts',),
+        parent=ParentLink('contacts', 'contact_id')
     )
 
 class ContactPhoneProcessor(BaseProcessor):
+    model = ContactPhone
+
     field_mappings = {
         'contact_id': FieldMapping('contactId', 'contact_id', 'uuid', required=True),
         'assistant_phone': FieldMapping('assistantPhone', 'assistant_phone', 'string'),
@@ -28,8 +32,3 @@ class ContactPhoneProcessor(BaseProcessor):
         'cell_phone2': FieldMapping('cellPhone2', 'cell_phone2', 'string'),
         'other_phone2': FieldMapping('otherPhone2', 'other_phone2', 'string'),
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, ContactPhone, self.field_mappings, batch_size)
-         
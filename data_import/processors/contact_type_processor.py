@@ -11,14 +11,11 @@ def register_processor(registry: ProcessorRegistry):
     )
 
 class ContactTypeProcessor(BaseProcessor):
+    model = ContactType
+
     field_mappings = {
         'id': FieldMapping('id', 'id', 'uuid', required=True, is_primary_key=True),
         'contact_id': FieldMapping('contactId', 'contact_id', 'uuid'),
         'contact_type': FieldMapping('contactType', 'contact_type', 'string'),
         'is_active': FieldMapping('isActive', 'is_active', 'boolean', default=True),
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        """Process ContactType objects using shared logic in BaseProcessor."""
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, ContactType, self.field_mappings, batch_size)
@@ -11,6 +11,9 @@ def register_processor(registry: ProcessorRegistry):
     )
 
 class CustomerProcessor(BaseProcessor):
+    model = Customer
+    write_backend = 'copy'
+
     field_mappings = {
         'id': FieldMapping('id', 'id', 'uuid', required=True, is_primary_key=True),
         'company_id': FieldMapping('companyId', 'company_id', 'int'),
@@ -55,8 +58,3 @@ class CustomerProcessor(BaseProcessor):
         'qb_name': FieldMapping('qbName', 'qb_name', 'string'),
         'created_date': FieldMapping('createdDate', 'created_date', 'datetime'),
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        """Process Customer objects using shared logic in BaseProcessor."""
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, Customer, self.field_mappings, batch_size)
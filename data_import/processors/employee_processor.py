@@ -11,6 +11,8 @@ def register_processor(registry: ProcessorRegistry):
     )
 
 class EmployeeProcessor(BaseProcessor):
+    model = Employee
+
     field_mappings = {
         'id': FieldMapping('id', 'id', 'uuid', required=True, is_primary_key=True),
         'name': FieldMapping('name', 'name', 'string'),
@@ -18,8 +20,3 @@ class EmployeeProcessor(BaseProcessor):
         'last_update': FieldMapping('lastUpdate', 'last_update', 'datetime'),
         'company_id': FieldMapping('companyId', 'company_id', 'int'),
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        """Process Employee objects using shared logic in BaseProcessor."""
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, Employee, self.field_mappings, batch_size)
@@ -11,6 +11,8 @@ def register_processor(registry: ProcessorRegistry):
     )
 
 class InquiryProcessor(BaseProcessor):
+    model = Inquiry
+
     field_mappings = {
         'id': FieldMapping('id', 'id', 'uuid', required=True, is_primary_key=True),
         'contact_id': FieldMapping('contactId', 'contact_id', 'uuid'),
@@ -39,8 +41,3 @@ class InquiryProcessor(BaseProcessor):
         'created_by': FieldMapping('createdBy', 'created_by', 'string'),
         'created_date': FieldMapping('createdDate', 'created_date', 'datetime'),
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        """Process Inquiry objects using shared logic in BaseProcessor."""
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, Inquiry, self.field_mappings, batch_size)
@@ -11,6 +11,8 @@ def register_processor(registry: ProcessorRegistry):
     )
 
 class InquirySourceSecondaryProcessor(BaseProcessor):
+    model = InquirySourceSecondary
+
     field_mappings = {
         'id': FieldMapping('id', 'id', 'uuid', required=True, is_primary_key=True),
         'inquiry_source_primary_id': FieldMapping('inquirySourcePrimaryId', 'inquiry_source_primary_id', 'uuid'),
@@ -18,8 +20,3 @@ class InquirySourceSecondaryProcessor(BaseProcessor):
         'is_active': FieldMapping('isActive', 'is_active', 'boolean', default=True),
         'company_id': FieldMapping('companyId', 'company_id', 'int'),
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        """Process InquirySourceSecondary objects using shared logic in BaseProcessor."""
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, InquirySourceSecondary, self.field_mappings, batch_size)
@@ -11,6 +11,8 @@ def register_processor(registry: ProcessorRegistry):
     )
 
 class InquiryStatusProcessor(BaseProcessor):
+    model = InquiryStatus
+
     field_mappings = {
         'id': FieldMapping('id', 'id', 'int', required=True, is_primary_key=True),
         'company_id': FieldMapping('companyId', 'company_id', 'int'),
@@ -21,8 +23,3 @@ class InquiryStatusProcessor(BaseProcessor):
         'created_by': FieldMapping('createdBy', 'created_by', 'string'),
         'created_date_utc': FieldMapping('createdDateUtc', 'created_date_utc', 'datetime'),
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        """Process InquiryStatus objects using shared logic in BaseProcessor."""
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, InquiryStatus, self.field_mappings, batch_size)
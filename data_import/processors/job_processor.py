@@ -11,6 +11,8 @@ def register_processor(registry: ProcessorRegistry):
     )
 
 class JobProcessor(BaseProcessor):
+    model = Job
+
     field_mappings = {
         'id': FieldMapping('id', 'id', 'uuid', required=True, is_primary_key=True),
         'contact_id': FieldMapping('contactId', 'contact_id', 'uuid'),
@@ -37,8 +39,3 @@ class JobProcessor(BaseProcessor):
         'created_date': FieldMapping('createdDate', 'created_date', 'datetime'),
         'exported_to_guild_quality': FieldMapping('exportedToGuildQuality', 'exported_to_guild_quality', 'boolean', default=False),
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        """Process Job objects using shared logic in BaseProcessor."""
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, Job, self.field_mappings, batch_size)
@@ -11,6 +11,8 @@ def register_processor(registry: ProcessorRegistry):
     )
 
 class ProductDetailProcessor(BaseProcessor):
+    model = ProductDetail
+
     field_mappings = {
         'id': FieldMapping('id', 'id', 'uuid', required=True, is_primary_key=True),
         'product_type_id': FieldMapping('productTypeId', 'product_type_id', 'uuid'),
@@ -18,8 +20,3 @@ class ProductDetailProcessor(BaseProcessor):
         'is_active': FieldMapping('isActive', 'is_active', 'boolean', default=True),
         'company_id': FieldMapping('companyId', 'company_id', 'int'),
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        """Process ProductDetail objects using shared logic in BaseProcessor."""
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, ProductDetail, self.field_mappings, batch_size)
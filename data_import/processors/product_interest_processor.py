@@ -1,16 +1,20 @@
 from data_import.models import ProductInterest
 from data_import.base_processor import BaseProcessor, FieldMapping
-from data_import.registry import ProcessorRegistry
+from data_import.registry import ParentLink, ProcessorRegistry
 
 def register_processor(registry: ProcessorRegistry):
     registry.register(
         endpoint='product_interests',
         api_url='https://api4.marketsharpm.com/WcfDataService.svc/ProductInterests',
         model=ProductInterest,
-        processor_class=ProductInterestProcessor
+        processor_class=ProductInterestProcessor,
+        depends_on=('inquiries',),
+        parent=ParentLink('inquiries', 'inquiry_id')
     )
 
 class ProductInterestProcessor(BaseProcessor):
+    model = ProductInterest
+
     field_mappings = {
         'id': FieldMapping('id', 'id', 'uuid', required=True, is_primary_key=True),
         'inquiry_id': FieldMapping('inquiryId', 'inquiry_id', 'uuid'),
@@ -20,8 +24,3 @@ class ProductInterestProcessor(BaseProcessor):
         'is_active': FieldMapping('isActive', 'is_active', 'boolean', default=True),
         'last_update': FieldMapping('lastUpdate', 'last_update', 'datetime'),
     }
-
-    async def process_objects(self, xml_data: str, batch_size: int) -> int:
-        """Process ProductInterest objects using shared logic in BaseProcessor."""
-        entries = self.data_processor.parse_xml(xml_data)
-        return await self.process_entries(entries, ProductInterest, self.field_mappings, batch_size)
@@ -0,0 +1,73 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+DEFAULT_RATE = 5.0  # requests per second across the whole process
+DEFAULT_BURST = 10
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header, given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """Token-bucket limit on MarketSharp requests, shared by every caller in the process.
+
+    Tokens refill at `rate` per second up to `burst`; each request takes one.
+    When the API answers with Retry-After, pause() holds every request back
+    until that time, not just the one that was refused. Waiters are served in
+    arrival order.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waited = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            started = time.monotonic()
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+            self.waited += time.monotonic() - started
+
+    def pause(self, seconds: float):
+        """Hold back all requests for the next `seconds`, e.g. from a Retry-After header."""
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + seconds)
+        # Resume from an empty bucket rather than bursting straight back in
+        self.tokens = 0.0
+        self.updated = max(self.updated, self.paused_until)
@@ -0,0 +1,159 @@
+import logging
+import uuid
+from typing import Any, Iterable, Iterator, List
+
+from django.db import transaction
+
+ID_PAGE_SIZE = 20000  # ids per sweep request; an id-only entry is a small fraction of a full one
+PARTITIONS = 256  # one per leading key byte
+LOCAL_CHUNK_SIZE = 10000  # local primary keys read per database round trip
+APPLY_BATCH_SIZE = 1000  # missing rows marked or deleted per statement
+# More missing than this share of the table points at a broken sweep rather than real deletions
+MAX_MISSING_FRACTION = 0.5
+RECONCILE_ACTIONS = ('deactivate', 'delete')
+INT_KEY_OFFSET = 1 << 63
+
+
+class IdCodec:
+    """Primary keys as fixed-width byte strings whose byte order matches the database's key order.
+
+    UUIDs become their 16 bytes, which PostgreSQL compares directly and
+    other backends store as hex text in the same order. Integers become 8
+    big-endian bytes offset so negative values sort first.
+    """
+
+    def __init__(self, is_guid: bool):
+        self.is_guid = is_guid
+        self.width = 16 if is_guid else 8
+
+    def encode(self, value: Any) -> bytes:
+        if self.is_guid:
+            if isinstance(value, uuid.UUID):
+                return value.bytes
+            return bytes.fromhex(value.replace('-', ''))
+        return (int(value) + INT_KEY_OFFSET).to_bytes(8, 'big')
+
+    def decode(self, key: bytes) -> Any:
+        if self.is_guid:
+            return uuid.UUID(bytes=key)
+        return int.from_bytes(key, 'big') - INT_KEY_OFFSET
+
+
+class IdArray:
+    """Fixed-width keys packed into one bytearray per leading byte.
+
+    A UUID costs 16 bytes here against roughly 100 as a UUID object in a
+    set. sort() orders one partition at a time, so only about 1/256 of the
+    keys exist as Python objects at once, and iteration yields every key in
+    ascending byte order.
+    """
+
+    def __init__(self, width: int):
+        self.width = width
+        self._partitions = [bytearray() for _ in range(PARTITIONS)]
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return self._count * self.width
+
+    def add(self, key: bytes):
+        self._partitions[key[0]] += key
+        self._count += 1
+
+    def sort(self):
+        width = self.width
+        for partition in self._partitions:
+            keys = [bytes(partition[start:start + width]) for start in range(0, len(partition), width)]
+            keys.sort()
+            partition[:] = b''.join(keys)
+
+    def __iter__(self) -> Iterator[bytes]:
+        width = self.width
+        for partition in self._partitions:
+            view = memoryview(partition)
+            for start in range(0, len(partition), width):
+                yield bytes(view[start:start + width])
+
+
+def missing_keys(local: Iterable[bytes], upstream: IdArray) -> Iterator[bytes]:
+    """Local keys absent upstream; both sides must be in ascending byte order."""
+    remote = iter(upstream)
+    current = next(remote, None)
+    previous = None
+    for key in local:
+        if previous is not None and key <= previous:
+            # A collation that doesn't order keys bytewise would report live rows as missing
+            raise ValueError("Local primary keys are not in byte order; cannot reconcile")
+        previous = key
+        while current is not None and current < key:
+            current = next(remote, None)
+        if current != key:
+            yield key
+
+
+class Reconciliation:
+    """Finds and removes the rows of one endpoint that no longer exist in MarketSharp.
+
+    The caller sweeps every upstream id into add_page(); find_missing() then
+    sorts them and walks them alongside the table's primary keys, read in
+    key order, so neither side is ever held as Python objects. Missing rows
+    are marked inactive or deleted in batches by apply().
+    """
+
+    def __init__(self, endpoint: str, model, is_guid: bool, logger: logging.Logger):
+        self.endpoint = endpoint
+        self.model = model
+        self.logger = logger
+        self.codec = IdCodec(is_guid)
+        self.upstream = IdArray(self.codec.width)
+        self.local_rows = 0
+
+    def add_page(self, ids: List[str]):
+        encode = self.codec.encode
+        for record_id in ids:
+            self.upstream.add(encode(record_id))
+
+    def _local_keys(self) -> Iterator[bytes]:
+        encode = self.codec.encode
+        keys = self.model.objects.order_by('pk').values_list('pk', flat=True)
+        for pk in keys.iterator(chunk_size=LOCAL_CHUNK_SIZE):
+            self.local_rows += 1
+            yield encode(pk)
+
+    def find_missing(self) -> IdArray:
+        """Keys of local rows the sweep did not see. Blocking; call it from a worker thread."""
+        self.upstream.sort()
+        missing = IdArray(self.codec.width)
+        self.local_rows = 0
+        for key in missing_keys(self._local_keys(), self.upstream):
+            missing.add(key)
+        return missing
+
+    def too_many_missing(self, missing: IdArray) -> bool:
+        """Whether more rows are missing than real deletions could explain, pointing at a broken sweep."""
+        return len(missing) > self.local_rows * MAX_MISSING_FRACTION
+
+    def apply(self, missing: IdArray, action: str) -> int:
+        """Mark the missing rows inactive or delete them; returns the rows changed. Blocking."""
+        changed = 0
+        batch = []
+        for key in missing:
+            batch.append(self.codec.decode(key))
+            if len(batch) == APPLY_BATCH_SIZE:
+                changed += self._apply_batch(batch, action)
+                batch = []
+        if batch:
+            changed += self._apply_batch(batch, action)
+        return changed
+
+    def _apply_batch(self, pks: List[Any], action: str) -> int:
+        rows = self.model.objects.filter(pk__in=pks)
+        with transaction.atomic():
+            if action == 'delete':
+                deleted, _ = rows.delete()
+                return deleted
+            return rows.filter(is_active=True).update(is_active=False)
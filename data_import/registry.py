@@ -1,9 +1,16 @@
-from typing import Dict, Type
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple, Type
 from django.db import models
 import logging
 import importlib
 from pathlib import Path
 
+@dataclass(frozen=True)
+class ParentLink:
+    """A child endpoint's parent: the parent endpoint and the child's field_mappings key holding its id."""
+    endpoint: str
+    field: str
+
 class ProcessorRegistry:
     _instance = None
     
@@ -13,14 +20,35 @@ class ProcessorRegistry:
             cls._instance.processors = {}
             cls._instance.endpoints = {}
             cls._instance.models = {}
+            cls._instance.dependencies = {}
+            cls._instance.parents = {}
             cls._instance.auto_discover()  # Auto-discover on instantiation
         return cls._instance
     
-    def register(self, endpoint: str, api_url: str, model: Type[models.Model], processor_class: Type):
-        """Register a new processor with its associated endpoint, URL, and model."""
+    def register(
+        self,
+        endpoint: str,
+        api_url: str,
+        model: Type[models.Model],
+        processor_class: Type,
+        depends_on: Tuple[str, ...] = (),
+        parent: Optional[ParentLink] = None
+    ):
+        """Register a new processor with its associated endpoint, URL, and model.
+
+        depends_on names endpoints that must finish before this one starts
+        when several endpoints are imported in one run. parent marks a child
+        endpoint without lastUpdate of its own, refreshed through the parents
+        whose lastUpdate moved; the parent is always a dependency.
+        """
+        if parent is not None and parent.endpoint not in depends_on:
+            depends_on = (*depends_on, parent.endpoint)
         self.processors[endpoint] = processor_class
         self.endpoints[endpoint] = api_url
         self.models[endpoint] = model
+        self.dependencies[endpoint] = tuple(depends_on)
+        if parent is not None:
+            self.parents[endpoint] = parent
     
     @classmethod
     def get_instance(cls):
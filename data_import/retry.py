@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import FrozenSet, Optional
+
+import aiohttp
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BASE_DELAY = 2.0  # seconds; doubled per attempt before jitter
+DEFAULT_MAX_DELAY = 60.0
+DEFAULT_REQUEST_TIMEOUT = 300  # seconds for a whole request, body included
+DEFAULT_READ_TIMEOUT = 60  # seconds without receiving any bytes
+DEFAULT_FAILURE_THRESHOLD = 10  # failed attempts in a row that open the circuit
+DEFAULT_COOLDOWN = 60.0  # seconds the circuit stays open
+
+# Client errors such as 400 (bad $filter) and 404 (unknown entity set) fail fast;
+# a caller that knows better passes a RetryPolicy with its own retryable_statuses
+RETRYABLE_STATUSES = frozenset((408, 429, 500, 502, 503, 504))
+
+# Transport failures worth another attempt; anything else from aiohttp is a bug or a bad URL
+RETRYABLE_EXCEPTIONS = (
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    asyncio.TimeoutError,
+)
+
+
+class MarketSharpError(Exception):
+    """A MarketSharp request failed."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class RetryableError(MarketSharpError):
+    """A failure that may succeed if the request is sent again."""
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message, status)
+        self.retry_after = retry_after
+
+
+class FatalError(MarketSharpError):
+    """A failure that retrying will not fix, e.g. bad credentials."""
+
+
+class CircuitOpenError(RetryableError):
+    """The circuit breaker is open and the request was not sent.
+
+    Retryable: the caller waits out the rest of the cooldown (retry_after)
+    and tries again, so endpoints pause rather than fail while it is open.
+    """
+
+
+@dataclass
+class RetryPolicy:
+    """How MarketSharp requests are timed out, classified and retried."""
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    base_delay: float = DEFAULT_BASE_DELAY
+    max_delay: float = DEFAULT_MAX_DELAY
+    request_timeout: float = DEFAULT_REQUEST_TIMEOUT
+    read_timeout: float = DEFAULT_READ_TIMEOUT
+    retryable_statuses: FrozenSet[int] = field(default=RETRYABLE_STATUSES)
+
+    @property
+    def timeout(self) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(total=self.request_timeout, sock_read=self.read_timeout)
+
+    def is_retryable_status(self, status: int) -> bool:
+        return status in self.retryable_statuses
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before attempt + 1: Retry-After if the server gave one, else full jitter."""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """Stops sending requests after repeated failures, shared by every endpoint in the run.
+
+    After failure_threshold failed attempts in a row the circuit opens and
+    requests are refused with CircuitOpenError, which tells the caller how
+    long to wait before trying again. Once cooldown seconds
+    have passed, one trial request is let through: success closes the
+    circuit, failure opens it for another cooldown. A trial that never
+    reports back (e.g. it was cancelled) is given up on after another cooldown.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        cooldown: float = DEFAULT_COOLDOWN,
+    ):
+        self.logger = logger
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_started: Optional[float] = None
+
+    def before_request(self):
+        if self.opened_at is None:
+            return
+        now = time.monotonic()
+        remaining = self.opened_at + self.cooldown - now
+        if self.trial_started is not None:
+            remaining = max(remaining, self.trial_started + self.cooldown - now)
+        if remaining > 0:
+            raise CircuitOpenError(
+                f"MarketSharp circuit open after {self.failures} consecutive failures",
+                retry_after=remaining
+            )
+        self.trial_started = now
+
+    def record_success(self):
+        if self.opened_at is not None:
+            self.logger.info("MarketSharp circuit closed after a successful trial request")
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_started is not None or (self.opened_at is None and self.failures >= self.failure_threshold):
+            self.logger.error(
+                f"MarketSharp circuit opened after {self.failures} consecutive failures; "
+                f"pausing requests for {self.cooldown:.0f}s"
+            )
+            self.opened_at = time.monotonic()
+        self.trial_started = None
@@ -1,3 +1,984 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import tempfile
+import time
+import uuid
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from email.utils import format_datetime
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from data_import.base_processor import FieldMapping, ProcessingResult, WriteStats, convert_datetime
+from data_import.checkpoint import EndpointCheckpoint, PageFingerprints, page_fingerprint
+from data_import.concurrency import AIMDController, MIN_SAMPLES
+from data_import.copy_loader import copy_buffer, copy_value
+from data_import.data_processor import DataProcessor
+from data_import.management.commands import import_data
+from data_import.management.commands.benchmark_ingest import build_page, legacy_sanitize_xml, make_dirty
+from data_import.management.commands.import_data import BATCH_SIZE, Command, ImportOptions
+from data_import.marketsharp_api import MarketSharpAPI, PageCursor, RECORDS_PER_PAGE, RequestSigner
+from data_import.models import Address, Contact, ContactPhone, PageFingerprint, ProductInterest, SyncState
+from data_import.page_cache import PageCache
+from data_import.pipeline import ImportPipeline, PARSE_EXECUTORS, ParseExecutor
+from data_import.processors.address_processor import AddressProcessor
+from data_import.processors.contact_phone_processor import ContactPhoneProcessor
+from data_import.processors.contact_processor import ContactProcessor
+from data_import.processors.product_interest_processor import ProductInterestProcessor
+from data_import.rate_limiter import TokenBucket, retry_after_seconds
+from data_import.reconcile import IdArray, IdCodec, MAX_MISSING_FRACTION, Reconciliation, missing_keys
+from data_import.registry import ParentLink
+from data_import.retry import CircuitBreaker, FatalError, RETRYABLE_STATUSES, RetryPolicy
+from data_import.scheduler import EndpointScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class FakeResponse:
+    def __init__(self, status, body=b''):
+        self.status = status
+        self.body = body
+        self.headers = {}
+
+    async def read(self):
+        return self.body
+
+    async def text(self):
+        return self.body.decode('utf-8')
+
+    def release(self):
+        pass
+
+
+class FakeSession:
+    """Stands in for the aiohttp session, answering with a fixed sequence of statuses."""
+
+    def __init__(self, *statuses, body=b'<feed/>'):
+        self.statuses = list(statuses)
+        self.body = body
+        self.requests = 0
+        self.urls = []
+
+    async def get(self, url, headers=None):
+        self.requests += 1
+        self.urls.append(url)
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        return FakeResponse(status, self.body if status == 200 else b'error')
+
+
+def make_api(session, **kwargs):
+    api = MarketSharpAPI('1', 'key', 'c2VjcmV0', logger, **kwargs)
+    api._session = session
+    return api
+
+
+def atom_feed(entries, d='d', m='m'):
+    """An Atom page with one entry per dict of property name to text, using the given namespace prefixes."""
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?>'
+        f'<feed xmlns:{d}="http://schemas.microsoft.com/ado/2007/08/dataservices" '
+        f'xmlns:{m}="http://schemas.microsoft.com/ado/2007/08/dataservices/metadata" '
+        'xmlns="http://www.w3.org/2005/Atom">'
+    ]
+    for properties in entries:
+        parts.append(f'<entry><content type="application/xml"><{m}:properties>')
+        for name, text in properties.items():
+            parts.append(f'<{d}:{name}>{text}</{d}:{name}>')
+        parts.append(f'</{m}:properties></content></entry>')
+    parts.append('</feed>')
+    return ''.join(parts).encode('utf-8')
+
+
+class AIMDControllerTests(SimpleTestCase):
+    def make_controller(self, initial=4):
+        # interval 0: every MIN_SAMPLES responses close a window
+        return AIMDController(logger, initial=initial, maximum=8, interval=0)
+
+    def saturated_window(self, controller, seconds, feed='Contacts'):
+        """Hold every slot while MIN_SAMPLES page responses of feed arrive."""
+        async def run():
+            async with AsyncExitStack() as stack:
+                for _ in range(controller.limit):
+                    await stack.enter_async_context(controller)
+                for _ in range(MIN_SAMPLES):
+                    controller.record(200, seconds, feed)
+        asyncio.run(run())
+
+    def test_limit_recovers_after_one_fast_window(self):
+        controller = self.make_controller()
+        self.saturated_window(controller, 0.08)
+        for _ in range(10):
+            self.saturated_window(controller, 3.0)
+        self.assertGreaterEqual(controller.limit, 4)
+        self.assertLessEqual(controller.decreases, 1)
+
+    def test_sustained_slowdown_decreases_limit(self):
+        controller = self.make_controller()
+        self.saturated_window(controller, 1.0)
+        self.saturated_window(controller, 5.0)
+        self.assertLess(controller.limit, 5)
+        self.assertEqual(controller.decreases, 1)
+
+    def test_non_page_latencies_are_ignored(self):
+        controller = self.make_controller()
+        self.saturated_window(controller, 3.0)
+        for _ in range(MIN_SAMPLES):
+            # $count and related-data responses carry no feed
+            controller.record(200, 0.01)
+        self.saturated_window(controller, 3.0)
+        self.assertEqual(controller.decreases, 0)
+
+    def test_feeds_are_judged_against_their_own_baseline(self):
+        controller = self.make_controller()
+        self.saturated_window(controller, 0.05, feed='ProductTypes')
+        self.saturated_window(controller, 3.0, feed='Contacts')
+        self.saturated_window(controller, 3.0, feed='Contacts')
+        self.assertEqual(controller.decreases, 0)
+
+
+class RetryPolicyTests(SimpleTestCase):
+    def test_client_errors_are_not_retried(self):
+        policy = RetryPolicy()
+        for status in (400, 401, 403, 404):
+            self.assertFalse(policy.is_retryable_status(status), status)
+        for status in (408, 429, 500, 502, 503, 504):
+            self.assertTrue(policy.is_retryable_status(status), status)
+
+    def test_retryable_statuses_can_be_overridden(self):
+        policy = RetryPolicy(retryable_statuses=RETRYABLE_STATUSES | {404})
+        self.assertTrue(policy.is_retryable_status(404))
+
+
+class RateLimiterTests(SimpleTestCase):
+    def test_burst_is_served_at_once_and_the_rest_at_the_rate(self):
+        bucket = TokenBucket(rate=50, burst=3)
+
+        async def acquire_all(count):
+            started = time.monotonic()
+            for _ in range(count):
+                await bucket.acquire()
+            return time.monotonic() - started
+
+        self.assertLess(asyncio.run(acquire_all(3)), 0.02)
+        # Three more tokens refill at 50 per second
+        self.assertGreaterEqual(asyncio.run(acquire_all(3)), 0.05)
+        self.assertGreater(bucket.waited, 0)
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+    def test_pause_holds_back_every_request(self):
+        bucket = TokenBucket(rate=1000, burst=5)
+        bucket.pause(0.1)
+
+        async def acquire():
+            started = time.monotonic()
+            await asyncio.gather(bucket.acquire(), bucket.acquire())
+            return time.monotonic() - started
+
+        self.assertGreaterEqual(asyncio.run(acquire()), 0.09)
+
+    def test_retry_after_as_seconds_or_http_date(self):
+        self.assertEqual(retry_after_seconds('120'), 120.0)
+        self.assertEqual(retry_after_seconds(' 7 '), 7.0)
+        for value in (None, '', 'soon', '-5'):
+            with self.subTest(value=value):
+                self.assertIsNone(retry_after_seconds(value))
+        later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+        self.assertTrue(28 <= retry_after_seconds(later) <= 30)
+        self.assertEqual(retry_after_seconds('Wed, 21 Oct 2015 07:28:00 GMT'), 0.0)
+
+
+class RequestSignerTests(SimpleTestCase):
+    SECRET = base64.b64encode(b'not a real secret').decode('ascii')
+
+    def expected_header(self, ts):
+        digest = hmac.new(b'not a real secret', f'1key{ts}'.encode('ascii'), hashlib.sha256).digest()
+        return f"1:key:{ts}:{base64.b64encode(digest).decode('ascii')}"
+
+    def test_header_matches_a_freshly_keyed_hmac(self):
+        signer = RequestSigner('1', 'key', self.SECRET)
+        for ts in (1772600767, 1772600768, 1772600767):
+            with self.subTest(ts=ts):
+                self.assertEqual(signer.headers(ts), {'Authorization': self.expected_header(ts)})
+
+    def test_header_is_reused_within_the_same_second(self):
+        signer = RequestSigner('1', 'key', self.SECRET)
+        first = signer.headers(1772600767)
+        self.assertIs(signer.headers(1772600767), first)
+        self.assertIsNot(signer.headers(1772600768), first)
+        self.assertNotIn(self.SECRET, repr(signer))
+
+
+class RequestRetryTests(SimpleTestCase):
+    def test_not_found_fails_without_retrying(self):
+        session = FakeSession(404)
+        api = make_api(session, retry_policy=RetryPolicy(base_delay=0))
+        with self.assertRaises(FatalError):
+            asyncio.run(api.get_data('https://example.invalid/Contacts'))
+        self.assertEqual(session.requests, 1)
+
+    def test_open_circuit_pauses_requests_until_cooldown(self):
+        breaker = CircuitBreaker(logger, failure_threshold=1, cooldown=0.2)
+        breaker.record_failure()
+        session = FakeSession(200)
+        api = make_api(session, circuit_breaker=breaker)
+
+        started = time.monotonic()
+        data = asyncio.run(api.get_data('https://example.invalid/Contacts'))
+        self.assertEqual(data, b'<feed/>')
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+        self.assertEqual(session.requests, 1)
+        self.assertIsNone(breaker.opened_at)
+
+
+class FeedCountTests(SimpleTestCase):
+    def test_count_reads_the_filtered_count_resource(self):
+        session = FakeSession(200, body=b'12345\n')
+        api = make_api(session)
+        since = datetime(2026, 3, 4, 5, 6, 7, tzinfo=timezone.utc)
+        self.assertEqual(asyncio.run(api.get_count('https://example.invalid/Contacts', since)), 12345)
+        self.assertTrue(
+            session.urls[0].startswith("https://example.invalid/Contacts/$count?$filter=lastUpdate gt datetime'")
+        )
+
+    def test_unexpected_count_body_is_fatal(self):
+        api = make_api(FakeSession(200, body=b'<error>nope</error>'))
+        with self.assertRaises(FatalError):
+            asyncio.run(api.get_count('https://example.invalid/Contacts'))
+
+    def run_pipeline(self, total, page_size=2, start_skip=0, done_skips=()):
+        fetched = []
+
+        async def fetch_page(skip):
+            # Every page is full, so only the total can end the feed
+            fetched.append(skip)
+            return [()] * page_size, ProcessingResult(total_processed=page_size)
+
+        async def write_page(rows, skip, cursor):
+            return len(rows)
+
+        pipeline = ImportPipeline(
+            logger, 'contacts', fetch_page, None, write_page, page_size, fetchers=3, total=total,
+            start_skip=start_skip, done_skips=done_skips
+        )
+        asyncio.run(pipeline.run())
+        return sorted(fetched), pipeline
+
+    def test_pipeline_ends_on_the_count_total(self):
+        fetched, pipeline = self.run_pipeline(total=5)
+        self.assertEqual(fetched, [0, 2, 4])
+        self.assertEqual(pipeline.total_written, 6)
+
+    def test_resumed_skip_run_fetches_only_what_is_left_of_the_total(self):
+        fetched, pipeline = self.run_pipeline(total=9, start_skip=2, done_skips=[4, 6])
+        self.assertEqual(fetched, [2, 8])
+        # Committed pages count toward progress
+        self.assertEqual(pipeline.entries_done, 10)
+
+
+class SelectTests(SimpleTestCase):
+    def test_select_names_each_mapped_property_once_in_mapping_order(self):
+        mappings = {
+            'id': FieldMapping('id', 'id', 'uuid', required=True, is_primary_key=True),
+            'city': FieldMapping('city', 'city', 'string'),
+            'city_upper': FieldMapping('city', 'city_upper', 'string'),
+            'last_update': FieldMapping('lastUpdate', 'last_update', 'datetime'),
+        }
+        self.assertEqual(MarketSharpAPI.select_for(mappings), 'id,city,lastUpdate')
+        self.assertEqual(
+            MarketSharpAPI.select_for(AddressProcessor.field_mappings).split(','),
+            [mapping.xml_field for mapping in AddressProcessor.field_mappings.values()]
+        )
+
+    def test_select_is_added_to_page_urls(self):
+        session = FakeSession(200)
+        api = make_api(session)
+        select = MarketSharpAPI.select_for(ProductInterestProcessor.field_mappings)
+        asyncio.run(api.get_data('https://example.invalid/ProductInterests', skip=5000, select=select))
+        asyncio.run(api.get_data('https://example.invalid/ProductInterests'))
+        self.assertTrue(session.urls[0].endswith(
+            '&$skip=5000&$select=id,inquiryId,productTypeId,productDetailId,priceQuoted,isActive,lastUpdate'
+        ))
+        self.assertNotIn('$select', session.urls[1])
+
+
+class ConverterTests(SimpleTestCase):
+    def test_datetime_precisions(self):
+        base = datetime(2026, 3, 4, 5, 6, 7, tzinfo=timezone.utc)
+        cases = {
+            '2026-03-04T05:06:07': base,
+            '2026-03-04T05:06:07.123': base.replace(microsecond=123000),
+            '2026-03-04T05:06:07.123456': base.replace(microsecond=123456),
+            # 100ns ticks: the seventh digit is below datetime's precision and dropped
+            '2026-03-04T05:06:07.1234567': base.replace(microsecond=123456),
+            '2026-03-04T05:06:07.9999999': base.replace(microsecond=999999),
+            '2026-03-04T05:06:07.12': base.replace(microsecond=120000),
+            '2026-03-04T05:06:07Z': base,
+            '2026-03-04T06:06:07+01:00': base,
+        }
+        for value, expected in cases.items():
+            with self.subTest(value=value):
+                parsed = convert_datetime(value)
+                self.assertEqual(parsed, expected)
+                self.assertIsNotNone(parsed.tzinfo)
+        self.assertIsNone(convert_datetime(''))
+        with self.assertRaises(ValueError):
+            convert_datetime('2026-03-04Tlater')
+
+    def test_null_properties_take_the_mapping_default(self):
+        processor = ProductInterestProcessor(logger, DataProcessor(logger))
+        record_id = uuid.uuid4()
+        page = atom_feed([{'id': record_id, 'priceQuoted': '', 'isActive': '', 'lastUpdate': ''}])
+        for name in ('priceQuoted', 'isActive', 'lastUpdate'):
+            page = page.replace(f'<d:{name}></d:{name}>'.encode(), f'<d:{name} m:null="true">x</d:{name}>'.encode())
+
+        data_processor = DataProcessor(logger)
+        properties = data_processor.parse_xml(page)[0].find('.//m:properties', namespaces=data_processor.nsmap)
+        values = processor.extractor.extract(properties)
+        self.assertEqual(values, {'id': str(record_id), 'price_quoted': None, 'is_active': None, 'last_update': None})
+
+        rows, result = processor.parse_page(page)
+        self.assertEqual(result.failed, 0)
+        self.assertEqual(rows, [(record_id, None, None, None, None, True, None)])
+
+
+class SchedulerTests(SimpleTestCase):
+    def scheduler(self, dependencies):
+        async def run_endpoint(endpoint):
+            pass
+
+        return EndpointScheduler(logger, run_endpoint, dependencies, sizes={})
+
+    def test_plan_keeps_only_dependencies_within_the_run(self):
+        scheduler = self.scheduler({'addresses': ('contacts',), 'contacts': ('companies',)})
+        self.assertEqual(scheduler.plan(['addresses', 'contacts']), {'addresses': {'contacts'}, 'contacts': set()})
+        self.assertEqual(scheduler.plan(['addresses']), {'addresses': set()})
+
+    def test_plan_rejects_a_dependency_cycle(self):
+        scheduler = self.scheduler({'a': ('c',), 'b': ('a',), 'c': ('b',), 'd': ('a',), 'e': ()})
+        with self.assertRaisesMessage(ValueError, 'Endpoint dependencies form a cycle: a, b, c, d'):
+            scheduler.plan(['a', 'b', 'c', 'd', 'e'])
+        # Leaving one endpoint of the cycle out of the run breaks it
+        self.assertEqual(scheduler.plan(['a', 'b', 'd', 'e'])['a'], set())
+
+
+class SanitizerTests(SimpleTestCase):
+    def setUp(self):
+        self.data_processor = DataProcessor(logger)
+
+    def test_valid_multibyte_text_is_returned_without_a_copy(self):
+        # \xC2 and \xEF lead many valid characters: the non-breaking space, the BOM, fullwidth forms
+        page = '<d:name>Caf\u00e9\u00a0\u00bd \ufeff\uff21 &amp; &#233;</d:name>'.encode('utf-8')
+        self.assertIs(self.data_processor.sanitize_xml(page), page)
+
+    def test_matches_legacy_sanitizer(self):
+        invalid = ''.join(
+            [chr(code) for code in range(0xA0)]
+            + [chr(code) for code in range(0xFDD0, 0xFDF0)]
+            + ['\ufffe', '\uffff', '&#x1F;', '&#xe9;', '&#233;', 'caf\u00e9 \u00bd \ufeff \U0001F600']
+        )
+        page = build_page(ContactProcessor.field_mappings, 50)
+        for xml in (invalid, page.decode('utf-8'), make_dirty(page, every=3).decode('utf-8')):
+            self.assertEqual(
+                self.data_processor.sanitize_xml(xml.encode('utf-8')), legacy_sanitize_xml(xml).encode('utf-8')
+            )
+
+    def test_invalid_sequences_are_removed(self):
+        page = b'<d:name>a\x01b\xc2\x85c&#x1F;d\xef\xbf\xbee\xed\xa0\x80</d:name>'
+        self.assertEqual(self.data_processor.sanitize_xml(page), b'<d:name>abcde</d:name>')
+
+
+class StreamParseTests(SimpleTestCase):
+    def test_stream_parse_matches_buffered_parse(self):
+        processor = ContactProcessor(logger, DataProcessor(logger))
+        # Multibyte characters, a control character and a character reference to split across chunks
+        page = build_page(processor.field_mappings, 10).replace(b'more', 'möre €\x01&#x1F;'.encode('utf-8'))
+        expected, expected_result = processor.parse_page(page)
+        self.assertEqual(len(expected), 10)
+
+        async def chunks(size):
+            for start in range(0, len(page), size):
+                yield page[start:start + size]
+
+        for size in (1, 2, 3, 7, 64, 1000):
+            with self.subTest(chunk_size=size):
+                rows, result = asyncio.run(processor.parse_stream(chunks(size)))
+                self.assertEqual(rows, expected)
+                self.assertEqual(
+                    (result.total_processed, result.failed),
+                    (expected_result.total_processed, expected_result.failed)
+                )
+
+
+class ParseExecutorTests(SimpleTestCase):
+    def test_thread_and_process_pools_parse_like_the_processor(self):
+        processor = ContactProcessor(logger, DataProcessor(logger))
+        pages = [build_page(processor.field_mappings, 20) for _ in range(4)]
+        expected = [processor.parse_page(page)[0] for page in pages]
+
+        async def parse_all(executor):
+            parsed = await asyncio.gather(*(executor.parse(ContactProcessor, page) for page in pages))
+            return [rows for rows, _ in parsed]
+
+        for kind in PARSE_EXECUTORS:
+            with self.subTest(kind=kind):
+                executor = ParseExecutor(kind, workers=2)
+                try:
+                    self.assertEqual(asyncio.run(parse_all(executor)), expected)
+                finally:
+                    executor.shutdown()
+
+
+class JsonParseTests(SimpleTestCase):
+    def setUp(self):
+        self.processor = ProductInterestProcessor(logger, DataProcessor(logger))
+
+    def parse(self, *entities):
+        page = json.dumps({'d': {'results': list(entities)}}).encode('utf-8')
+        return self.processor.parse_page(page, 'json')
+
+    def entity(self, last_update, **values):
+        return {'id': str(uuid.uuid4()), 'priceQuoted': '12.50', 'isActive': False, 'lastUpdate': last_update, **values}
+
+    def test_json_dates_match_atom_timestamps(self):
+        rows, result = self.parse(
+            self.entity('/Date(1772600767123)/'),
+            self.entity('/Date(1772600767123+0100)/'),
+            self.entity(None, priceQuoted=None, isActive=None),
+        )
+        self.assertEqual(result.failed, 0)
+        expected = datetime(2026, 3, 4, 5, 6, 7, 123000, tzinfo=timezone.utc)
+        self.assertEqual([row[-1] for row in rows], [expected, expected, None])
+        self.assertEqual(rows[0][4:6], (Decimal('12.50'), False))
+        # Nulls fall back to the mapping default, as m:null does in Atom
+        self.assertEqual(rows[2][4:6], (None, True))
+
+    def test_malformed_json_date_drops_only_that_field(self):
+        good = self.entity('/Date(1772600767123)/')
+        with self.assertLogs(logger, 'WARNING') as logs:
+            rows, result = self.parse(
+                self.entity('/Date(soon)/'),
+                self.entity('/Date(99999999999999999999)/'),
+                good,
+            )
+        self.assertEqual((len(rows), result.failed), (3, 0))
+        self.assertEqual([row[-1] is None for row in rows], [True, True, False])
+        self.assertEqual(rows[2][0], uuid.UUID(good['id']))
+        self.assertEqual(sum('last_update' in line for line in logs.output), 2)
+
+
+class KeysetCursorTests(SimpleTestCase):
+    STAMP = '2026-03-04T05:06:07.1234567'
+    GUID = '0b3c9c7e-2f4a-4d21-9a53-6f1e8d2c4b10'
+
+    def setUp(self):
+        self.data_processor = DataProcessor(logger)
+
+    def test_filter_clause_breaks_lastupdate_ties_by_guid_id(self):
+        cursor = PageCursor(self.STAMP, self.GUID)
+        self.assertEqual(
+            cursor.filter_clause(),
+            f"(lastUpdate gt datetime'{self.STAMP}') or "
+            f"(lastUpdate eq datetime'{self.STAMP}' and id gt guid'{self.GUID}')"
+        )
+
+    def test_filter_clause_with_int_id(self):
+        cursor = PageCursor(self.STAMP, '42', id_is_guid=False)
+        self.assertEqual(
+            cursor.filter_clause(),
+            f"(lastUpdate gt datetime'{self.STAMP}') or (lastUpdate eq datetime'{self.STAMP}' and id gt 42)"
+        )
+
+    def test_filter_clause_without_id_starts_after_the_watermark(self):
+        self.assertEqual(PageCursor(self.STAMP).filter_clause(), f"lastUpdate gt datetime'{self.STAMP}'")
+
+    def test_cursor_pages_have_no_skip_and_order_by_lastupdate_then_id(self):
+        api = MarketSharpAPI('1', 'key', 'c2VjcmV0', logger)
+        url = api._build_page_url('https://example.invalid/Contacts', cursor=PageCursor(self.STAMP, self.GUID))
+        self.assertNotIn('$skip', url)
+        self.assertTrue(url.endswith('&$orderby=lastUpdate,id'))
+
+    def test_cursor_follows_the_last_entry_among_equal_timestamps(self):
+        page = atom_feed([
+            {'id': '00000000-0000-0000-0000-00000000000a', 'lastUpdate': self.STAMP},
+            {'id': self.GUID, 'lastUpdate': self.STAMP},
+        ])
+        expected = PageCursor(self.STAMP, self.GUID)
+        self.assertEqual(self.data_processor.last_entry_cursor(page), expected)
+
+        parser = self.data_processor.stream_parser(track_cursor=True)
+        list(parser.feed(page))
+        list(parser.close())
+        self.assertEqual(parser.cursor(), expected)
+
+    def test_unexpected_prefixes_fall_back_to_a_full_parse(self):
+        page = atom_feed([{'id': '7', 'lastUpdate': self.STAMP}], d='ds', m='meta')
+        self.assertEqual(
+            self.data_processor.last_entry_cursor(page, id_is_guid=False), PageCursor(self.STAMP, '7', False)
+        )
+
+    def test_empty_page_has_no_cursor(self):
+        self.assertIsNone(self.data_processor.last_entry_cursor(atom_feed([])))
+
+
+class CopyFormatTests(SimpleTestCase):
+    def test_values_are_escaped_for_copy_text_format(self):
+        record_id = uuid.UUID('0b3c9c7e-2f4a-4d21-9a53-6f1e8d2c4b10')
+        cases = [
+            (None, '\\N'),
+            (True, 't'),
+            (False, 'f'),
+            ('plain', 'plain'),
+            ('tab\there', 'tab\\there'),
+            ('two\nlines\r\n', 'two\\nlines\\r\\n'),
+            # Backslashes are doubled first, so the escapes added after them stay single
+            ('C:\\new\t', 'C:\\\\new\\t'),
+            ('\\N', '\\\\N'),
+            (record_id, str(record_id)),
+            (Decimal('12.50'), '12.50'),
+            (datetime(2026, 3, 4, 5, 6, 7, tzinfo=timezone.utc), '2026-03-04 05:06:07+00:00'),
+        ]
+        for value, expected in cases:
+            with self.subTest(value=value):
+                self.assertEqual(copy_value(value), expected)
+
+    def test_buffer_writes_one_line_per_row(self):
+        buffer = copy_buffer([('a\tb', None, 1), ('c\nd', True, 2)])
+        self.assertEqual(buffer.read(), 'a\\tb\t\\N\t1\nc\\nd\tt\t2\n')
+
+
+class WriteBackendTests(TestCase):
+    def make_rows(self, processor, records):
+        columns = processor.extractor.columns
+        return [tuple(record.get(column) for column in columns) for record in records]
+
+    def write(self, processor, rows, backend):
+        processor.write_stats = WriteStats()
+        processor.write_rows(rows, processor.model, processor.extractor, 2, backend)
+        return processor.write_stats
+
+    def address_records(self):
+        return [
+            {'id': uuid.uuid4(), 'contact_id': uuid.uuid4(), 'city': f'City {n}', 'latitude': n + 0.5,
+             'is_active': True}
+            for n in range(5)
+        ]
+
+    def test_upsert_round_trip_reports_unchanged_rows(self):
+        for backend in ('upsert', 'orm'):
+            with self.subTest(backend=backend):
+                Address.objects.all().delete()
+                processor = AddressProcessor(logger, DataProcessor(logger))
+                records = self.address_records()
+                self.assertEqual(
+                    self.write(processor, self.make_rows(processor, records), backend), WriteStats(5, 0, 0)
+                )
+                self.assertEqual(
+                    self.write(processor, self.make_rows(processor, records), backend), WriteStats(0, 0, 5)
+                )
+
+                records[0]['city'] = 'Moved'
+                records[1]['line2'] = 'Suite 1'
+                records.append({'id': uuid.uuid4(), 'contact_id': uuid.uuid4(), 'is_active': True})
+                self.assertEqual(
+                    self.write(processor, self.make_rows(processor, records), backend), WriteStats(1, 2, 3)
+                )
+                self.assertEqual(Address.objects.get(pk=records[0]['id']).city, 'Moved')
+                self.assertEqual(Address.objects.count(), 6)
+
+    def test_only_a_newer_last_update_rewrites_a_row(self):
+        for backend in ('upsert', 'orm'):
+            with self.subTest(backend=backend):
+                ProductInterest.objects.all().delete()
+                processor = ProductInterestProcessor(logger, DataProcessor(logger))
+                stamp = datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+                records = [
+                    {'id': uuid.uuid4(), 'price_quoted': 10.5, 'is_active': True, 'last_update': stamp}
+                    for _ in range(3)
+                ]
+                self.write(processor, self.make_rows(processor, records), backend)
+                self.assertEqual(
+                    self.write(processor, self.make_rows(processor, records), backend), WriteStats(0, 0, 3)
+                )
+
+                # Newer rewrites the row; equal or older leaves it alone whatever else differs, so a
+                # stale copy committed after a fresh one can't roll it back
+                records[0].update(price_quoted=12.25, last_update=datetime(2026, 2, 1, tzinfo=timezone.utc))
+                records[1]['price_quoted'] = 99.0
+                records[2].update(price_quoted=1.0, last_update=datetime(2025, 12, 1, tzinfo=timezone.utc))
+                self.assertEqual(
+                    self.write(processor, self.make_rows(processor, records), backend), WriteStats(0, 1, 2)
+                )
+                stored = dict(ProductInterest.objects.values_list('pk', 'price_quoted'))
+                self.assertEqual(
+                    [stored[record['id']] for record in records],
+                    [Decimal('12.25'), Decimal('10.50'), Decimal('10.50')]
+                )
+
+    def test_orm_backend_updates_only_changed_columns(self):
+        processor = AddressProcessor(logger, DataProcessor(logger))
+        records = self.address_records()
+        self.write(processor, self.make_rows(processor, records), 'orm')
+        records[0]['city'] = 'Moved'
+        records[1]['latitude'] = 7.25
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(
+                self.write(processor, self.make_rows(processor, records), 'orm'), WriteStats(0, 2, 3)
+            )
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"city"', updates[0])
+        self.assertIn('"latitude"', updates[0])
+        self.assertNotIn('"zip"', updates[0])
+
+
+class CheckpointTests(TransactionTestCase):
+    """Commits for real: the checkpoint only moves on in memory once a page's transaction commits."""
+
+    def setUp(self):
+        self.command = Command(logger)
+        self.processor = AddressProcessor(logger, DataProcessor(logger))
+
+    def start_run(self, pagination='skip'):
+        return EndpointCheckpoint.start('addresses', pagination, None, BATCH_SIZE)
+
+    def open_checkpoint(self, resume=True, pagination='skip'):
+        return self.command.open_checkpoint('addresses', self.processor, pagination, None, None, resume)
+
+    def test_resuming_at_an_offset_warns_that_rows_can_be_missed(self):
+        checkpoint = self.start_run()
+        with transaction.atomic():
+            checkpoint.page_committed(0)
+        checkpoint.finish(False)
+
+        with self.assertLogs(logger, 'WARNING') as logs:
+            resumed = self.open_checkpoint()
+        self.assertTrue(resumed.resumed)
+        self.assertIn('can miss rows', logs.output[0])
+
+    def test_last_update_watermark_only_moves_forward(self):
+        def stamp(day):
+            return datetime(2026, 3, day, tzinfo=timezone.utc)
+
+        def latest():
+            return asyncio.run(self.command.get_latest_update('contacts'))
+
+        self.assertEqual(latest(), datetime(1970, 1, 1))
+        # Without a run on record the table is scanned once
+        Contact.objects.create(company_id=1, creation_date=stamp(1), created_date=stamp(1), last_update=stamp(5))
+        self.assertEqual(latest(), stamp(5))
+
+        checkpoint = EndpointCheckpoint.start('contacts', 'skip', stamp(5), BATCH_SIZE, last_update_index=0)
+        with transaction.atomic():
+            checkpoint.page_committed(BATCH_SIZE, None, [(stamp(8),), (None,)])
+        with transaction.atomic():
+            checkpoint.page_committed(0, None, [(stamp(6),)])
+        self.assertEqual(EndpointCheckpoint.load('contacts').last_update, stamp(8))
+        # Unfinished, the run may have skipped pages before its newest one: restart where it started
+        self.assertEqual(latest(), stamp(5))
+        checkpoint.finish(True)
+        self.assertEqual(latest(), stamp(8))
+
+        EndpointCheckpoint.start('contacts', 'skip', stamp(8), BATCH_SIZE, last_update_index=0)
+        self.assertEqual(EndpointCheckpoint.load('contacts').last_update, stamp(8))
+        self.assertEqual(asyncio.run(self.command.get_latest_update('addresses')), '')
+
+    def test_resume_fetches_only_pages_not_committed(self):
+        page_size = 2
+        records = [{'id': uuid.uuid4(), 'contact_id': uuid.uuid4(), 'is_active': True} for _ in range(5)]
+        rows = [tuple(record.get(column) for column in self.processor.extractor.columns) for record in records]
+
+        def run(checkpoint, failing_skip=None):
+            fetched = []
+
+            async def fetch_page(skip):
+                fetched.append(skip)
+                if skip == failing_skip:
+                    raise ConnectionError('connection reset')
+                page = rows[skip:skip + page_size]
+                return page, ProcessingResult(total_processed=len(page))
+
+            async def write_page(page, skip, cursor):
+                return await self.processor.write_records(
+                    page, Address, self.processor.field_mappings, BATCH_SIZE, 'upsert',
+                    after_write=lambda: checkpoint.page_committed(skip, cursor, page)
+                )
+
+            pipeline = ImportPipeline(
+                logger, 'addresses', fetch_page, None, write_page, page_size, fetchers=2, total=len(rows),
+                start_skip=checkpoint.next_skip, done_skips=checkpoint.done_skips
+            )
+            asyncio.run(pipeline.run())
+            checkpoint.finish(pipeline.failures == 0)
+            return sorted(fetched)
+
+        checkpoint = EndpointCheckpoint.start('addresses', 'skip', None, page_size)
+        self.assertEqual(run(checkpoint, failing_skip=2), [0, 2, 4])
+        state = EndpointCheckpoint.load('addresses')
+        self.assertEqual((state.status, state.next_skip, state.done_skips), (SyncState.STATUS_FAILED, 2, [4]))
+        self.assertEqual(Address.objects.count(), 3)
+
+        resumed = EndpointCheckpoint.resume(state, page_size)
+        self.assertEqual(run(resumed), [2])
+        state = EndpointCheckpoint.load('addresses')
+        self.assertEqual((state.status, state.next_skip, state.done_skips), (SyncState.STATUS_COMPLETED, 6, []))
+        self.assertEqual(state.pages_done, 3)
+        self.assertEqual(Address.objects.count(), 5)
+
+
+class PageFingerprintTests(TestCase):
+    def page(self, city, updated='2026-03-04T05:06:07Z'):
+        page = atom_feed([{'id': n, 'city': city} for n in range(3)])
+        return page.replace(b'<entry>', f'<entry><updated>{updated}</updated>'.encode('utf-8'))
+
+    def test_request_stamps_do_not_change_the_fingerprint(self):
+        self.assertEqual(
+            page_fingerprint(self.page('Oslo')), page_fingerprint(self.page('Oslo', updated='2026-03-05T00:00:00Z'))
+        )
+        self.assertNotEqual(page_fingerprint(self.page('Oslo')), page_fingerprint(self.page('Bergen')))
+
+    def test_unchanged_pages_are_skipped_and_changed_ones_saved_on_commit(self):
+        fingerprints = PageFingerprints.load('addresses')
+        self.assertIsNone(fingerprints.unchanged(0, page_fingerprint(self.page('Oslo'))))
+        fingerprints.parsed(0, 3)
+        self.assertFalse(PageFingerprint.objects.exists())
+        with transaction.atomic():
+            fingerprints.page_committed(0)
+
+        fingerprints = PageFingerprints.load('addresses')
+        self.assertEqual(fingerprints.unchanged(0, page_fingerprint(self.page('Oslo', updated='later'))), 3)
+        self.assertIsNone(fingerprints.unchanged(BATCH_SIZE, page_fingerprint(self.page('Oslo'))))
+        self.assertEqual((fingerprints.pages, fingerprints.skipped), (2, 1))
+        # Only a page that was parsed and written has a new fingerprint to save
+        with CaptureQueriesContext(connection) as queries:
+            fingerprints.page_committed(0)
+        self.assertEqual(len(queries), 0)
+
+        fingerprints = PageFingerprints.load('addresses')
+        self.assertIsNone(fingerprints.unchanged(0, page_fingerprint(self.page('Bergen'))))
+        fingerprints.parsed(0, 2)
+        with transaction.atomic():
+            fingerprints.page_committed(0)
+        self.assertEqual(
+            list(PageFingerprint.objects.values_list('skip', 'digest', 'entries')),
+            [(0, page_fingerprint(self.page('Bergen')), 2)]
+        )
+
+
+class SlotCounter:
+    """Stands in for the shared fetch budget, counting the slots held."""
+
+    def __init__(self):
+        self.held = 0
+
+    async def __aenter__(self):
+        self.held += 1
+
+    async def __aexit__(self, *exc_info):
+        self.held -= 1
+
+
+class ChildFeedApi:
+    """Serves a child feed filtered by the parent ids in the request's $filter."""
+
+    select_for = staticmethod(MarketSharpAPI.select_for)
+    id_filter = staticmethod(MarketSharpAPI.id_filter)
+
+    def __init__(self, children, slots, page_size):
+        self.children = children
+        self.slots = slots
+        self.page_size = page_size
+        self.requests = []
+
+    async def get_data(self, url, skip=0, select=None, response_format='atom', where=None):
+        self.requests.append((skip, self.slots.held))
+        matching = [child for child in self.children if f"guid'{child['contactId']}'" in where[0]]
+        return atom_feed(matching[skip:skip + self.page_size])
+
+
+class ChildRefreshTests(TransactionTestCase):
+    PARENT = ParentLink('contacts', 'contact_id')
+
+    def setUp(self):
+        self.command = Command(logger)
+
+    def stamp(self, day):
+        return datetime(2026, 3, day, tzinfo=timezone.utc)
+
+    def test_refresh_window_runs_from_the_child_watermark_to_the_parent_one(self):
+        def window():
+            return self.command.parent_refresh_window('contact_phones', self.PARENT)
+
+        self.assertEqual(window(), (None, None))
+
+        # Without a parent run on record, the newest parent row bounds the window
+        for day in (2, 5):
+            Contact.objects.create(
+                company_id=1, creation_date=self.stamp(1), created_date=self.stamp(1), last_update=self.stamp(day)
+            )
+        self.assertEqual(window(), (None, self.stamp(5)))
+
+        EndpointCheckpoint.start('contacts', 'skip', self.stamp(4), BATCH_SIZE).finish(True)
+        self.assertEqual(window(), (None, self.stamp(4)))
+        # A parent run still going may have committed later pages first; stop where it started
+        running = EndpointCheckpoint.start('contacts', 'skip', self.stamp(4), BATCH_SIZE, last_update_index=0)
+        with transaction.atomic():
+            running.page_committed(BATCH_SIZE, rows=[(self.stamp(6),)])
+        self.assertEqual(window(), (None, self.stamp(4)))
+
+        EndpointCheckpoint.start('contact_phones', 'parents', self.stamp(3), BATCH_SIZE).finish(True)
+        self.assertEqual(window(), (self.stamp(3), self.stamp(4)))
+        EndpointCheckpoint.set_last_update('contact_phones', self.stamp(4))
+        self.assertEqual(window(), (self.stamp(4), self.stamp(4)))
+
+    def test_children_without_a_key_replace_their_parents_rows(self):
+        changed, untouched = uuid.uuid4(), uuid.uuid4()
+        ContactPhone.objects.bulk_create([
+            ContactPhone(contact_id=changed, home_phone='old'),
+            ContactPhone(contact_id=changed, home_phone='old'),
+            ContactPhone(contact_id=untouched, home_phone='kept'),
+        ])
+        children = [{'contactId': changed, 'homePhone': f'new{n}'} for n in range(3)]
+        children.append({'contactId': untouched, 'homePhone': 'upstream'})
+        self.command.fetch_slots = SlotCounter()
+        api = ChildFeedApi(children, self.command.fetch_slots, page_size=2)
+        processor = ContactPhoneProcessor(logger, DataProcessor(logger))
+
+        with mock.patch.object(import_data, 'RECORDS_PER_PAGE', 2):
+            written = asyncio.run(self.command.fetch_changed_children(
+                api, processor, 'contact_phones', 'ContactPhones', self.PARENT, [changed], self.stamp(1),
+                ImportOptions(max_concurrent=1)
+            ))
+
+        self.assertEqual(written, 3)
+        # The batch overflowed onto a second page, requested from the fetch stage within its slot
+        self.assertEqual(api.requests, [(0, 1), (2, 1)])
+        self.assertEqual(
+            sorted(ContactPhone.objects.filter(contact_id=changed).values_list('home_phone', flat=True)),
+            ['new0', 'new1', 'new2']
+        )
+        self.assertEqual(
+            list(ContactPhone.objects.filter(contact_id=untouched).values_list('home_phone', flat=True)), ['kept']
+        )
+        self.assertEqual(EndpointCheckpoint.load('contact_phones').status, SyncState.STATUS_COMPLETED)
+
+
+class PageCacheTests(TransactionTestCase):
+    URL = 'https://api4.marketsharpm.com/WcfDataService.svc/ProductInterests'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = PageCache(directory.name, logger)
+
+    def product_page(self, *records):
+        return atom_feed([
+            {'id': record_id, 'priceQuoted': price, 'lastUpdate': f'2026-03-0{day}T00:00:00'}
+            for record_id, price, day in records
+        ])
+
+    def test_put_and_read_round_trip(self):
+        first, second = self.product_page((uuid.uuid4(), '1.00', 1)), self.product_page((uuid.uuid4(), '2.00', 1))
+        digest = self.cache.put(self.URL, '?$top=1000&$skip=0', 'atom', first)
+        self.cache.put(self.URL, '?$top=1000&$skip=1000', 'json', second)
+        # The same body under another request is stored once
+        self.assertEqual(self.cache.put(self.URL, '?$top=1000&$skip=2000', 'atom', first), digest)
+        self.assertEqual((self.cache.pages_written, self.cache.pages_deduplicated), (2, 1))
+
+        pages = self.cache.pages(self.URL + '/')
+        self.assertEqual(
+            [page.key for page in pages], ['?$top=1000&$skip=0', '?$top=1000&$skip=1000', '?$top=1000&$skip=2000']
+        )
+        self.assertEqual([page.response_format for page in pages], ['atom', 'json', 'atom'])
+        self.assertEqual([self.cache.read(page) for page in pages], [first, second, first])
+        self.assertEqual(self.cache.pages('https://example.invalid/Contacts'), [])
+
+    def test_fetched_pages_are_cached_under_their_request(self):
+        body = self.product_page((uuid.uuid4(), '1.00', 1))
+        api = make_api(FakeSession(200, body=body), page_cache=self.cache)
+        asyncio.run(api.get_data(self.URL, skip=1000, select='id,priceQuoted'))
+        [page] = self.cache.pages(self.URL)
+        self.assertEqual(page.key, f'?$top={RECORDS_PER_PAGE}&$skip=1000&$select=id,priceQuoted')
+        self.assertEqual(self.cache.read(page), body)
+
+    def test_replay_writes_the_latest_copy_of_each_page_in_fetch_order(self):
+        first, second = uuid.uuid4(), uuid.uuid4()
+        self.cache.put(self.URL, '?$skip=0', 'atom', self.product_page((first, '1.00', 1)))
+        self.cache.put(self.URL, '?$skip=1000', 'atom', self.product_page((second, '2.00', 1)))
+        # A later run fetched the first page again, with the row updated
+        self.cache.put(self.URL, '?$skip=0', 'atom', self.product_page((first, '1.50', 2)))
+        with open(self.cache.index_dir / 'ProductInterests.jsonl', 'a') as index:
+            index.write('{"key": "?$skip=20')
+
+        # The command configures root logging for the console; keep the test run's output as it is
+        basic_config = mock.patch.object(logging, 'basicConfig')
+        basic_config.start()
+        self.addCleanup(basic_config.stop)
+        with self.assertRaisesMessage(CommandError, '--replay needs --page-cache'):
+            call_command(Command(logger), endpoint='product_interests', replay=True)
+        with self.assertLogs(logger, 'INFO') as logs:
+            call_command(
+                Command(logger), endpoint='product_interests', replay=True, page_cache=str(self.cache.directory)
+            )
+        self.assertIn('Replaying 2 cached product_interests pages', '\n'.join(logs.output))
+        self.assertEqual(
+            dict(ProductInterest.objects.values_list('pk', 'price_quoted')),
+            {first: Decimal('1.50'), second: Decimal('2.00')}
+        )
+
+
+class ReconcileTests(TestCase):
+    def encode_all(self, codec, values):
+        keys = IdArray(codec.width)
+        for value in values:
+            keys.add(codec.encode(value))
+        keys.sort()
+        return keys
+
+    def test_missing_keys_walks_both_sides_in_order(self):
+        for is_guid, values in ((False, [-5, 0, 3, 7, 1 << 40]), (True, sorted(uuid.uuid4() for _ in range(300)))):
+            with self.subTest(is_guid=is_guid):
+                codec = IdCodec(is_guid)
+                upstream = self.encode_all(codec, values[1::2])
+                local = sorted(codec.encode(value) for value in values)
+                missing = [codec.decode(key) for key in missing_keys(local, upstream)]
+                self.assertEqual(missing, values[0::2])
+
+    def test_missing_keys_rejects_unordered_local_keys(self):
+        codec = IdCodec(False)
+        upstream = self.encode_all(codec, [1, 2])
+        with self.assertRaises(ValueError):
+            list(missing_keys([codec.encode(2), codec.encode(1)], upstream))
+
+    def make_addresses(self, count):
+        Address.objects.bulk_create([Address(contact_id=uuid.uuid4()) for _ in range(count)])
+        return [str(pk) for pk in Address.objects.values_list('pk', flat=True)]
+
+    def test_deactivates_rows_missing_upstream(self):
+        ids = self.make_addresses(10)
+        reconciliation = Reconciliation('addresses', Address, True, logger)
+        reconciliation.add_page(ids[3:])
+        missing = reconciliation.find_missing()
+        self.assertEqual(reconciliation.local_rows, 10)
+        self.assertFalse(reconciliation.too_many_missing(missing))
+        self.assertEqual(reconciliation.apply(missing, 'deactivate'), 3)
+        self.assertEqual(
+            sorted(str(pk) for pk in Address.objects.filter(is_active=False).values_list('pk', flat=True)),
+            sorted(ids[:3])
+        )
+
+    def test_guard_refuses_to_remove_most_of_the_table(self):
+        ids = self.make_addresses(10)
+        reconciliation = Reconciliation('addresses', Address, True, logger)
+        kept = int(len(ids) * (1 - MAX_MISSING_FRACTION)) - 1
+        reconciliation.add_page(ids[:kept])
+        self.assertTrue(reconciliation.too_many_missing(reconciliation.find_missing()))
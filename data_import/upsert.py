@@ -0,0 +1,109 @@
+from typing import Any, List, Optional, Sequence, Tuple
+
+from django.db import connection
+
+
+def merge_clause(db_columns: Sequence[str], pk_index: int, last_update_index: Optional[int] = None) -> str:
+    """ON CONFLICT clause that rewrites an existing row only when it changed.
+
+    The insert's target table must be aliased as target. Where the table has
+    a last_update only a newer row is written, so a stale copy of a row that
+    arrives late can't roll it back; rows without last_update on either side
+    are written when any column differs.
+    """
+    quote = connection.ops.quote_name
+    # Null-safe comparison; SQLite spells IS DISTINCT FROM as IS NOT
+    distinct = 'IS DISTINCT FROM' if connection.vendor == 'postgresql' else 'IS NOT'
+    columns = [quote(column) for column in db_columns]
+    conflict = f'ON CONFLICT ({columns[pk_index]})'
+    data_columns = [column for index, column in enumerate(columns) if index != pk_index]
+    if not data_columns:
+        return f'{conflict} DO NOTHING'
+
+    update_list = ', '.join(f'{column} = EXCLUDED.{column}' for column in data_columns)
+    row_changed = (
+        f"({', '.join(f'target.{column}' for column in data_columns)}) {distinct} "
+        f"({', '.join(f'EXCLUDED.{column}' for column in data_columns)})"
+    )
+    if last_update_index is not None:
+        last_update = columns[last_update_index]
+        changed = (
+            f'CASE WHEN EXCLUDED.{last_update} IS NULL OR target.{last_update} IS NULL THEN {row_changed} '
+            f'ELSE EXCLUDED.{last_update} > target.{last_update} END'
+        )
+    else:
+        changed = row_changed
+    return f'{conflict} DO UPDATE SET {update_list} WHERE {changed}'
+
+
+class Upserter:
+    """Writes pages into one table with a single INSERT ... ON CONFLICT per batch.
+
+    Unchanged rows are left alone by the guarded DO UPDATE and never come
+    back from RETURNING, so no stored row is read before writing. Rows must
+    be unique by key and the table must have a mapped primary key.
+    """
+
+    def __init__(
+        self,
+        model,
+        columns: Sequence[str],
+        pk_index: int,
+        last_update_index: Optional[int] = None
+    ):
+        self.model = model
+        self.pk_index = pk_index
+        quote = connection.ops.quote_name
+        meta = model._meta
+        self.fields = [meta.get_field(name) for name in columns]
+        self.pk_field = self.fields[pk_index]
+        self.table = quote(meta.db_table)
+        db_columns = [field.column for field in self.fields]
+        self.column_list = ', '.join(quote(column) for column in db_columns)
+        self.row_placeholder = f"({', '.join(['%s'] * len(db_columns))})"
+        self.merge = merge_clause(db_columns, pk_index, last_update_index)
+
+    def write(self, rows: List[Tuple[Any, ...]], batch_size: int) -> Tuple[int, int]:
+        """Upsert rows in statements of at most batch_size rows; returns (inserted, updated).
+
+        Call it inside a transaction.
+        """
+        if not rows:
+            return 0, 0
+        batch_size = min(batch_size, connection.ops.bulk_batch_size(self.fields, rows))
+        inserted = updated = 0
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                batch_inserted, batch_updated = self._write_batch(cursor, rows[start:start + batch_size])
+                inserted += batch_inserted
+                updated += batch_updated
+        return inserted, updated
+
+    def _write_batch(self, cursor, rows: List[Tuple[Any, ...]]) -> Tuple[int, int]:
+        fields = self.fields
+        params = [
+            field.get_db_prep_save(value, connection)
+            for row in rows
+            for field, value in zip(fields, row)
+        ]
+        insert = (
+            f'INSERT INTO {self.table} AS target ({self.column_list}) '
+            f"VALUES {', '.join([self.row_placeholder] * len(rows))} "
+            f'{self.merge}'
+        )
+        if connection.vendor == 'postgresql':
+            # xmax is 0 only on freshly inserted tuples; unchanged rows are not returned at all
+            cursor.execute(
+                f'WITH merged AS ({insert} RETURNING (target.xmax = 0) AS inserted) '
+                f'SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged',
+                params
+            )
+            return cursor.fetchone()
+
+        # Other backends can't tell an insert from an update in RETURNING; count the keys already stored
+        existing = self.model._default_manager.filter(
+            **{f'{self.pk_field.name}__in': [row[self.pk_index] for row in rows]}
+        ).count()
+        cursor.execute(f'{insert} RETURNING 1', params)
+        written = len(cursor.fetchall())
+        return len(rows) - existing, written - (len(rows) - existing)